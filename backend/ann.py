@@ -0,0 +1,114 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class IVFIndex:
+    """
+    転置ファイル（IVF）方式の近似最近傍インデックス（NumPy のみ）
+
+    - 正規化済み埋め込みを球面 k-means で nlist 個のクラスタに分割
+    - 検索時はクエリに近い nprobe 個のクラスタだけを内積でスコアリング
+    - nprobe を上げるほど recall↑ / latency↑（nprobe = nlist で全件探索と一致）
+    """
+
+    def __init__(self, centroids: np.ndarray, list_rows: np.ndarray, offsets: np.ndarray, list_emb: np.ndarray):
+        self.centroids = centroids  # (nlist, d)
+        self.list_rows = list_rows  # クラスタ順に並べた元の行番号
+        self.offsets = offsets  # list i の範囲 = list_rows[offsets[i]:offsets[i+1]]
+        self.list_emb = list_emb  # list_rows の順に並べ替えた埋め込み（連続領域で走査するため）
+
+    @property
+    def nlist(self) -> int:
+        return int(self.centroids.shape[0])
+
+    @classmethod
+    def build(
+        cls,
+        emb: np.ndarray,
+        nlist: Optional[int] = None,
+        n_iter: int = 10,
+        sample_size: int = 100_000,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        """emb は行ごとに L2 正規化済みであること（Catalog.emb をそのまま渡す）"""
+        n = emb.shape[0]
+        if nlist is None:
+            nlist = max(1, int(np.sqrt(n)))
+        nlist = max(1, min(nlist, n))
+
+        rng = np.random.default_rng(seed)
+        sample = emb[rng.choice(n, size=min(n, sample_size), replace=False)] if n > sample_size else emb
+        centroids = sample[rng.choice(sample.shape[0], size=nlist, replace=False)].copy()
+
+        # 球面 k-means（内積最大のクラスタへ割り当て → 重心を再正規化）
+        for _ in range(n_iter):
+            assign = _assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            norms = np.linalg.norm(sums, axis=1)
+            empty = norms == 0
+            sums[~empty] /= norms[~empty, None]
+            # 空クラスタは元の重心を維持
+            sums[empty] = centroids[empty]
+            centroids = sums
+
+        assign = _assign(emb, centroids)
+        list_rows = np.argsort(assign, kind="stable").astype(np.int64)
+        counts = np.bincount(assign, minlength=nlist)
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        return cls(
+            np.ascontiguousarray(centroids, dtype=np.float32),
+            list_rows,
+            offsets,
+            np.ascontiguousarray(emb[list_rows], dtype=np.float32),
+        )
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        nprobe: int = 8,
+        exclude: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        query（正規化済み）に近い候補を返す: (元の行番号, 類似度)
+        exclude は元の行番号に対する bool マスク（True を除外）。
+        除外後に k 件に満たなければ nprobe を倍にして探し直す。
+        返す候補は k 件以上になりうる（最終順位付けは呼び出し側）。
+        """
+        q = np.asarray(query, dtype=np.float32)
+        coarse = self.centroids @ q
+        probe_order = np.argsort(-coarse)
+        nprobe = max(1, min(nprobe, self.nlist))
+
+        while True:
+            lists = probe_order[:nprobe]
+            spans = [np.arange(self.offsets[i], self.offsets[i + 1]) for i in lists]
+            pos = np.concatenate(spans) if spans else np.empty(0, dtype=np.int64)
+            rows = self.list_rows[pos]
+            if exclude is not None:
+                keep = ~exclude[rows]
+                pos, rows = pos[keep], rows[keep]
+
+            if rows.size >= k or nprobe >= self.nlist:
+                break
+            nprobe = min(self.nlist, nprobe * 2)
+
+        sims = self.list_emb[pos] @ q
+        if rows.size > k:
+            top = np.argpartition(-sims, k - 1)[:k]
+            # k 番目と同点の候補も残す（同点は artwork_id 順で確定させるため）
+            kth = sims[top].min()
+            sel = sims >= kth
+            rows, sims = rows[sel], sims[sel]
+        return rows, sims
+
+
+def _assign(x: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    out = np.empty(x.shape[0], dtype=np.int64)
+    for s in range(0, x.shape[0], chunk):
+        out[s:s + chunk] = np.argmax(x[s:s + chunk] @ centroids.T, axis=1)
+    return out
@@ -1,14 +1,331 @@
 import os
 import json
-from typing import Any, Dict, List, Tuple
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Set, Tuple
 
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, Header, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from google.api_core import exceptions as google_exceptions
 from google.cloud import firestore, bigquery
+from pydantic import BaseModel, Field
+
+import metrics
+from cache import FRESH, MISS, STALE, ResponseCache, etag_matches, preferences_version, response_etag
+from catalog import Catalog, load_catalog_from_bigquery
+from clients import Clients
+from coalesce import Coalescer, run_stage
+from explanations import ExplanationIndex, load_explanation_index
+from profiles import ProfileStore
+from ratings import Ratings, parse_score
+from recommend import CANDIDATE_IDS, DEFAULT_SET_ID, CandidateRegistry, build_recommend1, level_counts
+from serving import ServingStore, data_version_of
+from snapshot import load_quantized, load_snapshot, open_shared, read_manifest, snapshot_version
+from state import CatalogState, table_modified_at
 
 PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT", "avid-invention-470411-u6")
 
-app = FastAPI()
+# 起動時に artwork_master の埋め込みをメモリへ載せ、recommend2 をプロセス内で計算する
+# "0" にすると従来どおり BigQuery の SQL_RECOMMEND_2 を毎回実行する
+CATALOG_IN_MEMORY = os.getenv("CATALOG_IN_MEMORY", "1") == "1"
+
+# 作品数がこの件数以上なら IVF 近似最近傍インデックスを作る（recall/latency は NLIST/NPROBE で調整）
+ANN_MIN_SIZE = int(os.getenv("ANN_MIN_SIZE", "500000"))
+ANN_NLIST = int(os.getenv("ANN_NLIST", "0")) or None  # 0: sqrt(n)
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "16"))
+
+# 全件スコアリングの 1 次パスに使う埋め込みの精度（"float32" | "float16" | "int8"）
+# 上位候補は float32 の埋め込みで再計算するので結果は変わらない
+# 量子化は再計算用の float32 を mmap から読むとき（スナップショット / EMBEDDING_SPILL_PATH）だけ有効にする
+# （どちらも無いと float32 が常駐したまま量子化した配列が増えるだけなので、警告を出して float32 のまま）
+# float16 は numpy の行列積が遅く、1 次パスが float32 の数倍遅くなる（メモリ削減専用。通常は int8 を使う）
+#   bench/bench_quantize.py --n 50000 --dim 128 --spill: float32 3.2 / float16 21.4 / int8 3.8 ms/query
+# EMBEDDING_SPILL_PATH を指定すると float32 の埋め込みをそのファイル（.npy）の mmap に逃がす
+EMBEDDING_STORE = os.getenv("EMBEDDING_STORE", "float32")
+EMBEDDING_SPILL_PATH = os.getenv("EMBEDDING_SPILL_PATH", "")
+
+# batch/export_catalog_snapshot が書き出すカタログのスナップショット
+# （{path}.versions/ 下のバージョンごとのディレクトリへのシンボリックリンク。更新はリンクの付け替え 1 回）
+# あれば mmap で読み込み、無い / 読めない場合は BigQuery の artwork_master から作る
+CATALOG_SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH", "catalog_snapshot")
+# 複数ワーカー（gunicorn -w N / uvicorn --workers N）で起動するとき用
+# スナップショットが無ければ最初のワーカーが BigQuery から作って書き出し、全ワーカーが同じファイルを mmap する
+# （埋め込みと量子化した配列はページキャッシュ上の 1 コピーを共有。ディスク / ボリューム上のパスを指定すること）
+CATALOG_SHARED = os.getenv("CATALOG_SHARED", "0") == "1"
+
+logger = logging.getLogger(__name__)
+
+# ===== BigQuery tables =====
+BQ_ARTWORK_TABLE = "avid-invention-470411-u6.fukuoka.artwork_master"
+BQ_EXPLANATION_TABLE = "avid-invention-470411-u6.murakami_work.explanation_master"
+
+# 共有クライアントのコネクション数（Firestore gRPC チャネル数 / BigQuery HTTP プール）
+FIRESTORE_CHANNELS = int(os.getenv("FIRESTORE_CHANNELS", "2"))
+BQ_HTTP_POOL_SIZE = int(os.getenv("BQ_HTTP_POOL_SIZE", "20"))
+
+# ステージごとのタイムアウト（秒）
+FIRESTORE_TIMEOUT_SEC = float(os.getenv("FIRESTORE_TIMEOUT_SEC", "5"))
+BIGQUERY_TIMEOUT_SEC = float(os.getenv("BIGQUERY_TIMEOUT_SEC", "30"))
+
+# レコメンド結果キャッシュ（件数 / fresh 秒数 / stale-while-revalidate 秒数）
+# fresh の間は Firestore を読まないので、invalidate を呼ばない直接書き込みは最大 TTL 秒遅れて反映される
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+RESPONSE_CACHE_TTL_SEC = float(os.getenv("RESPONSE_CACHE_TTL_SEC", "60"))
+RESPONSE_CACHE_STALE_SEC = float(os.getenv("RESPONSE_CACHE_STALE_SEC", "300"))
+
+# /recommend/batch: 1 回の行列積で処理するユーザー数 / Firestore の同時読み込み数
+BATCH_CHUNK_USERS = int(os.getenv("BATCH_CHUNK_USERS", "256"))
+BATCH_FIRESTORE_CONCURRENCY = int(os.getenv("BATCH_FIRESTORE_CONCURRENCY", "16"))
+
+# explanation_id 対応表の再読み込み間隔（秒, 0 で定期更新なし）
+EXPLANATION_REFRESH_SEC = float(os.getenv("EXPLANATION_REFRESH_SEC", "600"))
+
+# カタログの更新確認の間隔（秒, 0 で定期確認なし）
+# スナップショットがあれば manifest.json の version、無ければ artwork_master の更新時刻を見て、
+# 変わっていればリクエスト処理の外で読み込み直して差し替える
+CATALOG_REFRESH_SEC = float(os.getenv("CATALOG_REFRESH_SEC", "60"))
+
+# batch/precompute_recommendations が書き出す事前計算ストア（無ければ使わない）
+SERVING_DB_PATH = os.getenv("SERVING_DB_PATH", "serving.db")
+
+# recommend1?museum_id= の候補セット
+#   - カタログの org_museum_id ごとのセット（作品数 CANDIDATE_SET_MAX_SIZE 以下の美術館のみ）
+#   - CANDIDATE_SETS_PATH の JSON {"set_id": ["artwork_id", ...]}（展覧会など。任意）
+CANDIDATE_SETS_PATH = os.getenv("CANDIDATE_SETS_PATH", "candidate_sets.json")
+CANDIDATE_SET_MAX_SIZE = int(os.getenv("CANDIDATE_SET_MAX_SIZE", "2000"))
+
+# recommend2 の k の上限
+RECOMMEND2_MAX_K = int(os.getenv("RECOMMEND2_MAX_K", "100"))
+
+# 嗜好を非正規化ドキュメント 1 件（{artwork_id: score} のマップ）から読む
+# Preference.jsx / PUT /users/{id}/preferences/{aid} が preferences サブコレクションと同時に更新する
+PREFERENCE_MAP_READ = os.getenv("PREFERENCE_MAP_READ", "0") == "1"
+PREFERENCE_MAP_COLLECTION = "denormalized"
+PREFERENCE_MAP_DOC = "preferences"
+
+# PUT /users/{id}/preferences/{aid} で、preferencesUpdatedAt を読んでからコミットまでに
+# 別の書き込みが入ったときに読み直す回数（使い切ったら前提条件なしで書き、保持中のプロファイルは作り直す）
+PREFERENCE_WRITE_RETRIES = int(os.getenv("PREFERENCE_WRITE_RETRIES", "5"))
+
+# ユーザープロファイルの保持件数 / 有効秒数（期限切れは Firestore から再構築）
+# 期限内でも users/{id}.preferencesUpdatedAt が反映済みの値より新しければ再構築する
+PROFILE_MAX_USERS = int(os.getenv("PROFILE_MAX_USERS", "10000"))
+PROFILE_MAX_AGE_SEC = float(os.getenv("PROFILE_MAX_AGE_SEC", "300"))
+
+# これ以上かかったリクエストはステージ内訳付きで構造化ログに出す（ミリ秒, 0 で無効）
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+
+# lifespan で 1 回だけ作る Firestore / BigQuery クライアント
+CLIENTS: Optional[Clients] = None
+
+# メモリ上の作品カタログ + ユーザープロファイル + museum_id / 展覧会 ID ごとの候補セット
+# （読み込み失敗時は None → BigQuery にフォールバック）。更新時は丸ごと差し替えるので、
+# リクエストは最初に 1 回だけ読んだ世代を最後まで使う
+STATE: Optional[CatalogState] = None
+# カタログの読み込み直しを 1 本にする
+_CATALOG_RELOAD = asyncio.Lock()
+
+# 候補セットの作品 ID（BigQuery フォールバック用。設定ファイル分 + DEFAULT_SET_ID）
+CANDIDATE_SET_IDS: Dict[str, List[str]] = {DEFAULT_SET_ID: CANDIDATE_IDS}
+
+# (artwork_id, level, language) -> explanation_id（読み込み失敗時は None → recommend1 は BigQuery）
+EXPLANATIONS: Optional[ExplanationIndex] = None
+
+# 事前計算済みレコメンド
+SERVING: Optional[ServingStore] = None
+
+# 同一 user_id の処理中リクエストをまとめる
+COALESCER = Coalescer()
+
+RESPONSE_CACHE = ResponseCache(
+    max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+    ttl=RESPONSE_CACHE_TTL_SEC,
+    stale_ttl=RESPONSE_CACHE_STALE_SEC,
+)
+# stale-while-revalidate の再計算タスク（GC されないよう参照を保持）
+_BACKGROUND: Set[asyncio.Task] = set()
+
+
+def load_catalog(bq: Any) -> Tuple[Catalog, bool]:
+    """
+    スナップショットがあれば mmap で開き、無ければ BigQuery から読み込む（(カタログ, スナップショットか)）
+    CATALOG_SHARED のときはスナップショットが無ければ作成してから開く（全ワーカーで共有）
+    """
+    t0 = time.perf_counter()
+    if CATALOG_SHARED or os.path.isdir(CATALOG_SNAPSHOT_PATH):
+        try:
+            if CATALOG_SHARED:
+                catalog = open_shared(
+                    CATALOG_SNAPSHOT_PATH,
+                    lambda: load_catalog_from_bigquery(bq, BQ_ARTWORK_TABLE),
+                    source=BQ_ARTWORK_TABLE,
+                )
+            else:
+                catalog = load_snapshot(CATALOG_SNAPSHOT_PATH)
+            logger.info(
+                "catalog snapshot loaded: version=%s (%.1f ms)", catalog.version, (time.perf_counter() - t0) * 1000
+            )
+            return catalog, True
+        except Exception:
+            logger.exception("catalog snapshot load failed; loading from BigQuery")
+    # 更新時刻は読み込みの前に取る（読み込み中に更新されたら次の確認でもう一度読む）
+    modified = table_modified_at(bq, BQ_ARTWORK_TABLE)
+    catalog = load_catalog_from_bigquery(bq, BQ_ARTWORK_TABLE)
+    # スナップショットと同じ方法でバージョンを付ける（ETag 用。同じ内容なら全ワーカーで同じ値）
+    catalog.version = snapshot_version(catalog)
+    catalog.created_at = modified
+    logger.info("catalog loaded from BigQuery (%.1f ms)", (time.perf_counter() - t0) * 1000)
+    return catalog, False
+
+
+def build_catalog_state(bq: Any) -> CatalogState:
+    """カタログを読み込み、量子化 / ANN / プロファイル / 候補セットまで作る（起動時と更新時, スレッドで実行）"""
+    catalog, from_snapshot = load_catalog(bq)
+    logger.info("catalog loaded: %d artworks, dim=%d", len(catalog), catalog.dim)
+    if EMBEDDING_STORE != "float32":
+        if from_snapshot:
+            # スナップショットの mmap 上の埋め込みはそのまま使い、量子化した配列もスナップショットに置いて共有する
+            load_quantized(CATALOG_SNAPSHOT_PATH, catalog, EMBEDDING_STORE)
+        elif EMBEDDING_SPILL_PATH:
+            catalog.quantize(EMBEDDING_STORE, spill_path=EMBEDDING_SPILL_PATH)
+        else:
+            logger.warning(
+                "EMBEDDING_STORE=%s ignored: float32 embeddings are not memory-mapped "
+                "(set EMBEDDING_SPILL_PATH or use a catalog snapshot); using float32",
+                EMBEDDING_STORE,
+            )
+        if catalog.quant is not None:
+            logger.info("embeddings quantized: %s, %d bytes", EMBEDDING_STORE, catalog.quant.nbytes)
+    if len(catalog) >= ANN_MIN_SIZE:
+        catalog.build_ann(nlist=ANN_NLIST, nprobe=ANN_NPROBE)
+        logger.info("ann index built: nlist=%d nprobe=%d", catalog.ann.nlist, ANN_NPROBE)
+    profiles = ProfileStore(catalog, max_users=PROFILE_MAX_USERS, max_age=PROFILE_MAX_AGE_SEC)
+    extra = {k: v for k, v in CANDIDATE_SET_IDS.items() if k != DEFAULT_SET_ID}
+    candidates = CandidateRegistry.build(catalog, extra, max_size=CANDIDATE_SET_MAX_SIZE)
+    logger.info("candidate sets built: %d", len(candidates))
+    return CatalogState(catalog, profiles, candidates)
+
+
+def catalog_changed(catalog: Catalog) -> bool:
+    """読み込み済みのカタログより新しいデータがあるか（読み込まずに判定する）"""
+    if os.path.isdir(CATALOG_SNAPSHOT_PATH):
+        return read_manifest(CATALOG_SNAPSHOT_PATH)["version"] != catalog.version
+    modified = table_modified_at(CLIENTS.bigquery, BQ_ARTWORK_TABLE)
+    return modified is not None and (catalog.created_at is None or modified > catalog.created_at)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global CLIENTS, STATE, EXPLANATIONS, SERVING
+    CLIENTS = Clients(PROJECT_ID, firestore_channels=FIRESTORE_CHANNELS, bq_pool_size=BQ_HTTP_POOL_SIZE)
+
+    if os.path.exists(CANDIDATE_SETS_PATH):
+        with open(CANDIDATE_SETS_PATH, encoding="utf-8") as f:
+            CANDIDATE_SET_IDS.update({str(k): [str(a) for a in v] for k, v in json.load(f).items()})
+
+    if CATALOG_IN_MEMORY:
+        try:
+            STATE = build_catalog_state(CLIENTS.bigquery)
+        except Exception:
+            logger.exception("catalog load failed; recommend2 falls back to BigQuery")
+            STATE = None
+
+        try:
+            EXPLANATIONS = load_explanation_index(CLIENTS.bigquery, BQ_EXPLANATION_TABLE)
+            logger.info("explanation index loaded: %d rows", len(EXPLANATIONS))
+        except Exception:
+            logger.exception("explanation index load failed; recommend1 falls back to BigQuery")
+            EXPLANATIONS = None
+
+    if os.path.exists(SERVING_DB_PATH):
+        SERVING = ServingStore(SERVING_DB_PATH)
+        logger.info("serving store opened: %s (%d rows)", SERVING_DB_PATH, SERVING.count())
+
+    # コネクションの事前確立はトラフィックの受け付けを待たせないよう裏で行う
+    # カタログ / 解説をメモリから返せるなら、リクエストで使わない BigQuery のクエリジョブは投げない
+    warm_bigquery = STATE is None or EXPLANATIONS is None
+    task = asyncio.ensure_future(asyncio.to_thread(CLIENTS.warm_up, bigquery=warm_bigquery))
+    _BACKGROUND.add(task)
+    task.add_done_callback(_BACKGROUND.discard)
+
+    refreshers = []
+    if CATALOG_IN_MEMORY and EXPLANATION_REFRESH_SEC > 0:
+        refreshers.append(asyncio.create_task(_refresh_explanations_periodically()))
+    if CATALOG_IN_MEMORY and CATALOG_REFRESH_SEC > 0:
+        refreshers.append(asyncio.create_task(_refresh_catalog_periodically()))
+    yield
+    for refresher in refreshers:
+        refresher.cancel()
+    if SERVING is not None:
+        SERVING.close()
+    CLIENTS.close()
+
+
+async def refresh_explanations() -> int:
+    """explanation_master を読み直して対応表を丸ごと差し替える（内容が同じならキャッシュはそのまま）"""
+    global EXPLANATIONS
+    index = await asyncio.to_thread(load_explanation_index, CLIENTS.bigquery, BQ_EXPLANATION_TABLE)
+    if EXPLANATIONS is not None and EXPLANATIONS.version == index.version:
+        return len(index)
+    EXPLANATIONS = index
+    RESPONSE_CACHE.clear()
+    return len(index)
+
+
+async def refresh_catalog(force: bool = False) -> Dict[str, Any]:
+    """
+    カタログが更新されていれば、新しい世代を別スレッドで作って STATE を差し替える
+    処理中のリクエストは古い世代のまま完了し、古い世代は参照が無くなった時点で解放される
+    """
+    global STATE
+    async with _CATALOG_RELOAD:
+        old = STATE
+        if not force and old is not None and not await asyncio.to_thread(catalog_changed, old.catalog):
+            return {"reloaded": False, "version": old.catalog.version}
+        t0 = time.perf_counter()
+        new = await asyncio.to_thread(build_catalog_state, CLIENTS.bigquery)
+        if old is not None and new.catalog.version == old.catalog.version:
+            # version は全列の内容ハッシュ（snapshot_version）なので、一致すれば作品名 / museum_id も含めて同じ
+            # テーブルの更新時刻だけ変わった: 差し替えない（キャッシュを残す）
+            old.catalog.created_at = new.catalog.created_at
+            return {"reloaded": False, "version": old.catalog.version}
+        STATE = new
+        RESPONSE_CACHE.clear()
+        if old is not None:
+            old.retire()
+        logger.info(
+            "catalog swapped: version=%s -> %s (%d artworks, built in %.1f s)",
+            old.catalog.version if old is not None else None,
+            new.catalog.version,
+            len(new.catalog),
+            time.perf_counter() - t0,
+        )
+        return {"reloaded": True, "version": new.catalog.version, "artworks": len(new.catalog)}
+
+
+async def _refresh_catalog_periodically() -> None:
+    while True:
+        await asyncio.sleep(CATALOG_REFRESH_SEC)
+        try:
+            await refresh_catalog()
+        except Exception:
+            logger.exception("catalog refresh failed; keeping previous catalog")
+
+
+async def _refresh_explanations_periodically() -> None:
+    while True:
+        await asyncio.sleep(EXPLANATION_REFRESH_SEC)
+        try:
+            n = await refresh_explanations()
+            logger.info("explanation index refreshed: %d rows", n)
+        except Exception:
+            logger.exception("explanation index refresh failed; keeping previous index")
+
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS設定
 app.add_middleware(
@@ -23,33 +340,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
-# ===== BigQuery tables =====
-BQ_ARTWORK_TABLE = "avid-invention-470411-u6.fukuoka.artwork_master"
-BQ_EXPLANATION_TABLE = "avid-invention-470411-u6.murakami_work.explanation_master"
-
-# 対象10作品
-CANDIDATE_IDS: List[str] = [
-    "435621",
-    "435807",
-    "435844",
-    "436596",
-    "436947",
-    "437881",
-    "437903",
-]
-
 # 推薦クエリ:
 # - Firestore preferences を ratings_json で受け取る
 # - ユーザープロファイルベクトル(user_emb)を作る
-# - 「10作品のみ」を対象にコサイン類似度でスコア
-# - 10作品を rank 付け
-# - 上位3: level="3" / 中4: level="2" / 下位3: level="1"
+# - 候補セットの作品のみを対象にコサイン類似度でスコア
+# - 候補を rank 付け
+# - 上位 @top_n: level="3" / 下位 @bottom_n: level="1" / 残り: level="2"（recommend.level_counts）
 # - explanation_master から artwork_id + level 一致の explanation_id を取得
 SQL_RECOMMEND_1 = f"""
 -- @ratings_json : STRING
 -- @candidate_ids : ARRAY<STRING>
+-- @top_n : INT64
+-- @bottom_n : INT64
 
 WITH ratings AS (
   SELECT
@@ -146,8 +451,8 @@ with_level AS (
     artwork_name,
     similarity,
     CASE
-      WHEN rank <= 3 THEN "3"
-      WHEN rank >= 8 THEN "1"
+      WHEN rank <= @top_n THEN "3"
+      WHEN rank > ARRAY_LENGTH(@candidate_ids) - @bottom_n THEN "1"
       ELSE "2"
     END AS level
   FROM ranked
@@ -172,10 +477,13 @@ ORDER BY (
 """
 
 
-# 推薦クエリ（Firestoreのpreferencesを ratings_json として受け取り、ユーザベクトルを作って類似上位3件）
+# 推薦クエリ（Firestoreのpreferencesを ratings_json として受け取り、ユーザベクトルを作って類似上位 @k 件）
+# @per_museum_cap が NULL でなければ同じ美術館からは上位 @per_museum_cap 件まで
 SQL_RECOMMEND_2 = f"""
 -- @ratings_json : STRING
 -- @rated_ids : ARRAY<STRING>
+-- @k : INT64
+-- @per_museum_cap : INT64 (NULL 可)
 
 WITH ratings AS (
   SELECT
@@ -211,6 +519,7 @@ scored AS (
     c.artwork_id,
     c.artwork_name,
     c.org_museum_name,
+    c.org_museum_id,
     (
       SELECT SUM(c_vec * u_vec)
       FROM UNNEST(c.caption_embedding.result) AS c_vec WITH OFFSET i
@@ -229,6 +538,14 @@ scored AS (
     AND c.caption_embedding.result IS NOT NULL
     AND c.artwork_id NOT IN UNNEST(@rated_ids)
     AND c.org_museum_id != "555555"   -- ← 追加
+),
+
+capped AS (
+  SELECT *
+  FROM scored
+  WHERE TRUE
+  QUALIFY @per_museum_cap IS NULL
+    OR ROW_NUMBER() OVER (PARTITION BY org_museum_id ORDER BY similarity DESC, artwork_id) <= @per_museum_cap
 )
 
 SELECT
@@ -237,73 +554,230 @@ SELECT
   artwork_name,
   org_museum_name,
   similarity
-FROM scored
+FROM capped
 ORDER BY rank
-LIMIT 1;
+LIMIT @k;
 """
 
 
 
 
+def load_user_ratings_compact(user_id: str) -> Ratings:
+    """
+    Firestore から嗜好を配列表現で読む
+      - PREFERENCE_MAP_READ=1 なら非正規化ドキュメント 1 件（users/{user_id}/denormalized/preferences）
+      - 無ければ users/{user_id}/preferences/{artwork_id} を score だけに絞って読む
+    """
+    user_ref = CLIENTS.firestore().collection("users").document(user_id)
+
+    if PREFERENCE_MAP_READ:
+        snap = user_ref.collection(PREFERENCE_MAP_COLLECTION).document(PREFERENCE_MAP_DOC).get()
+        if snap.exists:
+            return Ratings.from_map((snap.to_dict() or {}).get("scores") or {})
+
+    prefs = user_ref.collection("preferences").select(["score"]).stream()
+    return Ratings.from_pairs(
+        # docIDは文字列として扱う
+        (str(snap.id), parse_score((snap.to_dict() or {}).get("score", 0)))
+        for snap in prefs
+    )
+
+
 def load_user_ratings(user_id: str) -> Tuple[List[Dict[str, Any]], List[str]]:
     """
     Firestore:
       users/{user_id}/preferences/{artwork_id}
         score: number
+    BigQuery フォールバック用に dict のリスト形式で返す
+    """
+    ratings = load_user_ratings_compact(user_id)
+    return ratings.to_dicts(), ratings.rated_ids
+
+
+def load_preferences_updated_at(user_id: str) -> float:
+    """
+    Firestore: users/{user_id}.preferencesUpdatedAt（UNIX 秒, 無ければ 0）
+    preferences サブコレクション全件ではなく親ドキュメント 1 件だけを読む
+    """
+    snap = CLIENTS.firestore().collection("users").document(user_id).get(
+        field_paths=["preferencesUpdatedAt"]
+    )
+    return _preferences_updated_at_of(snap)
+
+
+def _preferences_updated_at_of(snap: Any) -> float:
+    updated_at = (snap.to_dict() or {}).get("preferencesUpdatedAt") if snap.exists else None
+    return updated_at.timestamp() if updated_at is not None else 0.0
+
+
+async def preferences_updated_at(user_id: str) -> float:
+    """
+    load_preferences_updated_at を同じユーザーの同時リクエストで 1 回にまとめて読む
+    キーにキャッシュの世代を含めるので、PUT / invalidate の後に来たリクエストはそれ以前の読み込みを共有しない
     """
-    db = firestore.Client(project=PROJECT_ID)
-    prefs_ref = db.collection("users").document(user_id).collection("preferences")
+    key = ("preferencesUpdatedAt", user_id, RESPONSE_CACHE.generation(user_id))
+    return await COALESCER.run(
+        key,
+        lambda: run_stage("firestore.user", load_preferences_updated_at, user_id, timeout=FIRESTORE_TIMEOUT_SEC),
+    )
 
-    ratings: List[Dict[str, Any]] = []
-    rated_ids: List[str] = []
 
-    for snap in prefs_ref.stream():
-        artwork_id = str(snap.id)  # docIDは文字列として扱う
+class PreferenceIn(BaseModel):
+    score: int
+
+
+def _commit_preference(db: Any, user_ref: Any, artwork_id: str, score: int, snap: Any = None) -> List[Any]:
+    """
+    嗜好 1 件・非正規化マップ・users/{id}.preferencesUpdatedAt を 1 バッチで書く
+    snap（事前に読んだ users/{id}）を渡すと、それ以降にユーザードキュメントが更新されていればバッチ全体が失敗する
+    （FailedPrecondition / AlreadyExists）
+    """
+    batch = db.batch()
+    batch.set(
+        user_ref.collection("preferences").document(artwork_id),
+        {"score": score, "updatedAt": firestore.SERVER_TIMESTAMP},
+    )
+    # 非正規化した嗜好マップも同じバッチで更新する
+    batch.set(
+        user_ref.collection(PREFERENCE_MAP_COLLECTION).document(PREFERENCE_MAP_DOC),
+        {"scores": {artwork_id: score}, "updatedAt": firestore.SERVER_TIMESTAMP},
+        merge=True,
+    )
+    # 事前計算ストアの鮮度判定に使う（Preference.jsx と同じフィールド）
+    fields = {"preferencesUpdatedAt": firestore.SERVER_TIMESTAMP}
+    if snap is None:
+        batch.set(user_ref, fields, merge=True)
+    elif snap.exists:
+        batch.update(user_ref, fields, option=db.write_option(last_update_time=snap.update_time))
+    else:
+        batch.create(user_ref, fields)
+    return batch.commit()
 
-        score_raw = (snap.to_dict() or {}).get("score", 0)
+
+@app.put("/users/{user_id}/preferences/{artwork_id}")
+def put_preference(user_id: str, artwork_id: str, body: PreferenceIn) -> Dict[str, Any]:
+    """
+    嗜好 1 件を Firestore に書き込み、保持中のプロファイルへ差分反映する（O(d)）
+    書き込み直前の preferencesUpdatedAt は、コミットまで変わっていないことを update_time の前提条件で保証する
+    （間にフロントの直接書き込みなどが入ると、読んだ値が古いまま差分反映して取りこぼすため）
+    """
+    db = CLIENTS.firestore()
+    user_ref = db.collection("users").document(user_id)
+    # 保持中のプロファイルが他の書き込みを取りこぼしていないかの判定用（None: 分からない）
+    previous: Optional[float] = None
+    for _ in range(PREFERENCE_WRITE_RETRIES):
+        snap = user_ref.get(field_paths=["preferencesUpdatedAt"])
         try:
-            score = int(score_raw)
-        except (ValueError, TypeError):
-            score = 0
+            results = _commit_preference(db, user_ref, artwork_id, body.score, snap)
+        except (google_exceptions.FailedPrecondition, google_exceptions.Conflict):
+            continue
+        previous = _preferences_updated_at_of(snap)
+        break
+    else:
+        logger.warning("preference write for %s kept conflicting; writing without precondition", user_id)
+        results = _commit_preference(db, user_ref, artwork_id, body.score)
 
-        ratings.append({"artwork_id": artwork_id, "score": score})
-        rated_ids.append(artwork_id)
+    state = STATE
+    if state is not None:
+        # SERVER_TIMESTAMP はコミット時刻になるので、それを反映済みの preferencesUpdatedAt とする
+        committed = max((r.update_time.timestamp() for r in results or ()), default=None)
+        if committed is None or previous is None:
+            state.profiles.invalidate(user_id)
+        else:
+            state.profiles.set_score(user_id, artwork_id, body.score, updated_at=committed, previous=previous)
+    RESPONSE_CACHE.invalidate_user(user_id)
 
-    return ratings, rated_ids
+    return {"user_id": user_id, "artwork_id": artwork_id, "score": body.score}
 
 
-@app.get("/recommend1")
-def recommend1(user_id: str = Query(default="user1")) -> Dict[str, Any]:
-    # 1) Firestoreから嗜好取得
-    ratings, rated_ids = load_user_ratings(user_id)
-    if not ratings:
-        return {"user_id": user_id, "recommendations": [], "warning": "no preferences"}
+@app.post("/admin/explanations/refresh")
+async def trigger_explanation_refresh() -> Dict[str, Any]:
+    """バッチで explanation_master を更新した後に呼ぶ"""
+    return {"explanations": await refresh_explanations()}
+
+
+@app.post("/admin/catalog/refresh")
+async def trigger_catalog_refresh(force: bool = Query(default=False)) -> Dict[str, Any]:
+    """スナップショット / artwork_master を更新した後に呼ぶ（定期確認を待たずに差し替える）"""
+    if not CATALOG_IN_MEMORY:
+        raise HTTPException(status_code=409, detail="CATALOG_IN_MEMORY is disabled")
+    return await refresh_catalog(force=force)
+
+
+@app.get("/healthz")
+def healthz() -> Dict[str, Any]:
+    return {
+        "clients": CLIENTS.health() if CLIENTS is not None else None,
+        "catalog_size": len(STATE.catalog) if STATE is not None else None,
+        "catalog_version": STATE.catalog.version if STATE is not None else None,
+        "explanations": len(EXPLANATIONS) if EXPLANATIONS is not None else None,
+        "response_cache": RESPONSE_CACHE.stats(),
+        "coalesced_requests": COALESCER.coalesced,
+    }
 
-    # 2) BigQueryで「10作品のみ」を対象にランキングし、level付け＋explanation_id取得
-    bq = bigquery.Client(project=PROJECT_ID)
+
+@app.get("/metrics")
+def prometheus_metrics() -> PlainTextResponse:
+    """ステージ別レイテンシ / BigQuery のバイト数・slot-ms（Prometheus text format）"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+async def get_user_profile(state: CatalogState, user_id: str, updated_at: Optional[float] = None):
+    """
+    ProfileStore から取得し、無い / preferencesUpdatedAt より古ければ load_user_ratings で全件構築する
+    updated_at を読んでいなければここで読む（親ドキュメント 1 件）
+    """
+    if updated_at is None:
+        updated_at = await preferences_updated_at(user_id)
+    profile = state.profiles.get(user_id, updated_at)
+    if profile is None:
+        ratings = await run_stage(
+            "firestore.preferences", load_user_ratings_compact, user_id, timeout=FIRESTORE_TIMEOUT_SEC
+        )
+        with metrics.stage("profile.rebuild"):
+            profile = state.profiles.rebuild(user_id, ratings, updated_at)
+    return profile
+
+
+def recommend1_bigquery(
+    user_id: str,
+    ratings: List[Dict[str, Any]],
+    rated_ids: List[str],
+    candidate_ids: List[str] = CANDIDATE_IDS,
+) -> Dict[str, Any]:
+    # BigQueryで候補作品のみを対象にランキングし、level付け＋explanation_id取得
+    bq = CLIENTS.bigquery
     ratings_json = json.dumps(ratings, ensure_ascii=False)
+    top_n, bottom_n = level_counts(len(candidate_ids))
 
     job_config = bigquery.QueryJobConfig(
         query_parameters=[
             bigquery.ScalarQueryParameter("ratings_json", "STRING", ratings_json),
             bigquery.ArrayQueryParameter("rated_ids", "STRING", rated_ids),
-            bigquery.ArrayQueryParameter("candidate_ids", "STRING", CANDIDATE_IDS),
+            bigquery.ArrayQueryParameter("candidate_ids", "STRING", candidate_ids),
+            bigquery.ScalarQueryParameter("top_n", "INT64", top_n),
+            bigquery.ScalarQueryParameter("bottom_n", "INT64", bottom_n),
         ]
     )
 
-    rows = bq.query(SQL_RECOMMEND_1, job_config=job_config).result()
+    # ジョブの投入〜完了待ち（キュー待ちを含む）と、結果の読み出しを分けて計測する
+    with metrics.stage("bigquery.job"):
+        job = bq.query(SQL_RECOMMEND_1, job_config=job_config)
+        rows = job.result()
+    metrics.record_bigquery_job(job)
 
     recs: List[Dict[str, Any]] = []
-    for r in rows:
-        recs.append(
-            {
-                "artwork_id": r["artwork_id"],
-                "artwork_name": r["artwork_name"], 
-                "similarity": float(r["similarity"]) if r["similarity"] is not None else None, 
-                "level": r["level"], # "1" / "2" / "3"
-                "explanation_id": r["explanation_id"],  # 見つからない場合は None
-            }
-        )
+    with metrics.stage("bigquery.rows"):
+        for r in rows:
+            recs.append(
+                {
+                    "artwork_id": r["artwork_id"],
+                    "artwork_name": r["artwork_name"], 
+                    "similarity": float(r["similarity"]) if r["similarity"] is not None else None, 
+                    "level": r["level"], # "1" / "2" / "3"
+                    "explanation_id": r["explanation_id"],  # 見つからない場合は None
+                }
+            )
 
     return {
         "user_id": user_id,
@@ -312,36 +786,372 @@ def recommend1(user_id: str = Query(default="user1")) -> Dict[str, Any]:
     }
 
 
-@app.get("/recommend2")
-def recommend2(user_id: str = Query(default="user1")) -> Dict[str, Any]:
-    # 1) Firestoreから嗜好取得
-    ratings, rated_ids = load_user_ratings(user_id)
-    if not ratings:
-        return {"user_id": user_id, "recommendations": [], "warning": "no preferences"}
-
-    # 2) BigQueryで類似上位3件
-    bq = bigquery.Client(project=PROJECT_ID)
+def recommend2_bigquery(
+    user_id: str,
+    ratings: List[Dict[str, Any]],
+    rated_ids: List[str],
+    k: int = 1,
+    per_museum_cap: Optional[int] = None,
+) -> Dict[str, Any]:
+    # BigQueryで類似上位 k 件
+    bq = CLIENTS.bigquery
     ratings_json = json.dumps(ratings, ensure_ascii=False)
 
     job_config = bigquery.QueryJobConfig(
         query_parameters=[
             bigquery.ScalarQueryParameter("ratings_json", "STRING", ratings_json),
             bigquery.ArrayQueryParameter("rated_ids", "STRING", rated_ids),
+            bigquery.ScalarQueryParameter("k", "INT64", k),
+            bigquery.ScalarQueryParameter("per_museum_cap", "INT64", per_museum_cap),
         ]
     )
 
-    rows = bq.query(SQL_RECOMMEND_2, job_config=job_config).result()
+    with metrics.stage("bigquery.job"):
+        job = bq.query(SQL_RECOMMEND_2, job_config=job_config)
+        rows = job.result()
+    metrics.record_bigquery_job(job)
 
     recs: List[Dict[str, Any]] = []
-    for r in rows:
-        recs.append(
-            {
-                "rank": int(r["rank"]),
-                "artwork_id": r["artwork_id"],      # STRING
-                "artwork_name": r["artwork_name"],  # STRING
-                "museum_name": r["org_museum_name"],      # STRING
-                "similarity": float(r["similarity"]) if r["similarity"] is not None else None,
-            }
-        )
+    with metrics.stage("bigquery.rows"):
+        for r in rows:
+            recs.append(
+                {
+                    "rank": int(r["rank"]),
+                    "artwork_id": r["artwork_id"],      # STRING
+                    "artwork_name": r["artwork_name"],  # STRING
+                    "museum_name": r["org_museum_name"],      # STRING
+                    "similarity": float(r["similarity"]) if r["similarity"] is not None else None,
+                }
+            )
 
     return {"user_id": user_id, "recommendations": recs}
+
+
+def candidate_set_ids(state: Optional[CatalogState], set_id: str) -> List[str]:
+    """候補セットの作品 ID（未知のセットは 404）"""
+    if state is not None:
+        candidates = state.candidates.get(set_id)
+        if candidates is not None:
+            return candidates.artwork_ids
+    elif set_id in CANDIDATE_SET_IDS:
+        return CANDIDATE_SET_IDS[set_id]
+    raise HTTPException(status_code=404, detail=f"unknown museum_id: {set_id}")
+
+
+async def _recommend1(
+    state: Optional[CatalogState],
+    user_id: str,
+    set_id: str = DEFAULT_SET_ID,
+    updated_at: Optional[float] = None,
+) -> Tuple[Dict[str, Any], str]:
+    candidate_ids = candidate_set_ids(state, set_id)
+    explanations = EXPLANATIONS
+    if state is not None and explanations is not None:
+        # メモリ上でランキング → level 付け → explanation_id 対応表を引く（JOIN 不要）
+        profile = await get_user_profile(state, user_id, updated_at)
+        version = preferences_version(profile.scores.items())
+        if not profile.scores:
+            return {"user_id": user_id, "recommendations": [], "warning": "no preferences"}, version
+
+        with metrics.stage("score"):
+            recs = build_recommend1(state.catalog, explanations, profile.vector(), state.candidates.get(set_id))
+        return {"user_id": user_id, "recommendations": recs}, version
+
+    # 1) Firestoreから嗜好取得
+    ratings, rated_ids = await run_stage(
+        "firestore.preferences", load_user_ratings, user_id, timeout=FIRESTORE_TIMEOUT_SEC
+    )
+    version = preferences_version((r["artwork_id"], r["score"]) for r in ratings)
+    if not ratings:
+        return {"user_id": user_id, "recommendations": [], "warning": "no preferences"}, version
+
+    # 2) BigQueryでランキング
+    result = await run_stage(
+        "bigquery.recommend1",
+        recommend1_bigquery,
+        user_id,
+        ratings,
+        rated_ids,
+        candidate_ids,
+        timeout=BIGQUERY_TIMEOUT_SEC,
+    )
+    return result, version
+
+
+async def _recommend2(
+    state: Optional[CatalogState],
+    user_id: str,
+    k: int = 1,
+    per_museum_cap: Optional[int] = None,
+    updated_at: Optional[float] = None,
+) -> Tuple[Dict[str, Any], str]:
+    # 0) メモリ上のカタログがあれば、保持中のプロファイルで計算（cold のときだけ Firestore を読む）
+    if state is not None:
+        profile = await get_user_profile(state, user_id, updated_at)
+        version = preferences_version(profile.scores.items())
+        if not profile.scores:
+            return {"user_id": user_id, "recommendations": [], "warning": "no preferences"}, version
+        with metrics.stage("score"):
+            recs = state.catalog.recommend_profile(profile.vector(), profile.rated_ids, k, per_museum_cap)
+        return {"user_id": user_id, "recommendations": recs}, version
+
+    # 1) Firestoreから嗜好取得
+    ratings, rated_ids = await run_stage(
+        "firestore.preferences", load_user_ratings, user_id, timeout=FIRESTORE_TIMEOUT_SEC
+    )
+    version = preferences_version((r["artwork_id"], r["score"]) for r in ratings)
+    if not ratings:
+        return {"user_id": user_id, "recommendations": [], "warning": "no preferences"}, version
+
+    # 2) BigQueryで類似上位
+    result = await run_stage(
+        "bigquery.recommend2",
+        recommend2_bigquery,
+        user_id,
+        ratings,
+        rated_ids,
+        k,
+        per_museum_cap,
+        timeout=BIGQUERY_TIMEOUT_SEC,
+    )
+    return result, version
+
+
+async def _serve_precomputed(
+    state: Optional[CatalogState], endpoint: str, user_id: str, updated_at: float
+) -> Optional[Tuple[Dict[str, Any], str]]:
+    """
+    事前計算が最終嗜好更新より新しく、読み込み中のカタログ / 解説と同じデータで計算されていれば
+    その結果を返す（古い / 無ければ None）
+    データのバージョンが分からない構成（カタログ / 解説をメモリに載せていない）ではカタログ作成時刻で判定する
+    """
+    if SERVING is None:
+        return None
+    with metrics.stage("serving.get"):
+        entry = await asyncio.to_thread(SERVING.get, endpoint, user_id)
+    if entry is None:
+        return None
+    expected = data_version(state, endpoint)
+    if expected is not None:
+        if entry.data_version != expected:
+            return None
+    elif state is not None and state.catalog.created_at is not None and entry.computed_at < state.catalog.created_at:
+        return None
+    if updated_at > entry.computed_at:
+        return None
+    return entry.payload, entry.version
+
+
+async def _refresh(
+    state: Optional[CatalogState], endpoint: str, user_id: str, compute, updated_at: float
+) -> Tuple[Dict[str, Any], str]:
+    """
+    再計算してキャッシュに保存する（同じキー・同じカタログ世代・同じ嗜好更新時刻の計算は 1 本にまとめる）
+    計算中にカタログが差し替わった場合、古い世代の結果は呼び出し元には返すがキャッシュには残さない
+    updated_at は計算前に読んだ preferencesUpdatedAt（計算中に PUT / invalidate があれば結果は保存しない。
+    invalidate を呼ばない直接書き込みは TTL 後の再検証で検出する）
+    """
+
+    async def run() -> Tuple[Dict[str, Any], str]:
+        generation = RESPONSE_CACHE.generation(user_id)
+        served = await _serve_precomputed(state, endpoint, user_id, updated_at)
+        result, version = served if served is not None else await compute(state, user_id, updated_at=updated_at)
+        if state is STATE:
+            RESPONSE_CACHE.put((endpoint, user_id), result, version, generation, updated_at)
+        return result, version
+
+    key = (endpoint, user_id, state.generation if state is not None else 0, updated_at)
+    return await COALESCER.run(key, run)
+
+
+def json_response(result: Dict[str, Any]) -> JSONResponse:
+    # シリアライズもステージとして計測するため、FastAPI に任せずここで JSON にする
+    with metrics.stage("serialize"):
+        return JSONResponse(result)
+
+
+def data_version(state: Optional[CatalogState], endpoint: str) -> Optional[str]:
+    """
+    結果が依存するサーバー側データのバージョン（メモリ上のカタログ / 解説の対応表）
+    カタログ側は ID / 作品名 / 美術館名 / museum_id / 埋め込みすべての内容ハッシュなので、
+    名前や museum_id だけが変わっても ETag は変わる
+    BigQuery で毎回計算する構成ではテーブルの更新を検知できないので None（ETag を付けない）
+    """
+    if state is None or state.catalog.version is None:
+        return None
+    if endpoint.startswith("recommend1"):
+        explanations = EXPLANATIONS
+        return data_version_of(state.catalog.version, explanations.version) if explanations is not None else None
+    return data_version_of(state.catalog.version)
+
+
+async def conditional_recommend(
+    endpoint: str, user_id: str, compute, if_none_match: Optional[str]
+) -> Response:
+    """
+    ETag 付きで返す。If-None-Match が現在の ETag と一致すればスコアリングせずに 304
+    ETag = エンドポイント（候補セット / k / cap を含む）+ preferencesUpdatedAt + データバージョン
+
+    - fresh なヒット: Firestore を読まず、エントリの計算時の preferencesUpdatedAt で ETag を作る
+      （嗜好の変更は PUT / invalidate でキャッシュごと破棄されるので、残っているエントリは最新として扱う）
+    - miss / stale: preferencesUpdatedAt を 1 回だけ読み（同時リクエストで共有）、ETag と計算の両方に同じ値を使う
+      stale のエントリはそれより前に計算されていれば返さない（stale-while-revalidate の再検証）
+    """
+    state = STATE
+    data = data_version(state, endpoint)
+    headers = {"Cache-Control": "private, no-cache"}
+    key = (endpoint, user_id)
+    entry, status = RESPONSE_CACHE.lookup(key)
+    if status == FRESH:
+        updated_at = entry.updated_at
+    else:
+        # フロントは Firestore に直接書くので、嗜好の更新は親ドキュメント 1 件の更新時刻で確かめる
+        # （同じユーザーの同時リクエストは読み込みも計算も 1 回にまとめる）
+        updated_at = await preferences_updated_at(user_id)
+        if status == STALE and RESPONSE_CACHE.discard_outdated(key, entry, updated_at):
+            entry, status = None, MISS
+    metrics.annotate(cache=status)
+
+    etag = response_etag(endpoint, repr(updated_at), data) if data is not None else None
+    if etag is not None and etag_matches(if_none_match, etag):
+        metrics.annotate(cache="not_modified")
+        return Response(status_code=304, headers=dict(headers, ETag=etag))
+
+    if entry is None:
+        result, _ = await _refresh(state, endpoint, user_id, compute, updated_at)
+    else:
+        result = entry.value
+        if status == STALE:
+            # stale-while-revalidate: 古い結果を返しつつ裏で再計算
+            task = asyncio.ensure_future(_refresh(state, endpoint, user_id, compute, updated_at))
+            _BACKGROUND.add(task)
+            task.add_done_callback(_BACKGROUND.discard)
+    response = json_response(result)
+    if etag is not None:
+        response.headers.update(dict(headers, ETag=etag))
+    return response
+
+
+@app.get("/recommend1")
+async def recommend1(
+    user_id: str = Query(default="user1"),
+    museum_id: Optional[str] = Query(default=None),
+    if_none_match: Optional[str] = Header(default=None),
+) -> Response:
+    # キャッシュ → 無ければ計算（同じ user_id の処理中リクエストがあれば結果を共有する）
+    # museum_id 指定時はその美術館 / 展覧会の候補セットでランキングする（キャッシュも別キー）
+    with metrics.request("recommend1", user_id, slow_ms=SLOW_REQUEST_MS):
+        if museum_id is None:
+            return await conditional_recommend("recommend1", user_id, _recommend1, if_none_match)
+        candidate_set_ids(STATE, museum_id)
+
+        async def compute(
+            state: Optional[CatalogState], uid: str, updated_at: Optional[float] = None
+        ) -> Tuple[Dict[str, Any], str]:
+            result, version = await _recommend1(state, uid, museum_id, updated_at)
+            return dict(result, museum_id=museum_id), version
+
+        return await conditional_recommend(f"recommend1@{museum_id}", user_id, compute, if_none_match)
+
+
+@app.get("/recommend2")
+async def recommend2(
+    user_id: str = Query(default="user1"),
+    k: int = Query(default=1, ge=1, le=RECOMMEND2_MAX_K),
+    per_museum_cap: Optional[int] = Query(default=None, ge=1),
+    if_none_match: Optional[str] = Header(default=None),
+) -> Response:
+    # k / per_museum_cap が既定値以外のときは別キーでキャッシュする（事前計算は既定値のみ）
+    with metrics.request("recommend2", user_id, slow_ms=SLOW_REQUEST_MS):
+        if k == 1 and per_museum_cap is None:
+            return await conditional_recommend("recommend2", user_id, _recommend2, if_none_match)
+
+        async def compute(
+            state: Optional[CatalogState], uid: str, updated_at: Optional[float] = None
+        ) -> Tuple[Dict[str, Any], str]:
+            return await _recommend2(state, uid, k, per_museum_cap, updated_at)
+
+        endpoint = f"recommend2@k={k},cap={per_museum_cap}"
+        return await conditional_recommend(endpoint, user_id, compute, if_none_match)
+
+
+@app.post("/users/{user_id}/preferences/invalidate")
+def invalidate_preferences(user_id: str) -> Dict[str, Any]:
+    """
+    フロントエンドが Firestore に直接嗜好を書き込んだ後に呼ぶ
+    キャッシュ済みのレコメンドと保持中のプロファイルを破棄する
+    """
+    dropped = RESPONSE_CACHE.invalidate_user(user_id)
+    state = STATE
+    if state is not None:
+        state.profiles.invalidate(user_id)
+    return {"user_id": user_id, "invalidated": dropped}
+
+
+class BatchRecommendIn(BaseModel):
+    user_ids: List[str]
+    k: int = Field(default=1, ge=1, le=RECOMMEND2_MAX_K)
+    per_museum_cap: Optional[int] = Field(default=None, ge=1)
+
+
+async def _batch_chunk(
+    chunk: List[str], sem: asyncio.Semaphore, k: int = 1, per_museum_cap: Optional[int] = None
+) -> List[str]:
+    """
+    1) 未ロードのユーザーの嗜好を並行読み込み
+    2) users × artworks の行列積でまとめてスコアリング
+    して、1 ユーザー 1 行の NDJSON を入力順に返す（各行は /recommend2 と同じ内容）
+    """
+    state = STATE
+    if state is None:
+        # カタログ未ロード時は 1 ユーザーずつ BigQuery で計算
+        lines = []
+        for user_id in chunk:
+            result, _ = await _recommend2(None, user_id, k, per_museum_cap)
+            lines.append(json.dumps(result, ensure_ascii=False) + "\n")
+        return lines
+
+    async def load(user_id: str):
+        async with sem:
+            return await get_user_profile(state, user_id)
+
+    with metrics.stage("batch.load"):
+        profiles = await asyncio.gather(*(load(u) for u in chunk))
+    with metrics.stage("score"):
+        recs = await asyncio.to_thread(
+            state.catalog.recommend_profiles,
+            [p.vector() for p in profiles],
+            [p.rated_ids for p in profiles],
+            k,
+            per_museum_cap=per_museum_cap,
+        )
+    lines = []
+    with metrics.stage("serialize"):
+        for user_id, profile, r in zip(chunk, profiles, recs):
+            if not profile.scores:
+                result = {"user_id": user_id, "recommendations": [], "warning": "no preferences"}
+            else:
+                result = {"user_id": user_id, "recommendations": r}
+            lines.append(json.dumps(result, ensure_ascii=False) + "\n")
+    return lines
+
+
+async def _batch_lines(user_ids: List[str], k: int = 1, per_museum_cap: Optional[int] = None):
+    """BATCH_CHUNK_USERS 人ずつ計算して返す（metrics の計測単位もチャンク）"""
+    sem = asyncio.Semaphore(BATCH_FIRESTORE_CONCURRENCY)
+    for s in range(0, len(user_ids), BATCH_CHUNK_USERS):
+        chunk = user_ids[s:s + BATCH_CHUNK_USERS]
+        # yield をまたいでコンテキストを持ち越さないよう、計測はチャンクの計算だけを囲む
+        with metrics.request("recommend_batch", slow_ms=SLOW_REQUEST_MS) as req:
+            req.fields["users"] = len(chunk)
+            lines = await _batch_chunk(chunk, sem, k, per_museum_cap)
+        for line in lines:
+            yield line
+
+
+@app.post("/recommend/batch")
+async def recommend_batch(body: BatchRecommendIn) -> StreamingResponse:
+    """複数ユーザーの recommend2 を一括計算し、NDJSON でストリーミング返却する"""
+    return StreamingResponse(
+        _batch_lines(body.user_ids, body.k, body.per_museum_cap), media_type="application/x-ndjson"
+    )
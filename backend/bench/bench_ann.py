@@ -0,0 +1,83 @@
+"""
+IVF 近似最近傍インデックスのオフラインベンチマーク
+
+合成埋め込み（クラスタ構造あり）に対して、全件探索（Catalog.recommend）と
+IVF 探索の recall@k / 1 クエリあたりの latency を nprobe ごとに比較する。
+
+  python bench/bench_ann.py --n 1000000 --dim 768 --nprobe 1 4 16 64
+"""
+import argparse
+import os
+import sys
+import time
+from typing import List
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from catalog import Catalog  # noqa: E402
+
+
+def synthetic_catalog(n: int, dim: int, n_topics: int, seed: int) -> Catalog:
+    """トピック中心 + ノイズの合成埋め込み。museum_id は 20 館に振り分け、一部を 555555 にする"""
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(n_topics, dim)).astype(np.float32)
+    emb = topics[rng.integers(0, n_topics, size=n)] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+    ids = [f"{i:07d}" for i in range(n)]
+    museum_ids = [("555555" if i % 20 == 0 else str(i % 20)) for i in range(n)]
+    return Catalog(ids, ids, museum_ids, museum_ids, emb)
+
+
+def synthetic_ratings(catalog: Catalog, n_ratings: int, rng: np.random.Generator) -> List[dict]:
+    rows = rng.choice(len(catalog), size=n_ratings, replace=False)
+    return [{"artwork_id": catalog.artwork_ids[i], "score": int(rng.integers(1, 101))} for i in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--ratings", type=int, default=20)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    catalog = synthetic_catalog(args.n, args.dim, args.topics, args.seed)
+    users = [synthetic_ratings(catalog, args.ratings, rng) for _ in range(args.queries)]
+
+    # 正解（全件探索）
+    t0 = time.perf_counter()
+    exact = [
+        {r["artwork_id"] for r in catalog.recommend(u, [x["artwork_id"] for x in u], args.k)}
+        for u in users
+    ]
+    exact_ms = (time.perf_counter() - t0) * 1000 / len(users)
+
+    t0 = time.perf_counter()
+    catalog.build_ann(nlist=args.nlist or None)
+    build_s = time.perf_counter() - t0
+
+    print(f"n={args.n} dim={args.dim} k={args.k} nlist={catalog.ann.nlist} build={build_s:.1f}s")
+    print(f"{'method':<12}{'recall@k':>10}{'ms/query':>10}")
+    print(f"{'exact':<12}{1.0:>10.4f}{exact_ms:>10.3f}")
+
+    for nprobe in args.nprobe:
+        catalog.ann_nprobe = nprobe
+        hits = 0
+        t0 = time.perf_counter()
+        results = [catalog.recommend(u, [x["artwork_id"] for x in u], args.k) for u in users]
+        ms = (time.perf_counter() - t0) * 1000 / len(users)
+        for got, want in zip(results, exact):
+            hits += len({r["artwork_id"] for r in got} & want)
+        recall = hits / sum(len(w) for w in exact)
+        print(f"{'nprobe=' + str(nprobe):<12}{recall:>10.4f}{ms:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+レスポンスキャッシュの Firestore 読み込み回数の確認（不一致があれば AssertionError）+ ヒット時のレイテンシ
+
+  hit        : fresh なヒットは Firestore を 1 回も読まない（ETag 付きの条件付きリクエストも同じ）
+  coalesce   : キャッシュが空のとき同じユーザーへ同時に来たリクエストは、preferencesUpdatedAt の読み込みも
+               嗜好の読み込みも 1 回ずつ
+  revalidate : TTL が切れたエントリは preferencesUpdatedAt を読み直し、
+               invalidate を呼ばない直接書き込みがあれば古い結果を返さない
+
+  python bench/bench_cache.py --firestore-ms 20 --requests 50 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import Any
+
+import numpy as np
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_freshness import serve, top_ids  # noqa: E402
+
+
+def firestore_calls(client: Any) -> int:
+    samples = client.recorder.samples
+    return len(samples.get("firestore.get", [])) + len(samples.get("firestore.stream", []))
+
+
+async def check_hit(app_module: Any, firestore_ms: float, requests: int) -> None:
+    from fakes import SyntheticData
+
+    data = SyntheticData(5, 20, 500, 16)
+    async with serve(app_module, data, firestore_ms) as client:
+        for endpoint in ("recommend1", "recommend2"):
+            first = await client.get(f"/{endpoint}", params={"user_id": "user1"})
+            etag = first.headers.get("etag")
+            client.recorder.reset()
+
+            latencies = []
+            for i in range(requests):
+                # 半分は If-None-Match 付き（304）
+                headers = {"If-None-Match": etag} if i % 2 else {}
+                t0 = time.perf_counter()
+                res = await client.get(f"/{endpoint}", params={"user_id": "user1"}, headers=headers)
+                latencies.append(time.perf_counter() - t0)
+                assert res.status_code == (304 if i % 2 else 200), res.status_code
+                assert res.headers.get("etag") == etag
+            calls = firestore_calls(client)
+            assert calls == 0, f"{endpoint}: {requests} 回のヒットで Firestore を {calls} 回読んだ"
+            p50 = float(np.percentile(np.asarray(latencies) * 1000, 50))
+            print(f"hit: ok ({endpoint}: {requests} hits, 0 Firestore calls, p50 {p50:.2f} ms, firestore {firestore_ms:g} ms)")
+
+
+async def check_coalesce(app_module: Any, firestore_ms: float, concurrency: int) -> None:
+    from fakes import SyntheticData
+
+    data = SyntheticData(5, 20, 500, 16)
+    async with serve(app_module, data, firestore_ms) as client:
+        for endpoint in ("recommend1", "recommend2"):
+            app_module.RESPONSE_CACHE.clear()
+            app_module.STATE.profiles.invalidate("user1")
+            client.recorder.reset()
+            responses = await asyncio.gather(
+                *(client.get(f"/{endpoint}", params={"user_id": "user1"}) for _ in range(concurrency))
+            )
+            assert all(r.status_code == 200 for r in responses)
+            assert len({r.headers.get("etag") for r in responses}) == 1
+            gets = len(client.recorder.samples["firestore.get"])
+            streams = len(client.recorder.samples["firestore.stream"])
+            assert (gets, streams) == (1, 1), f"{endpoint}: {concurrency} 並列で get {gets} / stream {streams} 回"
+            print(f"coalesce: ok ({endpoint}: {concurrency} concurrent misses, 1 Firestore get + 1 stream)")
+
+
+async def check_revalidate(app_module: Any) -> None:
+    from fakes import SyntheticData
+
+    data = SyntheticData(5, 20, 500, 16)
+    params = {"user_id": "user1", "k": 5}
+    async with serve(app_module, data) as client:
+        before = (await client.get("/recommend2", params=params)).json()
+
+        # フロントが invalidate を呼ばずに Firestore へ直接書いた（上位 1 件を最低評価に）
+        top = top_ids(before)[0]
+        data.preferences["user1"][top] = 1
+        data.updated_at["user1"] = time.time()
+        ttl = app_module.RESPONSE_CACHE.ttl
+        app_module.RESPONSE_CACHE.ttl = -1  # 以降のエントリはすべて stale
+        try:
+            client.recorder.reset()
+            after = (await client.get("/recommend2", params=params)).json()
+        finally:
+            app_module.RESPONSE_CACHE.ttl = ttl
+        assert top_ids(after) != top_ids(before), "直接書き込み前の stale な結果が返った"
+        assert len(client.recorder.samples["firestore.get"]) >= 1
+    print("revalidate: ok (expired entry rechecks preferencesUpdatedAt and drops outdated results)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--firestore-ms", type=float, default=20.0, help="Firestore 呼び出しごとの遅延")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    # app の import 前に設定する（カタログは BigQuery から読み、定期更新はしない）
+    os.environ["CATALOG_IN_MEMORY"] = "1"
+    os.environ["CATALOG_SNAPSHOT_PATH"] = os.path.join(BACKEND_DIR, ".bench-no-snapshot")
+    os.environ["SERVING_DB_PATH"] = os.path.join(BACKEND_DIR, ".bench-no-serving.db")
+    os.environ["EXPLANATION_REFRESH_SEC"] = "0"
+    os.environ["CATALOG_REFRESH_SEC"] = "0"
+    import app as app_module
+
+    asyncio.run(check_hit(app_module, args.firestore_ms, args.requests))
+    asyncio.run(check_coalesce(app_module, args.firestore_ms, args.concurrency))
+    asyncio.run(check_revalidate(app_module))
+
+
+if __name__ == "__main__":
+    main()
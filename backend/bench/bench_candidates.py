@@ -0,0 +1,82 @@
+"""
+recommend1 の候補セット（CandidateSet）のベンチマーク
+
+候補数 N ごとに、1 リクエストあたりの build_recommend1 の latency を
+  - set    : 事前に切り出した部分行列（CandidateRegistry と同じ）
+  - lookup : 毎回 ID からカタログの行を引いて 1 件ずつ計算（従来の Catalog.rank_candidates）
+で比較し、順位・類似度・level が一致することを確認する。
+
+  python bench/bench_candidates.py --catalog-size 100000 --dim 768 --sizes 7 10 100 300 1000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from catalog import Catalog  # noqa: E402
+from explanations import ExplanationIndex  # noqa: E402
+from recommend import CandidateSet, build_recommend1, level_for_rank  # noqa: E402
+
+
+def lookup_recommend1(catalog, explanations, profile, candidate_ids):
+    """候補セット導入前の方法（候補ごとに exact_similarities → sort）"""
+    ranks = {r["artwork_id"]: r for r in catalog.rank_candidates(profile, candidate_ids)}
+    recs = []
+    for aid in candidate_ids:
+        level = level_for_rank(ranks[aid]["rank"], len(candidate_ids))
+        i = catalog.index.get(aid)
+        for explanation_id in explanations.lookup(aid, level) or [None]:
+            recs.append({
+                "artwork_id": aid,
+                "artwork_name": catalog.artwork_names[i] if i is not None else None,
+                "similarity": ranks[aid]["similarity"],
+                "level": level,
+                "explanation_id": explanation_id,
+            })
+    return recs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--catalog-size", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[7, 10, 100, 300, 1000])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    ids = [f"{400000 + i}" for i in range(args.catalog_size)]
+    catalog = Catalog(ids, ids, ids, ids, rng.normal(size=(args.catalog_size, args.dim)).astype(np.float32))
+    explanations = ExplanationIndex([(a, str(lv), "jp", f"{a}-{lv}") for a in ids for lv in (1, 2, 3)])
+    profiles = [catalog.emb[rng.integers(len(catalog))] * 3 for _ in range(16)]
+
+    print(f"catalog={args.catalog_size} dim={args.dim}")
+    print(f"{'N':>6}{'set ms':>10}{'lookup ms':>12}{'levels 3/2/1':>16}")
+    for n in args.sizes:
+        candidate_ids = [ids[i] for i in rng.choice(len(ids), size=n, replace=False)]
+        cs = CandidateSet(catalog, "bench", candidate_ids)
+        for p in profiles:
+            assert build_recommend1(catalog, explanations, p, cs) == lookup_recommend1(
+                catalog, explanations, p, candidate_ids
+            )
+
+        def timed(fn):
+            t0 = time.perf_counter()
+            for r in range(args.repeat):
+                fn(profiles[r % len(profiles)])
+            return (time.perf_counter() - t0) * 1000 / args.repeat
+
+        set_ms = timed(lambda p: build_recommend1(catalog, explanations, p, cs))
+        lookup_ms = timed(lambda p: lookup_recommend1(catalog, explanations, p, candidate_ids))
+        levels = [r["level"] for r in build_recommend1(catalog, explanations, profiles[0], cs)]
+        tiers = "/".join(str(levels.count(lv)) for lv in ("3", "2", "1"))
+        print(f"{n:>6}{set_ms:>10.3f}{lookup_ms:>12.3f}{tiers:>16}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+リクエストごとにクライアントを作る場合と、共有クライアント（コネクションプール）を使う場合の比較
+
+ローカルのスタンドインサーバーに対して、
+  - per-request : 毎回 Session を作成（= 毎回 bigquery.Client / firestore.Client を作る相当）
+                  トークン取得 + 新規コネクション（ハンドシェイク）が毎回発生する
+  - shared      : lifespan で作った 1 つの Session をスレッド間で共有
+の latency / throughput を測る。--handshake-ms で TLS・認証チャネル確立のコストを模擬する。
+
+  python bench/bench_clients.py --requests 2000 --threads 16 --handshake-ms 30
+"""
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List
+
+import requests
+
+
+def make_handler(handshake_ms: float, work_ms: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            # 新規コネクションごとに 1 回だけ呼ばれる → ハンドシェイクのコスト
+            time.sleep(handshake_ms / 1000)
+            super().setup()
+
+        def do_GET(self):
+            if self.path.startswith("/query"):
+                time.sleep(work_ms / 1000)
+            body = b'{"ok":true}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def run(name: str, call: Callable[[], None], n: int, threads: int) -> None:
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def one(_):
+        t0 = time.perf_counter()
+        call()
+        dt = (time.perf_counter() - t0) * 1000
+        with lock:
+            latencies.append(dt)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as ex:
+        list(ex.map(one, range(n)))
+    wall = time.perf_counter() - t0
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{name:<12}{statistics.median(latencies):>10.2f}{p95:>10.2f}{n / wall:>12.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--handshake-ms", type=float, default=20.0)
+    parser.add_argument("--work-ms", type=float, default=2.0)
+    parser.add_argument("--pool-size", type=int, default=16)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(args.handshake_ms, args.work_ms))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def per_request():
+        # クライアント作成 = 新しい Session + 認証トークン取得 + 本リクエスト
+        with requests.Session() as s:
+            s.get(f"{base}/token").raise_for_status()
+            s.get(f"{base}/query").raise_for_status()
+
+    shared_session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=args.pool_size, pool_maxsize=args.pool_size)
+    shared_session.mount("http://", adapter)
+
+    def shared():
+        shared_session.get(f"{base}/query").raise_for_status()
+
+    print(
+        f"requests={args.requests} threads={args.threads} "
+        f"handshake={args.handshake_ms}ms work={args.work_ms}ms pool={args.pool_size}"
+    )
+    print(f"{'mode':<12}{'p50 ms':>10}{'p95 ms':>10}{'req/s':>12}")
+    run("per-request", per_request, args.requests, args.threads)
+    run("shared", shared, args.requests, args.threads)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,516 @@
+"""
+類似度計算の SQL 等価性テスト + マイクロベンチマーク
+
+SQL_RECOMMEND_1 / SQL_RECOMMEND_2 をそのまま Python（float64, 1 行ずつ）に書き写した参照実装と、
+各実装の結果を決定的な合成データで比較し、1 クエリあたりの時間を表示する。不一致があれば AssertionError。
+
+参照実装が固定する意味:
+  - 重み w = (score - 50) / 50、user_emb = SUM(w * emb) / NULLIF(SUM(ABS(w)), 0)
+    （評価した作品のうち、テーブルにあり埋め込みが NULL でない行だけを使う）
+  - similarity = dot / NULLIF(|c| * |u|, 0)（ゼロベクトルは NULL）
+  - 並び: similarity DESC → NULL は最後 → 同点は artwork_id（文字列）の昇順
+  - recommend1: 候補の並び順で返す / level は上位 top_n が "3"・下位 bottom_n が "1"（level_counts）/
+    カタログに無い候補は similarity NULL / explanation は (language, explanation_id) 順に全言語分
+  - recommend2: 評価済み・org_museum_id が "555555" または NULL・埋め込み NULL の行を除く /
+    per_museum_cap は美術館ごとに (similarity DESC, artwork_id) の順位で絞る
+SQL で順序が決まらない箇所は、アプリの決定的な挙動に合わせて固定する:
+  - SQL_RECOMMEND_2 の最終的な ROW_NUMBER() は similarity だけで並べる → 同点は artwork_id 順
+  - 全評価が 50（SUM(ABS(w)) = 0）のとき SQL は NULL の k 件を順不定で返す → 空を返す
+
+比較する実装:
+  recommend2: python（正規化済みの float64 リスト + sorted）/ numpy（Catalog.recommend）/
+              int8（Catalog.quantize("int8")）/ batched（Catalog.recommend_profiles）
+  recommend1: python / numpy（CandidateSet + build_recommend1）
+類似度は float32 で保持した埋め込みとの差を tol まで許す。差が tol 以内の 2 件の順位の入れ替わり
+（near-tie）は許容して件数を表示する（完全な同点は artwork_id 順でなければならない）。
+
+  python bench/bench_equivalence.py --n 2000 --dim 64 --queries 20
+"""
+import argparse
+import copy
+import heapq
+import math
+import os
+import sys
+import time
+from operator import mul
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from catalog import EXCLUDED_MUSEUM_ID, Catalog  # noqa: E402
+from explanations import ExplanationIndex  # noqa: E402
+from recommend import CandidateSet, build_recommend1, level_counts  # noqa: E402
+
+Row = Dict[str, Any]
+
+
+# ===== 合成データ =====
+
+
+def synthetic_table(n: int, dim: int, seed: int) -> List[Row]:
+    """
+    artwork_master 相当の行（emb は float32 の値を Python の float にしたもの / NULL 可）
+      - 0, 1, 2 と 3, 4 は同じ埋め込み（完全な同点）/ 5, 6 はゼロベクトル / 7, 8 は埋め込み NULL
+      - museum は 5% が "555555"、2% が NULL。artwork_id は桁数の違う文字列（数値順と文字列順が異なる）
+    """
+    rng = np.random.default_rng(seed)
+    emb = rng.normal(size=(n, dim)).astype(np.float32)
+    emb[1:3] = emb[0]
+    emb[4] = emb[3]
+    emb[5:7] = 0
+    ids = [str(v) for v in rng.choice(10 ** 7, size=n, replace=False)]
+    table = []
+    for i, aid in enumerate(ids):
+        u = rng.random()
+        mid = EXCLUDED_MUSEUM_ID if u < 0.05 else None if u < 0.07 else str(100000 + int(rng.integers(0, 20)))
+        table.append(
+            {
+                "artwork_id": aid,
+                "artwork_name": f"name-{aid}",
+                "org_museum_name": None if mid is None else f"museum-{mid}",
+                "org_museum_id": mid,
+                "emb": None if i in (7, 8) else emb[i].tolist(),
+            }
+        )
+    return table
+
+
+def synthetic_explanations(table: List[Row]) -> List[Tuple[str, str, str, str]]:
+    """(artwork_id, level, language, explanation_id)。11 件に 1 件は解説なし、3 件に 1 件は英語もあり"""
+    rows = []
+    for i, r in enumerate(table):
+        if i % 11 == 10:
+            continue
+        for level in ("1", "2", "3"):
+            rows.append((r["artwork_id"], level, "jp", f"{i:06d}{level}0"))
+            if i % 3 == 0:
+                rows.append((r["artwork_id"], level, "en", f"{i:06d}{level}1"))
+    return sorted(rows)  # SQL_LOAD_EXPLANATIONS の ORDER BY
+
+
+def table_catalog(table: List[Row]) -> Catalog:
+    """load_catalog_from_bigquery と同じ（埋め込み NULL を除き artwork_id 順）"""
+    rows = sorted((r for r in table if r["emb"] is not None), key=lambda r: r["artwork_id"])
+    return Catalog(
+        [r["artwork_id"] for r in rows],
+        [r["artwork_name"] for r in rows],
+        [r["org_museum_name"] for r in rows],
+        [r["org_museum_id"] for r in rows],
+        np.array([r["emb"] for r in rows], dtype=np.float32).reshape(len(rows), -1),
+    )
+
+
+def scenarios(table: List[Row], n_random: int, rng: np.random.Generator) -> List[Tuple[str, List[Row]]]:
+    """評価（ratings_json の中身）の組。境界ケース + ランダム"""
+    ids = [r["artwork_id"] for r in table]
+    out = [
+        ("tie-top", [{"artwork_id": ids[0], "score": 100}]),  # 1, 2 が similarity 1 で同点
+        ("neutral", [{"artwork_id": ids[i], "score": 50} for i in (10, 11, 12)]),  # NULLIF(SUM(ABS(w)), 0)
+        ("cancel", [{"artwork_id": ids[3], "score": 100}, {"artwork_id": ids[4], "score": 0}]),  # user_emb = 0
+        ("unknown", [{"artwork_id": "no-such-id", "score": 90}, {"artwork_id": ids[7], "score": 80}]),  # 空
+        ("zero-rated", [{"artwork_id": ids[5], "score": 100}, {"artwork_id": ids[13], "score": 70}]),
+    ]
+    for q in range(n_random):
+        rows = rng.choice(len(ids), size=min(20, len(ids)), replace=False)
+        out.append((f"random-{q}", [{"artwork_id": ids[i], "score": int(rng.integers(0, 101))} for i in rows]))
+    return out
+
+
+def candidate_sets(table: List[Row], rng: np.random.Generator) -> List[Tuple[str, List[str]]]:
+    """
+    recommend1 の候補。埋め込み NULL の作品は候補に入れない
+    （SQL は artwork_name を返すがカタログには行が無いため。similarity はどちらも NULL）
+    """
+    usable = [r["artwork_id"] for r in table if r["emb"] is not None]
+    museum = table[len(table) // 2]["org_museum_id"] or str(100000)
+    return [
+        ("7", [usable[i] for i in rng.choice(len(usable), size=min(7, len(usable)), replace=False)]),
+        ("10+missing", [table[5]["artwork_id"], "no-such-id"] + [usable[i] for i in range(9, min(17, len(usable)))]),
+        ("museum", sorted(r["artwork_id"] for r in table if r["org_museum_id"] == museum and r["emb"] is not None)),
+        ("1", [usable[-1]]),
+    ]
+
+
+# ===== 参照実装（SQL の書き写し） =====
+
+
+def sql_user_emb(table: List[Row], ratings: List[Row]) -> List[Optional[float]]:
+    """user_profile CTE（評価が 1 件も使えなければ空配列、SUM(ABS(w)) = 0 なら全要素 NULL）"""
+    by_id = {r["artwork_id"]: r for r in table}
+    rated = [
+        (by_id[str(x["artwork_id"])]["emb"], (int(x["score"]) - 50) / 50.0)
+        for x in ratings
+        if str(x["artwork_id"]) in by_id and by_id[str(x["artwork_id"])]["emb"] is not None
+    ]
+    if not rated:
+        return []
+    denom = sum(abs(w) for _, w in rated)
+    dim = len(rated[0][0])
+    if denom == 0:
+        return [None] * dim
+    return [sum(w * emb[i] for emb, w in rated) / denom for i in range(dim)]
+
+
+def sql_similarity(c: Optional[List[float]], u: List[Optional[float]]) -> Optional[float]:
+    """dot / NULLIF(SQRT(SUM(c*c)) * SQRT(SUM(u*u)), 0)（NULL 要素の積は SUM で無視 → 全て NULL なら NULL）"""
+    if c is None or len(u) == 0 or any(x is None for x in u):
+        return None
+    dot = sum(a * b for a, b in zip(c, u))
+    norm = math.sqrt(sum(a * a for a in c)) * math.sqrt(sum(b * b for b in u))
+    return None if norm == 0 else dot / norm
+
+
+def _order_key(sim: Optional[float], artwork_id: str) -> Tuple[bool, float, str]:
+    return (sim is None, -(sim or 0.0), artwork_id)
+
+
+def sql_recommend1(
+    table: List[Row], explanations: List[Tuple[str, str, str, str]], ratings: List[Row], candidate_ids: List[str]
+) -> List[Row]:
+    by_id = {r["artwork_id"]: r for r in table}
+    user_emb = sql_user_emb(table, ratings)
+    top_n, bottom_n = level_counts(len(candidate_ids))
+
+    sims = {}
+    for aid in candidate_ids:
+        row = by_id.get(aid)
+        sims[aid] = sql_similarity(row["emb"] if row else None, user_emb)
+    ranked = sorted(candidate_ids, key=lambda a: _order_key(sims[a], a))
+    levels = {}
+    for rank, aid in enumerate(ranked, start=1):
+        levels[aid] = "3" if rank <= top_n else "1" if rank > len(candidate_ids) - bottom_n else "2"
+
+    out = []
+    for aid in candidate_ids:
+        row = by_id.get(aid)
+        matched = sorted((lang, eid) for a, lv, lang, eid in explanations if a == aid and lv == levels[aid])
+        for _, eid in matched or [(None, None)]:
+            out.append(
+                {
+                    "artwork_id": aid,
+                    "artwork_name": row["artwork_name"] if row else None,
+                    "similarity": sims[aid],
+                    "level": levels[aid],
+                    "explanation_id": eid,
+                }
+            )
+    return out
+
+
+def sql_scores(table: List[Row], ratings: List[Row], rated_ids: Sequence[str]) -> Dict[str, Optional[float]]:
+    """recommend2 の scored CTE（対象行の artwork_id -> similarity）。user_emb が空なら空"""
+    user_emb = sql_user_emb(table, ratings)
+    if len(user_emb) == 0:
+        return {}
+    rated = set(rated_ids)
+    return {
+        r["artwork_id"]: sql_similarity(r["emb"], user_emb)
+        for r in table
+        # org_museum_id != "555555" は NULL の行も落とす
+        if r["emb"] is not None and r["artwork_id"] not in rated
+        and r["org_museum_id"] is not None and r["org_museum_id"] != EXCLUDED_MUSEUM_ID
+    }
+
+
+def sql_recommend2(
+    table: List[Row], ratings: List[Row], rated_ids: Sequence[str], k: int, cap: Optional[int]
+) -> List[Row]:
+    by_id = {r["artwork_id"]: r for r in table}
+    if any(x is None for x in sql_user_emb(table, ratings)):
+        return []  # SUM(ABS(w)) = 0: SQL では順不定（アプリは空を返す）
+    scored = sql_scores(table, ratings, rated_ids)
+    ordered = sorted(scored, key=lambda a: _order_key(scored[a], a))
+    if cap is not None:
+        taken: Dict[str, int] = {}
+        capped = []
+        for aid in ordered:
+            mid = by_id[aid]["org_museum_id"]
+            taken[mid] = taken.get(mid, 0) + 1
+            if taken[mid] <= cap:
+                capped.append(aid)
+        ordered = capped
+    return [
+        {
+            "rank": rank,
+            "artwork_id": aid,
+            "artwork_name": by_id[aid]["artwork_name"],
+            "museum_name": by_id[aid]["org_museum_name"],
+            "similarity": scored[aid],
+        }
+        for rank, aid in enumerate(ordered[:k], start=1)
+    ]
+
+
+# ===== 比較する実装 =====
+
+
+class PythonImpl:
+    """純 Python（正規化済みベクトルを float64 のリストで保持し、sorted で並べる）"""
+
+    def __init__(self, table: List[Row], explanations: List[Tuple[str, str, str, str]]):
+        self.rows = {}
+        for r in table:
+            if r["emb"] is None:
+                continue
+            norm = math.sqrt(sum(x * x for x in r["emb"]))
+            unit = [x / norm for x in r["emb"]] if norm > 0 else None
+            self.rows[r["artwork_id"]] = (r, unit, norm)
+        self.explanations: Dict[Tuple[str, str], List[str]] = {}
+        for aid, level, _, eid in explanations:
+            self.explanations.setdefault((aid, level), []).append(eid)
+
+    def unit_profile(self, ratings: List[Row]) -> Optional[List[float]]:
+        rated = [(self.rows[x["artwork_id"]], (x["score"] - 50) / 50.0) for x in ratings if x["artwork_id"] in self.rows]
+        denom = sum(abs(w) for _, w in rated)
+        if not rated or denom == 0:
+            return None
+        dim = len(rated[0][0][0]["emb"])
+        profile = [0.0] * dim
+        for (r, _, _), w in rated:
+            for i, x in enumerate(r["emb"]):
+                profile[i] += w * x
+        norm = math.sqrt(sum(x * x for x in profile))
+        return [x / norm for x in profile] if norm > 0 else []
+
+    def sim(self, unit: Optional[List[float]], aid: str) -> Optional[float]:
+        entry = self.rows.get(aid)
+        if not unit or entry is None or entry[1] is None:
+            return None
+        return sum(map(mul, entry[1], unit))
+
+    def recommend1(self, ratings: List[Row], candidate_ids: List[str]) -> List[Row]:
+        unit = self.unit_profile(ratings)
+        sims = {aid: self.sim(unit, aid) for aid in candidate_ids}
+        top_n, bottom_n = level_counts(len(candidate_ids))
+        ranked = sorted(candidate_ids, key=lambda a: _order_key(sims[a], a))
+        levels = {a: "3" if i < top_n else "1" if i >= len(ranked) - bottom_n else "2" for i, a in enumerate(ranked)}
+        out = []
+        for aid in candidate_ids:
+            entry = self.rows.get(aid)
+            for eid in self.explanations.get((aid, levels[aid])) or [None]:
+                out.append({
+                    "artwork_id": aid,
+                    "artwork_name": entry[0]["artwork_name"] if entry else None,
+                    "similarity": sims[aid],
+                    "level": levels[aid],
+                    "explanation_id": eid,
+                })
+        return out
+
+    def recommend2(self, ratings: List[Row], rated_ids: Sequence[str], k: int, cap: Optional[int]) -> List[Row]:
+        unit = self.unit_profile(ratings)
+        if unit is None:
+            return []
+        rated = set(rated_ids)
+        eligible = [
+            aid for aid, (r, _, _) in self.rows.items()
+            if aid not in rated and r["org_museum_id"] not in (None, EXCLUDED_MUSEUM_ID)
+        ]
+        sims = {aid: self.sim(unit, aid) for aid in eligible}
+        key = lambda a: _order_key(sims[a], a)  # noqa: E731
+        if cap is None:
+            ordered = heapq.nsmallest(k, eligible, key=key)
+        else:
+            taken: Dict[str, int] = {}
+            ordered = []
+            for aid in sorted(eligible, key=key):
+                mid = self.rows[aid][0]["org_museum_id"]
+                taken[mid] = taken.get(mid, 0) + 1
+                if taken[mid] <= cap:
+                    ordered.append(aid)
+                    if len(ordered) == k:
+                        break
+        return [
+            {
+                "rank": rank,
+                "artwork_id": aid,
+                "artwork_name": self.rows[aid][0]["artwork_name"],
+                "museum_name": self.rows[aid][0]["org_museum_name"],
+                "similarity": sims[aid],
+            }
+            for rank, aid in enumerate(ordered[:k], start=1)
+        ]
+
+
+# ===== 比較 =====
+
+
+def _near(a: Optional[float], b: Optional[float], tol: float) -> bool:
+    if a is None or b is None:
+        return a is b
+    return abs(a - b) <= tol
+
+
+def compare2(expected: List[Row], got: List[Row], ref: Dict[str, Optional[float]], tol: float) -> Tuple[float, int]:
+    """recommend2 の結果を比較して (類似度の最大誤差, near-tie の入れ替わり数) を返す"""
+    assert len(expected) == len(got), (len(expected), len(got))
+    max_diff, swaps = 0.0, 0
+    for e, g in zip(expected, got):
+        assert _near(e["similarity"], g["similarity"], tol), (e, g)
+        if e["similarity"] is not None:
+            max_diff = max(max_diff, abs(e["similarity"] - g["similarity"]))
+        if e["artwork_id"] != g["artwork_id"]:
+            # 参照の類似度が tol 以内で異なる 2 件だけ、入れ替わりを許す（完全な同点は artwork_id 順）
+            a, b = ref.get(e["artwork_id"]), ref.get(g["artwork_id"])
+            assert a is not None and b is not None and a != b and abs(a - b) <= tol, (e, g)
+            swaps += 1
+            continue
+        assert {x: v for x, v in e.items() if x != "similarity"} == {x: v for x, v in g.items() if x != "similarity"}, (e, g)
+    return max_diff, swaps
+
+
+def compare1(expected: List[Row], got: List[Row], tol: float) -> Tuple[float, int]:
+    """recommend1 を候補ごとに比較する（level の違いは near-tie のときだけ許す）"""
+
+    def group(rows: List[Row]) -> List[Tuple[str, List[Row]]]:
+        out: List[Tuple[str, List[Row]]] = []
+        for r in rows:
+            if not out or out[-1][0] != r["artwork_id"]:
+                out.append((r["artwork_id"], []))
+            out[-1][1].append(r)
+        return out
+
+    exp, act = group(expected), group(got)
+    assert [a for a, _ in exp] == [a for a, _ in act], "candidate order"
+    sims = [rows[0]["similarity"] for _, rows in exp]
+    max_diff, swaps = 0.0, 0
+    for (aid, e_rows), (_, g_rows), sim in zip(exp, act, sims):
+        e, g = e_rows[0], g_rows[0]
+        assert _near(e["similarity"], g["similarity"], tol), (e, g)
+        assert e["artwork_name"] == g["artwork_name"], (e, g)
+        if sim is not None:
+            max_diff = max(max_diff, abs(sim - g["similarity"]))
+        if e["level"] != g["level"]:
+            assert sim is not None and any(
+                s is not None and s != sim and abs(s - sim) <= tol for s in sims
+            ), (e, g)
+            swaps += 1
+            continue
+        assert e_rows == [dict(r, similarity=e["similarity"]) for r in g_rows], (e_rows, g_rows)
+    return max_diff, swaps
+
+
+# ===== 実行 =====
+
+
+def timed(fn: Callable[[], Any]) -> Tuple[Any, float]:
+    t0 = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - t0) * 1000
+
+
+def run(table: List[Row], queries: List[Tuple[str, List[Row]]], ks: List[int], caps: List[Optional[int]],
+        tol: float, rng: np.random.Generator, verbose: bool) -> None:
+    expl_rows = synthetic_explanations(table)
+    catalog = table_catalog(table)
+    int8 = copy.copy(catalog)
+    int8.quantize("int8")
+    explanations = ExplanationIndex(expl_rows)
+    python = PythonImpl(table, expl_rows)
+    rated = [[x["artwork_id"] for x in r] for _, r in queries]
+
+    def show(op: str, impl: str, ms: float, n: int, diff: float, swaps: int) -> None:
+        if verbose:
+            print(f"{op:<30}{impl:<10}{ms / n:>12.3f}{diff:>12.2e}{swaps:>7}")
+
+    if verbose:
+        print(f"{'op':<30}{'impl':<10}{'ms/query':>12}{'max |dsim|':>12}{'swaps':>7}")
+
+    # recommend2
+    for k in ks:
+        for cap in caps:
+            op = f"recommend2 k={k} cap={cap or '-'}"
+            expected, ref_ms = timed(lambda: [sql_recommend2(table, r, ids, k, cap) for (_, r), ids in zip(queries, rated)])
+            refs = [sql_scores(table, r, ids) for (_, r), ids in zip(queries, rated)]
+            show(op, "sql-ref", ref_ms, len(queries), 0.0, 0)
+            impls = {
+                "python": lambda: [python.recommend2(r, ids, k, cap) for (_, r), ids in zip(queries, rated)],
+                "numpy": lambda: [catalog.recommend(r, ids, k, cap) for (_, r), ids in zip(queries, rated)],
+                "int8": lambda: [int8.recommend(r, ids, k, cap) for (_, r), ids in zip(queries, rated)],
+                "batched": lambda: catalog.recommend_profiles(
+                    [catalog.user_profile(r) for _, r in queries], rated, k, per_museum_cap=cap
+                ),
+            }
+            for impl, fn in impls.items():
+                got, ms = timed(fn)
+                diff, swaps = 0.0, 0
+                for (name, _), e, g, ref in zip(queries, expected, got, refs):
+                    try:
+                        d, s = compare2(e, g, ref, tol)
+                    except AssertionError:
+                        print(f"MISMATCH {op} impl={impl} query={name}", file=sys.stderr)
+                        raise
+                    diff, swaps = max(diff, d), swaps + s
+                show(op, impl, ms, len(queries), diff, swaps)
+
+    # recommend1
+    for set_name, candidate_ids in candidate_sets(table, rng):
+        op = f"recommend1 N={len(candidate_ids)} ({set_name})"
+        cs = CandidateSet(catalog, set_name, candidate_ids)
+        expected, ref_ms = timed(lambda: [sql_recommend1(table, expl_rows, r, candidate_ids) for _, r in queries])
+        show(op, "sql-ref", ref_ms, len(queries), 0.0, 0)
+        impls = {
+            "python": lambda: [python.recommend1(r, candidate_ids) for _, r in queries],
+            "numpy": lambda: [build_recommend1(catalog, explanations, catalog.user_profile(r), cs) for _, r in queries],
+        }
+        for impl, fn in impls.items():
+            got, ms = timed(fn)
+            diff, swaps = 0.0, 0
+            for (name, _), e, g in zip(queries, expected, got):
+                try:
+                    d, s = compare1(e, g, tol)
+                except AssertionError:
+                    print(f"MISMATCH {op} impl={impl} query={name}", file=sys.stderr)
+                    raise
+                diff, swaps = max(diff, d), swaps + s
+            show(op, impl, ms, len(queries), diff, swaps)
+
+    # 計算の部品（プロファイル作成 / 全件スコアリング）
+    if verbose:
+        ratings = [r for name, r in queries if name.startswith("random")]
+        _, py_ms = timed(lambda: [python.unit_profile(r) for r in ratings])
+        _, np_ms = timed(lambda: [catalog.unit_profile(catalog.user_profile(r)) for r in ratings])
+        show("profile", "python", py_ms, len(ratings), float("nan"), 0)
+        show("profile", "numpy", np_ms, len(ratings), float("nan"), 0)
+        units = [catalog.unit_profile(catalog.user_profile(r)) for r in ratings]
+        U = np.stack(units).astype(np.float32)
+        scans = {
+            "python": lambda: [[python.sim(u.tolist(), a) for a in python.rows] for u in units],
+            "numpy": lambda: [catalog.emb @ u.astype(np.float32) for u in units],
+            "int8": lambda: [int8.quant.scores(u) for u in units],
+            "batched": lambda: catalog.emb @ U.T,
+        }
+        for impl, fn in scans.items():
+            _, ms = timed(fn)
+            show(f"scores n={len(catalog)}", impl, ms, len(units), float("nan"), 0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=20, help="ランダムな評価の件数（境界ケースは別に 5 件）")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--cap", type=int, nargs="+", default=[0, 1, 2], help="0 は上限なし")
+    parser.add_argument("--tol", type=float, default=1e-6, help="float32 の埋め込みとの類似度の許容誤差")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    caps = [c or None for c in args.cap]
+
+    # 全件が結果に入る小さいテーブル（NULL は最後 / 除外の確認）→ 本番相当の大きさ
+    for n, verbose in ((16, False), (args.n, True)):
+        rng = np.random.default_rng(args.seed)
+        table = synthetic_table(n, args.dim, args.seed)
+        queries = scenarios(table, args.queries, rng)
+        ks = sorted(set(args.k) | ({n} if not verbose else set()))
+        if verbose:
+            print(f"n={n} dim={args.dim} queries={len(queries)} tol={args.tol}")
+        run(table, queries, ks, caps, args.tol, rng, verbose)
+    print("all implementations match the SQL reference")
+
+
+if __name__ == "__main__":
+    main()
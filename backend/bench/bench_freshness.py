@@ -0,0 +1,298 @@
+"""
+データ更新がレスポンスに反映されるかの確認（不一致があれば AssertionError）+ 内容バージョンの計算時間
+
+  version     : snapshot_version が作品名 / 美術館名 / museum_id（NULL を含む）/ 埋め込みのどれか 1 つの変更でも変わり、
+                スナップショットから読んだカタログでも同じ値になること
+  refresh     : artwork_master の作品名 / museum_id だけを変えたとき、/admin/catalog/refresh でカタログが差し替わり、
+                新しい名前・除外美術館が反映されること
+  etag        : 同じ変更のあと、変更前の ETag で条件付きリクエストしても 304 にならず、
+                新しい ETag と新しい名前が返ること（/recommend1 / /recommend2）
+  precomputed : batch/precompute_recommendations と同じ方法で書いた事前計算は変更前なら返り、
+                作品名 / museum_id だけを変えて差し替えたあとは使われないこと
+  put_race    : PUT /users/{id}/preferences/{aid} が preferencesUpdatedAt を読んでからコミットするまでに
+                フロントの直接書き込みが入っても、その書き込みを取りこぼしたプロファイルを使い続けないこと
+refresh 以降の確認はアプリを fakes の Firestore / BigQuery で起動して行う（カタログは BigQuery から読む）。
+
+  python bench/bench_freshness.py --n 20000 --dim 64
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from catalog import EXCLUDED_MUSEUM_ID, Catalog  # noqa: E402
+from snapshot import load_snapshot, snapshot_version, write_snapshot  # noqa: E402
+
+
+def synthetic_columns(n: int, dim: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    ids = [str(400000 + i) for i in range(n)]
+    names = [f"作品 {i}" if i % 17 else None for i in range(n)]
+    museum_names = [f"美術館 {i % 40}" for i in range(n)]
+    museum_ids = [str(100000 + i % 40) if i % 23 else None for i in range(n)]
+    return ids, names, museum_names, museum_ids, rng.normal(size=(n, dim)).astype(np.float32)
+
+
+def check_version(n: int, dim: int) -> None:
+    ids, names, museum_names, museum_ids, emb = synthetic_columns(n, dim)
+    base = Catalog(ids, names, museum_names, museum_ids, emb)
+
+    t0 = time.perf_counter()
+    version = snapshot_version(base)
+    hash_ms = (time.perf_counter() - t0) * 1000
+
+    def changed(**columns) -> Catalog:
+        cols = dict(
+            artwork_ids=ids, artwork_names=names, museum_names=museum_names, museum_ids=museum_ids, embeddings=emb
+        )
+        cols.update(columns)
+        return Catalog(**cols)
+
+    renamed = list(names)
+    renamed[1] = "別の作品名"
+    moved = list(museum_ids)
+    moved[1] = EXCLUDED_MUSEUM_ID
+    museum_renamed = list(museum_names)
+    museum_renamed[1] = "別の美術館"
+    null_name = list(names)
+    null_name[0] = ""  # None（index 0）と空文字列は区別する
+    shifted = list(names)
+    shifted[1], shifted[2] = names[1] + names[2][:1], names[2][1:]  # 連結すると同じになる変更
+    emb2 = emb.copy()
+    emb2[3, 0] += 1.0
+
+    cases = {
+        "artwork_name": changed(artwork_names=renamed),
+        "museum_id -> excluded": changed(museum_ids=moved),
+        "museum_name": changed(museum_names=museum_renamed),
+        "None -> empty": changed(artwork_names=null_name),
+        "boundary shift": changed(artwork_names=shifted),
+        "embedding": changed(embeddings=emb2),
+    }
+    for label, catalog in cases.items():
+        assert snapshot_version(catalog) != version, f"version unchanged: {label}"
+    assert snapshot_version(changed()) == version
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "catalog_snapshot")
+        manifest = write_snapshot(base, path)
+        loaded = load_snapshot(path)
+        assert manifest["version"] == version
+        assert snapshot_version(loaded) == version, "snapshot と メモリ上のカタログでバージョンが異なる"
+    print(f"version: ok ({len(cases)} metadata / embedding changes detected, hash {hash_ms:.1f} ms for n={n})")
+
+
+@asynccontextmanager
+async def serve(app_module: Any, data: Any, firestore_ms: float = 0.0) -> AsyncIterator[httpx.AsyncClient]:
+    """data を返す fakes でアプリを起動する（キャッシュは前の確認の分を持ち越さない）"""
+    from fakes import FakeClients, StageRecorder
+
+    recorder = StageRecorder()
+    app_module.Clients = lambda *a, **k: FakeClients(data, recorder, firestore_ms, 0.0)
+    app_module.RESPONSE_CACHE.clear()
+    app = app_module.app
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            client.recorder = recorder
+            yield client
+
+
+def top_ids(body: Dict[str, Any]) -> List[str]:
+    return [r["artwork_id"] for r in body["recommendations"]]
+
+
+def change_metadata(data: Any, body: Dict[str, Any]) -> Dict[str, str]:
+    """
+    上位 1 件の作品名を変え、2 件目を除外美術館（555555）に移す（埋め込み・ID はそのまま）
+    変えた内容を {"renamed": id, "moved": id} で返す
+    """
+    renamed, moved = top_ids(body)[:2]
+    rows = {aid: i for i, aid in enumerate(data.artwork_ids)}
+    data.artwork_names[rows[renamed]] = f"renamed {renamed}"
+    data.museum_ids[rows[moved]] = EXCLUDED_MUSEUM_ID
+    return {"renamed": renamed, "moved": moved}
+
+
+def assert_metadata_applied(body: Dict[str, Any], change: Dict[str, str]) -> None:
+    names = {r["artwork_id"]: r["artwork_name"] for r in body["recommendations"]}
+    assert names.get(change["renamed"]) == f"renamed {change['renamed']}", names
+    assert change["moved"] not in names, "除外美術館に移した作品が返っている"
+
+
+async def check_refresh(app_module: Any) -> None:
+    from fakes import SyntheticData
+
+    data = SyntheticData(5, 20, 500, 16)
+    params = {"user_id": "user1", "k": 5}
+    async with serve(app_module, data) as client:
+        before = (await client.get("/recommend2", params=params)).json()
+        version = app_module.STATE.catalog.version
+
+        change = change_metadata(data, before)
+        app_module.CLIENTS.bigquery.modified += 10
+        refreshed = (await client.post("/admin/catalog/refresh")).json()
+        assert refreshed["reloaded"], refreshed
+        assert app_module.STATE.catalog.version != version
+
+        after = (await client.get("/recommend2", params=params)).json()
+        assert_metadata_applied(after, change)
+    print("refresh: ok (metadata-only table update swaps the catalog)")
+
+
+async def check_etag(app_module: Any) -> None:
+    from fakes import SyntheticData
+
+    for endpoint, params in (("recommend2", {"user_id": "user1", "k": 5}), ("recommend1", {"user_id": "user1"})):
+        data = SyntheticData(5, 20, 500, 16)
+        async with serve(app_module, data) as client:
+            first = await client.get(f"/{endpoint}", params=params)
+            etag = first.headers.get("etag")
+            assert etag, f"{endpoint}: ETag が付いていない"
+            assert (await client.get(f"/{endpoint}", params=params, headers={"If-None-Match": etag})).status_code == 304
+
+            # recommend1 は候補が固定なので名前だけ変える（除外美術館の扱いは recommend2 で見る）
+            body = first.json()
+            if endpoint == "recommend1":
+                renamed = top_ids(body)[0]
+                rows = {aid: i for i, aid in enumerate(data.artwork_ids)}
+                data.artwork_names[rows[renamed]] = f"renamed {renamed}"
+            else:
+                change = change_metadata(data, body)
+            app_module.CLIENTS.bigquery.modified += 10
+            assert (await client.post("/admin/catalog/refresh")).json()["reloaded"]
+
+            res = await client.get(f"/{endpoint}", params=params, headers={"If-None-Match": etag})
+            assert res.status_code == 200, f"{endpoint}: メタデータだけの変更で 304 が返った"
+            assert res.headers.get("etag") not in (None, etag), f"{endpoint}: ETag が変わっていない"
+            if endpoint == "recommend1":
+                names = {r["artwork_id"]: r["artwork_name"] for r in res.json()["recommendations"]}
+                assert names[renamed] == f"renamed {renamed}", names
+            else:
+                assert_metadata_applied(res.json(), change)
+    print("etag: ok (metadata-only change invalidates ETags of /recommend1 and /recommend2)")
+
+
+async def check_precomputed(app_module: Any) -> None:
+    from catalog import load_catalog_from_bigquery
+    from explanations import load_explanation_index
+    from fakes import FakeBigQuery, StageRecorder, SyntheticData
+    from serving import ServingStore, data_version_of
+
+    data = SyntheticData(5, 20, 500, 16)
+    endpoints = ("recommend1", "recommend2")
+
+    # batch/precompute_recommendations と同じくテーブルから読んだ内容でバージョンを作る
+    bq = FakeBigQuery(data, StageRecorder())
+    catalog = load_catalog_from_bigquery(bq, app_module.BQ_ARTWORK_TABLE)
+    catalog.version = snapshot_version(catalog)
+    explanations = load_explanation_index(bq, app_module.BQ_EXPLANATION_TABLE)
+    versions = {
+        "recommend1": data_version_of(catalog.version, explanations.version),
+        "recommend2": data_version_of(catalog.version),
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "serving.db")
+        store = ServingStore(path, readonly=False)
+        store.put_many(
+            ("user1", ep, time.time(), "precomputed", versions[ep], {"user_id": "user1", "recommendations": [], "marker": ep})
+            for ep in endpoints
+        )
+        store.close()
+
+        saved = app_module.SERVING_DB_PATH
+        app_module.SERVING_DB_PATH = path
+        try:
+            async with serve(app_module, data) as client:
+                for ep in endpoints:
+                    body = (await client.get(f"/{ep}", params={"user_id": "user1"})).json()
+                    assert body.get("marker") == ep, f"{ep}: 同じデータの事前計算が使われていない"
+
+                # 上位の作品は事前計算側に無いので、実際に計算した結果から選ぶ
+                computed = await app_module._recommend2(app_module.STATE, "user1", k=5)
+                change_metadata(data, computed[0])
+                app_module.CLIENTS.bigquery.modified += 10
+                assert (await client.post("/admin/catalog/refresh")).json()["reloaded"]
+
+                for ep in endpoints:
+                    body = (await client.get(f"/{ep}", params={"user_id": "user1"})).json()
+                    assert "marker" not in body, f"{ep}: メタデータ変更前の事前計算が返った"
+        finally:
+            app_module.SERVING_DB_PATH = saved
+            app_module.SERVING = None  # lifespan の終了で閉じたストアを次の確認に残さない
+    print("precomputed: ok (metadata-only change invalidates precomputed rows)")
+
+
+async def check_put_race(app_module: Any) -> None:
+    from fakes import SyntheticData
+
+    data = SyntheticData(5, 20, 500, 16)
+    async with serve(app_module, data) as client:
+        await client.get("/recommend2", params={"user_id": "user1"})
+        unrated = [aid for aid in data.artwork_ids if aid not in data.preferences["user1"]]
+        direct, put = unrated[:2]
+
+        fs = app_module.CLIENTS.firestore()
+        get = fs._get
+        reads = []
+
+        def racing_get(path):
+            snap = get(path)
+            if path == ["users", "user1"]:
+                reads.append(snap)
+                if len(reads) == 1:
+                    # PUT が読んだ直後、コミット前にフロントが直接書き込む（invalidate は呼ばない）
+                    data.preferences["user1"][direct] = 7
+                    data.updated_at["user1"] = time.time()
+            return snap
+
+        fs._get = racing_get
+        try:
+            res = await client.put(f"/users/user1/preferences/{put}", json={"score": 90})
+        finally:
+            fs._get = get
+        assert res.status_code == 200, res.text
+        assert len(reads) >= 2, "コミット前の直接書き込みでバッチが失敗していない"
+
+        await client.get("/recommend2", params={"user_id": "user1"})
+        profile = app_module.STATE.profiles.get("user1")
+        assert profile is not None and profile.scores.get(put) == 90, "PUT の書き込みが反映されていない"
+        assert profile.scores.get(direct) == 7, "コミット前の直接書き込みを取りこぼしたプロファイルが使われた"
+    print(f"put_race: ok (conflicting direct write retried the PUT, {len(reads)} reads; profile has both writes)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=20_000)
+    parser.add_argument("--dim", type=int, default=64)
+    args = parser.parse_args()
+
+    check_version(args.n, args.dim)
+
+    # app の import 前に設定する（カタログは BigQuery から読み、定期更新はしない）
+    os.environ["CATALOG_IN_MEMORY"] = "1"
+    os.environ["CATALOG_SNAPSHOT_PATH"] = os.path.join(BACKEND_DIR, ".bench-no-snapshot")
+    os.environ["SERVING_DB_PATH"] = os.path.join(BACKEND_DIR, ".bench-no-serving.db")
+    os.environ["EXPLANATION_REFRESH_SEC"] = "0"
+    os.environ["CATALOG_REFRESH_SEC"] = "0"
+    import app as app_module
+
+    asyncio.run(check_refresh(app_module))
+    asyncio.run(check_etag(app_module))
+    asyncio.run(check_precomputed(app_module))
+    asyncio.run(check_put_race(app_module))
+
+
+if __name__ == "__main__":
+    main()
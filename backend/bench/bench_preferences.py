@@ -0,0 +1,108 @@
+"""
+嗜好読み込み → ユーザープロファイル作成までのベンチマーク（1 ユーザー 10k 件の評価）
+
+  legacy  : スナップショット → dict のリスト → ratings_json（JSON 往復）→ プロファイル
+  compact : スナップショット（score のみ）→ Ratings 配列 → プロファイル
+  map     : 非正規化ドキュメント 1 件の {artwork_id: score} → Ratings 配列 → プロファイル
+
+Firestore の通信自体は含まない（デコード後の Python 側の処理とメモリ量を比較する）。
+
+  python bench/bench_preferences.py --ratings 10000 --catalog-size 50000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from catalog import Catalog  # noqa: E402
+from ratings import Ratings, parse_score  # noqa: E402
+
+
+class Snap:
+    """Firestore の DocumentSnapshot 相当"""
+
+    __slots__ = ("id", "_data")
+
+    def __init__(self, doc_id: str, data: Dict[str, Any]):
+        self.id = doc_id
+        self._data = data
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self._data)
+
+
+def deep_size(ratings: List[Dict[str, Any]]) -> int:
+    size = sys.getsizeof(ratings)
+    for r in ratings:
+        size += sys.getsizeof(r) + sys.getsizeof(r["artwork_id"]) + sys.getsizeof(r["score"])
+    return size
+
+
+def timeit(fn: Callable[[], Any], repeat: int) -> float:
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ratings", type=int, default=10_000)
+    parser.add_argument("--catalog-size", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    ids = [str(400000 + i) for i in range(args.catalog_size)]
+    catalog = Catalog(ids, ids, ids, ids, rng.normal(size=(args.catalog_size, args.dim)).astype(np.float32))
+
+    rated = rng.choice(args.catalog_size, size=args.ratings, replace=False)
+    scores = rng.integers(1, 101, size=args.ratings)
+    # 非射影の読み込みでは updatedAt なども返ってくる
+    snaps_full = [Snap(ids[i], {"score": int(s), "updatedAt": "2025-01-01T00:00:00Z"}) for i, s in zip(rated, scores)]
+    snaps_score = [Snap(ids[i], {"score": int(s)}) for i, s in zip(rated, scores)]
+    score_map = {ids[i]: int(s) for i, s in zip(rated, scores)}
+
+    def legacy():
+        ratings = []
+        rated_ids = []
+        for snap in snaps_full:
+            artwork_id = str(snap.id)
+            score = parse_score((snap.to_dict() or {}).get("score", 0))
+            ratings.append({"artwork_id": artwork_id, "score": score})
+            rated_ids.append(artwork_id)
+        ratings_json = json.dumps(ratings, ensure_ascii=False)
+        return catalog.user_profile(json.loads(ratings_json))
+
+    def compact():
+        r = Ratings.from_pairs((str(s.id), parse_score(s.to_dict().get("score", 0))) for s in snaps_score)
+        return catalog.user_profile(r)
+
+    def from_map():
+        return catalog.user_profile(Ratings.from_map(score_map))
+
+    p0, p1, p2 = legacy(), compact(), from_map()
+    assert np.allclose(p0, p1, atol=1e-5) and np.allclose(p0, p2, atol=1e-5)
+
+    legacy_list = [{"artwork_id": ids[i], "score": int(s)} for i, s in zip(rated, scores)]
+    compact_r = Ratings.from_map(score_map)
+
+    print(f"ratings={args.ratings} catalog={args.catalog_size} dim={args.dim}")
+    print(f"{'path':<10}{'ms/user':>10}{'repr bytes':>14}")
+    print(f"{'legacy':<10}{timeit(legacy, args.repeat):>10.2f}{deep_size(legacy_list):>14}")
+    compact_bytes = compact_r.artwork_ids.nbytes + compact_r.scores.nbytes
+    print(f"{'compact':<10}{timeit(compact, args.repeat):>10.2f}{compact_bytes:>14}")
+    print(f"{'map':<10}{timeit(from_map, args.repeat):>10.2f}{compact_bytes:>14}")
+    print(f"ratings_json bytes (legacy payload to BigQuery): {len(json.dumps(legacy_list))}")
+
+
+if __name__ == "__main__":
+    main()
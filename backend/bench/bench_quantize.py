@@ -0,0 +1,93 @@
+"""
+量子化埋め込み（Catalog.quantize）のオフラインベンチマーク
+
+float32 / float16 / int8 の 1 次パスそれぞれについて
+  - 常駐メモリ（1 次パスの配列。--spill 時は float32 を mmap に逃がした後の常駐分）
+  - 1 クエリあたりの latency
+  - 再計算した候補数
+  - float32 全件探索との top-k 一致率（集合 / 順位・類似度まで完全一致）
+を表示する。
+
+  python bench/bench_quantize.py --n 200000 --dim 768 --k 10 --spill
+"""
+import argparse
+import copy
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_ann import synthetic_catalog, synthetic_ratings  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--ratings", type=int, default=20)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--spill", action="store_true", help="float32 の埋め込みを一時ファイルの mmap に逃がす")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    base = synthetic_catalog(args.n, args.dim, args.topics, args.seed)
+    users = [synthetic_ratings(base, args.ratings, rng) for _ in range(args.queries)]
+    queries = [(base.user_profile(u), [x["artwork_id"] for x in u]) for u in users]
+    expected = [base.recommend_profile(p, rated, args.k) for p, rated in queries]
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_quantize_")
+    print(f"n={args.n} dim={args.dim} k={args.k} queries={args.queries} spill={args.spill}")
+    print(
+        f"{'store':<9}{'scan MB':>9}{'resident MB':>13}{'ms/query':>10}{'rescored':>10}"
+        f"{'set agree':>11}{'exact':>8}{'max |dsim|':>12}"
+    )
+    for kind in ("float32", "float16", "int8"):
+        catalog = copy.copy(base)
+        if kind != "float32":
+            spill = os.path.join(tmpdir, f"{kind}.npy") if args.spill else None
+            catalog.quantize(kind, spill_path=spill)
+            scan_bytes = catalog.quant.nbytes
+            resident = scan_bytes + (0 if spill else catalog.emb.nbytes)
+        else:
+            scan_bytes = resident = catalog.emb.nbytes
+
+        # 再計算した行数を数える
+        rescored = []
+        exact_similarities = catalog.exact_similarities
+
+        def counting(rows, unit):
+            rescored.append(rows.size)
+            return exact_similarities(rows, unit)
+
+        catalog.exact_similarities = counting
+
+        catalog.recommend_profile(*queries[0], args.k)
+        rescored.clear()
+        t0 = time.perf_counter()
+        got = [catalog.recommend_profile(p, rated, args.k) for p, rated in queries]
+        ms = (time.perf_counter() - t0) * 1000 / len(queries)
+
+        set_agree = np.mean([
+            len({r["artwork_id"] for r in g} & {r["artwork_id"] for r in e}) / max(len(e), 1)
+            for g, e in zip(got, expected)
+        ])
+        exact = np.mean([g == e for g, e in zip(got, expected)])
+        dsim = max(
+            (abs(a["similarity"] - b["similarity"]) for g, e in zip(got, expected) for a, b in zip(g, e)),
+            default=0.0,
+        )
+        print(
+            f"{kind:<9}{scan_bytes / 2**20:>9.1f}{resident / 2**20:>13.1f}{ms:>10.2f}"
+            f"{np.mean(rescored):>10.1f}{set_agree:>11.3f}{exact:>8.3f}{dsim:>12.2e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
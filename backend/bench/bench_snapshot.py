@@ -0,0 +1,82 @@
+"""
+カタログのスナップショット（snapshot.py）の起動時間ベンチマーク
+
+  - table    : load_catalog_from_bigquery（FakeBigQuery の行を読み、正規化・ID 対応表を作る）
+  - snapshot : load_snapshot（.npy を mmap で開くだけ）
+それぞれ「読み込み」と「読み込み + 最初の recommend2 / recommend1」の時間を表示し、
+両者の結果が一致することを確認する。FakeBigQuery は通信の待ち時間を含まないので、
+table の値は実際の BigQuery からの読み込みより小さい（下限）。
+
+  python bench/bench_snapshot.py --n 200000 --dim 768
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from catalog import load_catalog_from_bigquery  # noqa: E402
+from fakes import FakeBigQuery, StageRecorder, SyntheticData  # noqa: E402
+from recommend import CandidateRegistry  # noqa: E402
+from snapshot import load_snapshot, write_snapshot  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    data = SyntheticData(users=1, ratings_per_user=20, catalog_size=args.n, dim=args.dim, seed=args.seed)
+    bq = FakeBigQuery(data, StageRecorder())
+    ratings = [{"artwork_id": a, "score": s} for a, s in data.preferences["user1"].items()]
+    rated_ids = [r["artwork_id"] for r in ratings]
+    museum_id = data.museum_ids[1]
+
+    def first_queries(catalog):
+        recs2 = catalog.recommend(ratings, rated_ids, k=10)
+        candidates = CandidateRegistry.build(catalog).get(museum_id)
+        ranks = candidates.rank(catalog.unit_profile(catalog.user_profile(ratings)))
+        return recs2, ranks
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_snapshot_")
+    path = os.path.join(tmpdir, "catalog_snapshot")
+    try:
+        t0 = time.perf_counter()
+        manifest = write_snapshot(data.catalog(), path, source="synthetic")
+        write_s = time.perf_counter() - t0
+        size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+        print(f"n={args.n} dim={args.dim} snapshot={size / 2**20:.1f} MB write={write_s:.2f}s version={manifest['version']}")
+
+        results = {}
+        print(f"{'source':<10}{'load ms':>12}{'+ first query ms':>18}")
+        for name, load in (
+            ("table", lambda: load_catalog_from_bigquery(bq, "artwork_master")),
+            ("snapshot", lambda: load_snapshot(path)),
+        ):
+            load_ms, total_ms = [], []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                catalog = load()
+                t1 = time.perf_counter()
+                results[name] = first_queries(catalog)
+                load_ms.append((t1 - t0) * 1000)
+                total_ms.append((time.perf_counter() - t0) * 1000)
+            print(f"{name:<10}{np.median(load_ms):>12.1f}{np.median(total_ms):>18.1f}")
+
+        (recs_t, (ranks_t, sims_t)), (recs_s, (ranks_s, sims_s)) = results["table"], results["snapshot"]
+        assert recs_t == recs_s
+        assert np.array_equal(ranks_t, ranks_s) and np.array_equal(sims_t, sims_s, equal_nan=True)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+recommend2 の上位 k 件選択（k / per_museum_cap）のベンチマーク
+
+1 クエリあたりの latency を
+  - partial : Catalog.recommend_profile（argpartition で候補を絞り、上限を満たすまで絞り込みを広げる）
+  - full    : 全件の類似度を計算して全件ソート → 先頭から美術館ごとの上限を適用（SQL_RECOMMEND_2 と同じ手順）
+で比較し、結果が一致することを確認する。
+
+  python bench/bench_topk.py --n 1000000 --dim 64 --museums 200 --k 1 10 100 --cap 0 1 3
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from catalog import Catalog  # noqa: E402
+
+
+def full_sort(catalog: Catalog, profile: np.ndarray, rated_ids: List[str], k: int, cap: Optional[int]) -> List[Dict[str, Any]]:
+    unit = catalog.unit_profile(profile)
+    rows = np.flatnonzero(~catalog.exclusion_mask(rated_ids))
+    sims = catalog.exact_similarities(rows, unit)
+    keys = np.where(np.isnan(sims), -np.inf, sims)
+    order = np.lexsort((catalog.id_rank[rows], -keys))
+    taken: Dict[Optional[str], int] = {}
+    out: List[int] = []
+    for j in order.tolist():
+        museum = catalog.museum_ids[rows[j]]
+        if cap is not None and taken.get(museum, 0) >= cap:
+            continue
+        taken[museum] = taken.get(museum, 0) + 1
+        out.append(j)
+        if len(out) == k:
+            break
+    return catalog._records(rows, sims, out)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--museums", type=int, default=200)
+    parser.add_argument("--topics", type=int, default=200)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--cap", type=int, nargs="+", default=[0, 1, 3], help="0 は上限なし")
+    parser.add_argument("--queries", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    # 美術館ごとに作風（トピック）が偏るようにして、上位が同じ館に集中する状況を作る
+    museum = rng.integers(0, args.museums, size=args.n)
+    topics = rng.normal(size=(args.topics, args.dim)).astype(np.float32)
+    emb = topics[museum % args.topics] + 0.8 * rng.normal(size=(args.n, args.dim)).astype(np.float32)
+    ids = [f"{i:07d}" for i in range(args.n)]
+    museum_ids = [str(100000 + m) for m in museum.tolist()]
+    catalog = Catalog(ids, ids, museum_ids, museum_ids, emb)
+    catalog.id_rank  # 初回作成分を計測に含めない
+
+    queries = []
+    for _ in range(args.queries):
+        rated = rng.choice(args.n, size=20, replace=False)
+        ratings = [{"artwork_id": ids[i], "score": int(s)} for i, s in zip(rated, rng.integers(1, 101, size=20))]
+        queries.append((catalog.user_profile(ratings), [r["artwork_id"] for r in ratings]))
+
+    print(f"n={args.n} dim={args.dim} museums={args.museums} queries={args.queries}")
+    print(f"{'k':>5}{'cap':>5}{'partial ms':>12}{'full ms':>10}{'speedup':>9}")
+    for k in args.k:
+        for cap in args.cap:
+            cap = cap or None
+            t0 = time.perf_counter()
+            got = [catalog.recommend_profile(p, rated, k, cap) for p, rated in queries]
+            partial_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+            t0 = time.perf_counter()
+            expected = [full_sort(catalog, p, rated, k, cap) for p, rated in queries]
+            full_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+            assert got == expected, (k, cap)
+            print(f"{k:>5}{cap or '-':>5}{partial_ms:>12.2f}{full_ms:>10.2f}{full_ms / partial_ms:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+複数ワーカーでのカタログのメモリ使用量ベンチマーク（Linux の /proc/<pid>/smaps_rollup を使う）
+
+ワーカー数 N ごとに N プロセスを起動し、それぞれカタログを読み込んで全件スコアリングを数回行った後の
+  - total PSS : 全ワーカーの PSS 合計（共有ページは共有しているプロセス数で按分される = 実メモリ）
+  - RSS/worker: 1 ワーカーの RSS（共有ページも全部数える）
+を表示する。
+  - shared  : 同じスナップショットを mmap（app.py の CATALOG_SHARED=1 / CATALOG_SNAPSHOT_PATH と同じ）
+  - private : ワーカーごとにカタログをメモリへコピー（BigQuery から読み込む場合と同じ）
+shared はワーカーを 1 つ増やしたときの total PSS の増分が、カタログの配列サイズの --max-growth 倍
+未満であることを確認する（インタプリタ・NumPy 分だけ増え、埋め込みの分は増えない）。
+
+  python bench/bench_workers.py --n 100000 --dim 768 --workers 1 2 4 8 --store int8
+"""
+import argparse
+import multiprocessing as mp
+import os
+import shutil
+import sys
+import tempfile
+from typing import Dict
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from catalog import Catalog  # noqa: E402
+from snapshot import load_quantized, load_snapshot, write_snapshot  # noqa: E402
+
+
+def memory(pid: int) -> Dict[str, int]:
+    """smaps_rollup の Rss / Pss（バイト）"""
+    out = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("Rss", "Pss"):
+                out[key] = int(value.split()[0]) * 1024
+    return out
+
+
+def worker(mode: str, path: str, store: str, queries: int, ready, done) -> None:
+    catalog = load_snapshot(path)
+    if mode == "shared":
+        if store != "float32":
+            load_quantized(path, catalog, store)
+    else:
+        catalog = Catalog(
+            list(catalog.artwork_ids),
+            list(catalog.artwork_names),
+            list(catalog.museum_names),
+            list(catalog.museum_ids),
+            np.array(catalog.emb),
+        )
+        if store != "float32":
+            catalog.quantize(store)
+
+    # 全件スコアリング + 再計算で埋め込みのページを一通り触る
+    rng = np.random.default_rng(os.getpid())
+    for _ in range(queries):
+        catalog.recommend_profile(np.asarray(catalog.emb[rng.integers(len(catalog))], dtype=np.float32), [], 10)
+    ready.put(os.getpid())
+    done.wait()
+
+
+def measure(mode: str, path: str, store: str, n_workers: int, queries: int):
+    ctx = mp.get_context("spawn")
+    ready, done = ctx.Queue(), ctx.Event()
+    procs = [ctx.Process(target=worker, args=(mode, path, store, queries, ready, done)) for _ in range(n_workers)]
+    for p in procs:
+        p.start()
+    try:
+        pids = [ready.get(timeout=600) for _ in procs]
+        usage = [memory(pid) for pid in pids]
+    finally:
+        done.set()
+        for p in procs:
+            p.join()
+    return sum(u["Pss"] for u in usage), float(np.mean([u["Rss"] for u in usage]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--store", choices=("float32", "float16", "int8"), default="float32")
+    parser.add_argument("--queries", type=int, default=3)
+    parser.add_argument("--max-growth", type=float, default=0.25)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    ids = [f"{400000 + i}" for i in range(args.n)]
+    museum_ids = [str(100000 + m) for m in rng.integers(0, 200, size=args.n).tolist()]
+    tmpdir = tempfile.mkdtemp(prefix="bench_workers_")
+    path = os.path.join(tmpdir, "catalog_snapshot")
+    try:
+        write_snapshot(Catalog(ids, ids, museum_ids, museum_ids, rng.normal(size=(args.n, args.dim))), path)
+        if args.store != "float32":
+            load_quantized(path, load_snapshot(path), args.store)  # 計測前に作っておく
+        catalog_bytes = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+        print(f"n={args.n} dim={args.dim} store={args.store} snapshot={catalog_bytes / 2**20:.1f} MB")
+        print(f"{'mode':<9}{'workers':>8}{'total PSS MB':>14}{'RSS/worker MB':>15}{'+MB/worker':>12}")
+
+        for mode in ("shared", "private"):
+            base = None
+            for n_workers in args.workers:
+                pss, rss = measure(mode, path, args.store, n_workers, args.queries)
+                if base is None:
+                    base = (n_workers, pss)
+                growth = (pss - base[1]) / (n_workers - base[0]) if n_workers > base[0] else float("nan")
+                print(f"{mode:<9}{n_workers:>8}{pss / 2**20:>14.1f}{rss / 2**20:>15.1f}{growth / 2**20:>12.1f}")
+                if mode == "shared" and n_workers > base[0]:
+                    assert growth < args.max_growth * catalog_bytes, (n_workers, growth, catalog_bytes)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""
+GCP を使わずに backend/app.py を動かすためのインメモリのスタンドイン
+
+- FakeFirestore : users/{uid}/preferences/{artwork_id} のレイアウトを再現
+- FakeBigQuery  : artwork_master / explanation_master の読み込みと
+                  SQL_RECOMMEND_1 / SQL_RECOMMEND_2 を Python で同じ結果になるよう計算
+- 各呼び出しに任意の遅延を入れ、ステージごとの所要時間を StageRecorder に記録する
+"""
+import json
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from google.api_core import exceptions as google_exceptions
+
+from catalog import Catalog
+from explanations import ExplanationIndex
+from recommend import CANDIDATE_IDS, build_recommend1
+
+
+class StageRecorder:
+    """ステージ名ごとの所要時間（秒）を集める"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.samples.clear()
+
+
+class SyntheticData:
+    """作品カタログ・解説・ユーザー嗜好の合成データ（seed 固定で再現可能）"""
+
+    def __init__(self, users: int, ratings_per_user: int, catalog_size: int, dim: int, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        n = max(catalog_size, len(CANDIDATE_IDS))
+
+        ids = list(CANDIDATE_IDS)
+        next_id = 400000
+        while len(ids) < n:
+            aid = str(next_id)
+            next_id += 1
+            if aid not in CANDIDATE_IDS:
+                ids.append(aid)
+        self.artwork_ids = ids
+        self.museum_ids = [("555555" if i % 10 == 0 else str(100000 + i % 50)) for i in range(n)]
+        # 名前は ID と同じ（メタデータだけの更新を模擬するときに書き換える）
+        self.artwork_names: List[Optional[str]] = list(ids)
+        self.museum_names: List[Optional[str]] = list(self.museum_ids)
+        self.embeddings = rng.normal(size=(n, dim)).astype(np.float32)
+
+        self.explanations = [
+            (aid, str(level), "jp", f"{300000 + i * 3 + level - 1:06d}")
+            for i, aid in enumerate(ids)
+            for level in (1, 2, 3)
+        ]
+
+        k = min(ratings_per_user, n)
+        self.preferences: Dict[str, Dict[str, int]] = {}
+        for u in range(1, users + 1):
+            rows = rng.choice(n, size=k, replace=False)
+            scores = rng.integers(1, 101, size=k)
+            self.preferences[f"user{u}"] = {ids[i]: int(s) for i, s in zip(rows, scores)}
+
+        self.updated_at: Dict[str, float] = {}
+
+    def catalog(self) -> Catalog:
+        return Catalog(self.artwork_ids, self.artwork_names, self.museum_names, self.museum_ids, self.embeddings)
+
+
+class _Snapshot:
+    def __init__(self, doc_id: str, data: Optional[Dict[str, Any]], update_time: Optional[float] = None):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+        self.update_time = _Timestamp(update_time) if update_time is not None else None
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return None if self._data is None else dict(self._data)
+
+
+class _Timestamp:
+    def __init__(self, ts: float):
+        self._ts = ts
+
+    def timestamp(self) -> float:
+        return self._ts
+
+
+class _WriteOption:
+    def __init__(self, last_update_time: _Timestamp):
+        self.last_update_time = last_update_time
+
+
+class _WriteResult:
+    def __init__(self, ts: float):
+        self.update_time = _Timestamp(ts)
+
+
+class _DocRef:
+    def __init__(self, fs: "FakeFirestore", path: List[str]):
+        self._fs = fs
+        self.path = path
+        self.id = path[-1]
+
+    def collection(self, name: str) -> "_CollectionRef":
+        return _CollectionRef(self._fs, self.path + [name])
+
+    def get(self, field_paths: Optional[List[str]] = None) -> _Snapshot:
+        return self._fs._get(self.path)
+
+    def set(self, data: Dict[str, Any], merge: bool = False) -> None:
+        self._fs._set(self.path, data)
+
+
+class _CollectionRef:
+    def __init__(self, fs: "FakeFirestore", path: List[str]):
+        self._fs = fs
+        self.path = path
+
+    def document(self, doc_id: str) -> _DocRef:
+        return _DocRef(self._fs, self.path + [doc_id])
+
+    def limit(self, n: int) -> "_CollectionRef":
+        return self
+
+    def select(self, field_paths: List[str]) -> "_CollectionRef":
+        return self
+
+    def stream(self):
+        return iter(self._fs._stream(self.path))
+
+
+class _Batch:
+    def __init__(self, fs: "FakeFirestore"):
+        self._fs = fs
+        self._ops = []
+
+    def set(self, ref: _DocRef, data: Dict[str, Any], merge: bool = False) -> None:
+        self._ops.append((ref.path, data, None))
+
+    def update(self, ref: _DocRef, data: Dict[str, Any], option: Optional[_WriteOption] = None) -> None:
+        self._ops.append((ref.path, data, option.last_update_time.timestamp() if option is not None else None))
+
+    def create(self, ref: _DocRef, data: Dict[str, Any]) -> None:
+        self._ops.append((ref.path, data, "missing"))
+
+    def commit(self) -> List[_WriteResult]:
+        with self._fs._lock:
+            # 前提条件が 1 つでも満たされなければ何も書かない（本物と同じくバッチ全体が失敗する）
+            for path, _, precondition in self._ops:
+                current = self._fs._update_time(path)
+                if precondition == "missing" and current is not None:
+                    raise google_exceptions.AlreadyExists(f"{'/'.join(path)} already exists")
+                if isinstance(precondition, float) and current != precondition:
+                    raise google_exceptions.FailedPrecondition(f"{'/'.join(path)} was updated")
+            # 本物と同じく SERVER_TIMESTAMP はバッチ内で同じコミット時刻になる
+            now = time.time()
+            for path, data, _ in self._ops:
+                self._fs._set(path, data, now)
+        return [_WriteResult(now) for _ in self._ops]
+
+
+class FakeFirestore:
+    def __init__(self, data: SyntheticData, recorder: StageRecorder, latency_ms: float = 0.0):
+        self.data = data
+        self.recorder = recorder
+        self.latency = latency_ms / 1000
+        self._lock = threading.Lock()
+
+    def collection(self, name: str) -> _CollectionRef:
+        return _CollectionRef(self, [name])
+
+    def batch(self) -> _Batch:
+        return _Batch(self)
+
+    def write_option(self, last_update_time: _Timestamp) -> _WriteOption:
+        return _WriteOption(last_update_time)
+
+    def close(self) -> None:
+        pass
+
+    def _stream(self, path: List[str]) -> List[_Snapshot]:
+        t0 = time.perf_counter()
+        time.sleep(self.latency)
+        snaps: List[_Snapshot] = []
+        if len(path) == 3 and path[0] == "users" and path[2] == "preferences":
+            prefs = self.data.preferences.get(path[1], {})
+            snaps = [_Snapshot(aid, {"score": s}) for aid, s in prefs.items()]
+        self.recorder.record("firestore.stream", time.perf_counter() - t0)
+        return snaps
+
+    def _get(self, path: List[str]) -> _Snapshot:
+        t0 = time.perf_counter()
+        time.sleep(self.latency)
+        snap = _Snapshot(path[-1], None)
+        if path[2:] == ["denormalized", "preferences"] and path[1] in self.data.preferences:
+            snap = _Snapshot(path[-1], {"scores": dict(self.data.preferences[path[1]])})
+        elif len(path) == 2 and path[0] == "users" and self._update_time(path) is not None:
+            ts = self.data.updated_at.get(path[1])
+            snap = _Snapshot(
+                path[1], {"preferencesUpdatedAt": _Timestamp(ts) if ts else None}, self._update_time(path)
+            )
+        self.recorder.record("firestore.get", time.perf_counter() - t0)
+        return snap
+
+    def _update_time(self, path: List[str]) -> Optional[float]:
+        """users/{uid} の update_time（無ければ None）。ユーザードキュメントは preferencesUpdatedAt だけを持つ"""
+        if len(path) != 2 or path[0] != "users":
+            return None
+        if path[1] not in self.data.preferences and path[1] not in self.data.updated_at:
+            return None
+        return self.data.updated_at.get(path[1], 0.0)
+
+    def _set(self, path: List[str], data: Dict[str, Any], now: Optional[float] = None) -> None:
+        if len(path) == 4 and path[0] == "users" and path[2] == "preferences":
+            self.data.preferences.setdefault(path[1], {})[path[3]] = int(data["score"])
+        elif len(path) == 2 and path[0] == "users" and "preferencesUpdatedAt" in data:
+            self.data.updated_at[path[1]] = now if now is not None else time.time()
+
+
+class _Job:
+    def __init__(self, rows: List[Dict[str, Any]], bytes_processed: int = 0, slot_millis: int = 0):
+        self._rows = rows
+        # QueryJob のジョブ統計（metrics.record_bigquery_job が読む）
+        self.total_bytes_processed = bytes_processed
+        self.total_bytes_billed = max(bytes_processed, 10 * 1024 * 1024) if bytes_processed else 0
+        self.slot_millis = slot_millis
+
+    def result(self) -> List[Dict[str, Any]]:
+        return self._rows
+
+
+class FakeBigQuery:
+    """
+    SQL 文字列のパラメータ宣言で種類を判別し、同じ結果を Python で返す
+    （クエリジョブの待ち時間は latency_ms で模擬）
+    """
+
+    def __init__(self, data: SyntheticData, recorder: StageRecorder, latency_ms: float = 0.0):
+        self.data = data
+        self.recorder = recorder
+        self.latency = latency_ms / 1000
+        self._catalog = data.catalog()
+        self._explanations = ExplanationIndex(data.explanations)
+        self.modified = time.time()
+
+    def close(self) -> None:
+        pass
+
+    def get_table(self, table: str) -> Any:
+        """テーブルのメタデータ（modified だけ。data を書き換えたら modified も更新する）"""
+        meta = type("Table", (), {})()
+        meta.modified = _Timestamp(self.modified)
+        return meta
+
+    def query(self, sql: str, job_config: Any = None) -> _Job:
+        t0 = time.perf_counter()
+        params = _params(job_config)
+        if "@candidate_ids" in sql and "@ratings_json" in sql:
+            stage, rows = "bigquery.recommend1", self._recommend1(params)
+        elif "@ratings_json" in sql:
+            stage, rows = "bigquery.recommend2", self._recommend2(params)
+        elif "explanation_id" in sql:
+            stage, rows = "bigquery.load_explanations", [
+                {"artwork_id": a, "level": l, "language": g, "explanation_id": e}
+                for a, l, g, e in self.data.explanations
+            ]
+        elif "caption_embedding.result AS emb" in sql:
+            stage, rows = "bigquery.load_catalog", [
+                {
+                    "artwork_id": aid,
+                    "artwork_name": self.data.artwork_names[i],
+                    "org_museum_name": self.data.museum_names[i],
+                    "org_museum_id": mid,
+                    "emb": self.data.embeddings[i].tolist(),
+                }
+                for i, (aid, mid) in enumerate(zip(self.data.artwork_ids, self.data.museum_ids))
+            ]
+        else:
+            stage, rows = "bigquery.other", []
+        time.sleep(self.latency)
+        self.recorder.record(stage, time.perf_counter() - t0)
+        # 埋め込み列（float64）を全件読む想定の概算
+        scanned = len(self.data.artwork_ids) * self.data.embeddings.shape[1] * 8
+        return _Job(rows, bytes_processed=scanned, slot_millis=int(self.latency * 1000))
+
+    def _ratings(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return json.loads(params["ratings_json"])
+
+    def _recommend1(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        profile = self._catalog.user_profile(self._ratings(params))
+        candidate_ids = list(params["candidate_ids"])
+        ranks = {r["artwork_id"]: r["rank"] for r in self._catalog.rank_candidates(profile, candidate_ids)}
+        recs = build_recommend1(self._catalog, self._explanations, profile, candidate_ids)
+        return [dict(r, rank=ranks[r["artwork_id"]]) for r in recs]
+
+    def _recommend2(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        recs = self._catalog.recommend(
+            self._ratings(params), params["rated_ids"], params.get("k", 1), params.get("per_museum_cap")
+        )
+        return [dict(r, org_museum_name=r["museum_name"]) for r in recs]
+
+
+def _params(job_config: Any) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for p in getattr(job_config, "query_parameters", None) or []:
+        out[p.name] = p.values if hasattr(p, "values") else p.value
+    return out
+
+
+class FakeClients:
+    """clients.Clients と同じインターフェース"""
+
+    def __init__(
+        self,
+        data: SyntheticData,
+        recorder: StageRecorder,
+        firestore_ms: float = 0.0,
+        bigquery_ms: float = 0.0,
+    ):
+        self._firestore = FakeFirestore(data, recorder, firestore_ms)
+        self.bigquery = FakeBigQuery(data, recorder, bigquery_ms)
+
+    def firestore(self) -> FakeFirestore:
+        return self._firestore
+
+    def warm_up(self, bigquery: bool = True) -> None:
+        pass
+
+    def health(self) -> Dict[str, Any]:
+        return {"fake": True}
+
+    def close(self) -> None:
+        pass
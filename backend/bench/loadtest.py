@@ -0,0 +1,158 @@
+"""
+backend/app.py のオフライン負荷試験（GCP 不要）
+
+bench/fakes.py のスタンドインで Firestore / BigQuery を置き換え、アプリをプロセス内（ASGI）で起動して
+/recommend1 と /recommend2 に並行リクエストを送る。
+エンドポイントごとの p50 / p95 / p99、スループット、ステージごとの内訳を JSON で出力する。
+出力はキー順・丸め済みなので、コミット間で diff / --compare できる。
+
+  python bench/loadtest.py --users 500 --catalog-size 20000 --requests 5000 --concurrency 64 --out result.json
+  python bench/loadtest.py ... --compare result.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"count": 0}
+    a = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(a.mean()), 3),
+        "p50_ms": round(float(np.percentile(a, 50)), 3),
+        "p95_ms": round(float(np.percentile(a, 95)), 3),
+        "p99_ms": round(float(np.percentile(a, 99)), 3),
+    }
+
+
+async def drive(app_module: Any, recorder: Any, args: argparse.Namespace) -> Dict[str, Any]:
+    app = app_module.app
+    rng = random.Random(args.seed)
+    user_ids = [f"user{u}" for u in range(1, args.users + 1)]
+    plan = [(args.endpoints[i % len(args.endpoints)], rng.choice(user_ids)) for i in range(args.requests)]
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in plan:
+        queue.put_nowait(item)
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        if args.no_cache:
+            app_module.RESPONSE_CACHE.ttl = -1
+            app_module.RESPONSE_CACHE.stale_ttl = 0
+        recorder.reset()
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+            async def worker():
+                while True:
+                    try:
+                        endpoint, user_id = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    t0 = time.perf_counter()
+                    res = await client.get(f"/{endpoint}", params={"user_id": user_id})
+                    dt = time.perf_counter() - t0
+                    if res.status_code != 200:
+                        errors[endpoint] += 1
+                    latencies[endpoint].append(dt)
+
+            t0 = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            wall = time.perf_counter() - t0
+
+        stages = {k: percentiles(v) for k, v in sorted(recorder.samples.items())}
+        cache = app_module.RESPONSE_CACHE.stats()
+
+    return {
+        "config": {k: v for k, v in sorted(vars(args).items()) if k not in ("out", "compare")},
+        "throughput_rps": round(args.requests / wall, 1),
+        "wall_sec": round(wall, 3),
+        "endpoints": {
+            ep: dict(percentiles(latencies[ep]), errors=errors[ep]) for ep in sorted(latencies)
+        },
+        "stages": stages,
+        "response_cache": cache,
+    }
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    """ベースライン JSON との差分（p50/p95/p99 とスループット）を表示する"""
+    print(f"{'metric':<40}{'baseline':>12}{'current':>12}{'delta %':>10}")
+
+    def row(name: str, old: float, new: float) -> None:
+        delta = (new - old) / old * 100 if old else 0.0
+        print(f"{name:<40}{old:>12.3f}{new:>12.3f}{delta:>+10.1f}")
+
+    row("throughput_rps", baseline["throughput_rps"], result["throughput_rps"])
+    for section in ("endpoints", "stages"):
+        for name, stats in result[section].items():
+            old = baseline.get(section, {}).get(name)
+            if not old:
+                continue
+            for key in ("p50_ms", "p95_ms", "p99_ms"):
+                if key in stats and key in old:
+                    row(f"{section}.{name}.{key}", old[key], stats[key])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--ratings-per-user", type=int, default=50)
+    parser.add_argument("--catalog-size", type=int, default=10_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--endpoints", nargs="+", default=["recommend1", "recommend2"])
+    parser.add_argument("--firestore-ms", type=float, default=20.0, help="Firestore 呼び出しごとの遅延")
+    parser.add_argument("--bigquery-ms", type=float, default=1500.0, help="BigQuery ジョブごとの遅延")
+    parser.add_argument("--mode", choices=["memory", "bigquery"], default="memory")
+    parser.add_argument("--no-cache", action="store_true", help="レスポンスキャッシュを無効にする")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out")
+    parser.add_argument("--compare")
+    args = parser.parse_args()
+
+    # app の import 前に設定する
+    os.environ["CATALOG_IN_MEMORY"] = "1" if args.mode == "memory" else "0"
+    os.environ["SERVING_DB_PATH"] = os.path.join(BACKEND_DIR, ".loadtest-no-serving.db")
+    os.environ["EXPLANATION_REFRESH_SEC"] = "0"
+
+    import app as app_module
+    from fakes import FakeClients, StageRecorder, SyntheticData
+
+    data = SyntheticData(args.users, args.ratings_per_user, args.catalog_size, args.dim, seed=args.seed)
+    recorder = StageRecorder()
+    app_module.Clients = lambda *a, **k: FakeClients(data, recorder, args.firestore_ms, args.bigquery_ms)
+
+    result = asyncio.run(drive(app_module, recorder, args))
+    text = json.dumps(result, indent=2, sort_keys=True)
+    print(text)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
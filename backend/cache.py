@@ -0,0 +1,173 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+FRESH = "fresh"
+STALE = "stale"
+MISS = "miss"
+
+
+def preferences_version(scores: Iterable[Tuple[str, int]]) -> str:
+    """嗜好 (artwork_id, score) の集合から順序に依存しないバージョン文字列を作る"""
+    h = hashlib.blake2b(digest_size=8)
+    for aid, score in sorted((str(a), int(s)) for a, s in scores):
+        h.update(f"{aid}:{score};".encode())
+    return h.hexdigest()
+
+
+def response_etag(endpoint: str, version: str, data_version: str) -> str:
+    """
+    レコメンドの強い ETag（エンドポイント + 嗜好のバージョン / 更新時刻 + カタログ / 解説のバージョン）
+    同じ組み合わせなら同じ結果になるので、本文を作らずに比較できる
+    """
+    h = hashlib.blake2b(f"{endpoint}|{version}|{data_version}".encode(), digest_size=12)
+    return f'"{h.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match に etag が含まれるか（"*" / 弱い比較 W/ も受け付ける）"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class CacheEntry:
+    __slots__ = ("value", "version", "stored_at", "updated_at")
+
+    def __init__(self, value: Any, version: str, stored_at: float, updated_at: float = 0.0):
+        self.value = value
+        self.version = version
+        self.stored_at = stored_at
+        self.updated_at = updated_at  # 計算開始時に読んだ users/{id}.preferencesUpdatedAt
+
+
+class ResponseCache:
+    """
+    レコメンド結果の LRU + TTL キャッシュ（キー: (endpoint, user_id)）
+
+    - ttl 秒以内: fresh としてそのまま返す
+    - ttl 〜 ttl + stale_ttl 秒: stale として返しつつ、呼び出し側がバックグラウンドで再計算する
+    - 嗜好の変更時は invalidate_user で明示的に破棄する
+      （計算中に破棄された場合、その計算結果は保存しない。clear は全ユーザーの計算中の分も対象）
+    - fresh なヒットは Firestore を読まずに返す。フロントが Firestore に直接書いた変更は
+      invalidate_user（/users/{id}/preferences/invalidate）か、TTL が切れたあとの再検証で反映する
+      （再検証で読んだ preferencesUpdatedAt がエントリの計算時より新しければ discard_outdated で破棄する）
+    """
+
+    def __init__(self, max_entries: int = 10_000, ttl: float = 60.0, stale_ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0  # clear ごとに増やす
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.outdated = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, key: Tuple[str, str], updated_at: float = 0.0) -> Tuple[Optional[CacheEntry], str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, MISS
+            if updated_at > entry.updated_at:
+                # 計算後に嗜好が更新されている（stale としても返さない）
+                del self._entries[key]
+                self.outdated += 1
+                self.misses += 1
+                return None, MISS
+
+            age = now - entry.stored_at
+            if age <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry, FRESH
+            if age <= self.ttl + self.stale_ttl:
+                self._entries.move_to_end(key)
+                self.stale_hits += 1
+                return entry, STALE
+
+            del self._entries[key]
+            self.misses += 1
+            return None, MISS
+
+    def discard_outdated(self, key: Tuple[str, str], entry: CacheEntry, updated_at: float) -> bool:
+        """
+        stale で返ったエントリより後に嗜好が更新されていれば破棄して True（lookup は miss として数え直す）
+        その間に新しい計算結果へ置き換わっていれば、そちらは残す
+        """
+        if updated_at <= entry.updated_at:
+            return False
+        with self._lock:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+            self.outdated += 1
+            self.stale_hits -= 1
+            self.misses += 1
+        return True
+
+    def generation(self, user_id: str) -> Tuple[int, int]:
+        """計算開始時に取得し、put に渡す（途中で invalidate / clear されたら保存しない）"""
+        with self._lock:
+            return self._epoch, self._generations.get(user_id, 0)
+
+    def put(
+        self,
+        key: Tuple[str, str],
+        value: Any,
+        version: str,
+        generation: Tuple[int, int],
+        updated_at: float = 0.0,
+    ) -> bool:
+        _, user_id = key
+        with self._lock:
+            if (self._epoch, self._generations.get(user_id, 0)) != generation:
+                return False
+            self._entries[key] = CacheEntry(value, version, time.time(), updated_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def invalidate_user(self, user_id: str) -> int:
+        """ユーザーの全エンドポイント分を破棄し、破棄した件数を返す"""
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            keys = [k for k in self._entries if k[1] == user_id]
+            for k in keys:
+                del self._entries[k]
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "outdated": self.outdated,
+        }
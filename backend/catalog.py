@@ -0,0 +1,454 @@
+import os
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ann import IVFIndex
+from quantize import QuantizedEmbeddings
+from ratings import Ratings
+
+# recommend2 から除外する美術館（メトロポリタン美術館の取り込み分）
+EXCLUDED_MUSEUM_ID = "555555"
+
+# float32 の行列積で候補を絞るときの余裕幅（最終的な類似度は float64 で再計算する）
+RESCORE_MARGIN = 1e-4
+
+
+class Catalog:
+    """
+    artwork_master の caption_embedding をメモリ上に保持する作品カタログ
+
+    - emb   : (n, d) float32, 各行を L2 正規化済み（C 連続, quantize で mmap に置き換え可）
+    - norms : 正規化前のノルム（ユーザープロファイルを元のスケールで作るため）
+    - quant : 1 次パス用の量子化埋め込み（quantize で作成。None なら emb で全件スコアリング）
+    """
+
+    def __init__(
+        self,
+        artwork_ids: Sequence[str],
+        artwork_names: Sequence[Optional[str]],
+        museum_names: Sequence[Optional[str]],
+        museum_ids: Sequence[Optional[str]],
+        embeddings: np.ndarray,
+    ):
+        emb = np.asarray(embeddings, dtype=np.float32)
+        if emb.ndim != 2 or emb.shape[0] != len(artwork_ids):
+            raise ValueError(f"embedding shape mismatch: {emb.shape} vs {len(artwork_ids)} ids")
+
+        norms = np.linalg.norm(emb, axis=1)
+        safe = np.where(norms > 0, norms, 1.0).astype(np.float32)
+
+        self.artwork_ids: List[str] = [str(x) for x in artwork_ids]
+        self.artwork_names: List[Optional[str]] = list(artwork_names)
+        self.museum_names: List[Optional[str]] = list(museum_names)
+        self.museum_ids: List[Optional[str]] = [None if x is None else str(x) for x in museum_ids]
+        self.emb: np.ndarray = np.ascontiguousarray(emb / safe[:, None])
+        self.norms: np.ndarray = norms.astype(np.float32)
+        self.index: Dict[str, int] = {aid: i for i, aid in enumerate(self.artwork_ids)}
+
+        # 類似度が NULL になる行（ゼロベクトル）と除外美術館の行
+        # （SQL の org_museum_id != "555555" は NULL の行も落とすので、museum_id が無い行も除外する）
+        self.zero_norm: np.ndarray = norms == 0
+        self.excluded_museum: np.ndarray = np.array(
+            [mid is None or mid == EXCLUDED_MUSEUM_ID for mid in self.museum_ids], dtype=bool
+        )
+        # 美術館ごとの上限（per_museum_cap）用に museum_id を整数化したもの
+        codes: Dict[Optional[str], int] = {}
+        self.museum_codes: np.ndarray = np.fromiter(
+            (codes.setdefault(mid, len(codes)) for mid in self.museum_ids), dtype=np.int32, count=len(self.museum_ids)
+        )
+        self._id_rank: Optional[np.ndarray] = None
+
+        # 近似最近傍インデックス（build_ann で作成。None なら全件探索）
+        self.ann: Optional[IVFIndex] = None
+        self.ann_nprobe: int = 8
+
+        self.quant: Optional[QuantizedEmbeddings] = None
+
+        # 内容のバージョン（snapshot.snapshot_version）と、データの作成時刻（スナップショット作成 / テーブル更新, UNIX 秒）
+        self.version: Optional[str] = None
+        self.created_at: Optional[float] = None
+        # 読み込んだスナップショットのバージョンごとのディレクトリ（snapshot.load_snapshot が設定）
+        self.snapshot_dir: Optional[str] = None
+
+    @classmethod
+    def from_arrays(
+        cls,
+        artwork_ids: Sequence[str],
+        artwork_names: Sequence[Optional[str]],
+        museum_names: Sequence[Optional[str]],
+        museum_ids: Sequence[Optional[str]],
+        emb: np.ndarray,
+        norms: np.ndarray,
+        index: Any,
+        excluded_museum: np.ndarray,
+        museum_codes: np.ndarray,
+        id_rank: np.ndarray,
+    ) -> "Catalog":
+        """
+        前処理済みの配列から作る（snapshot.load_snapshot 用）
+        正規化・ID の対応表作成などの行ごとの処理をしないので、mmap した配列をそのまま渡せる
+        index は artwork_id -> 行番号の get(aid, default) を持つもの
+        """
+        self = cls.__new__(cls)
+        self.artwork_ids = artwork_ids
+        self.artwork_names = artwork_names
+        self.museum_names = museum_names
+        self.museum_ids = museum_ids
+        self.emb = emb
+        self.norms = norms
+        self.index = index
+        self.zero_norm = np.asarray(norms) == 0
+        self.excluded_museum = excluded_museum
+        self.museum_codes = museum_codes
+        self._id_rank = id_rank
+        self.ann = None
+        self.ann_nprobe = 8
+        self.quant = None
+        self.version = None
+        self.created_at = None
+        self.snapshot_dir = None
+        return self
+
+    def __len__(self) -> int:
+        return len(self.artwork_ids)
+
+    @property
+    def dim(self) -> int:
+        return int(self.emb.shape[1])
+
+    @property
+    def id_rank(self) -> np.ndarray:
+        """各行の artwork_id 昇順での順位（同点の並びをベクトル演算で決めるため。初回に作成）"""
+        if self._id_rank is None:
+            order = np.argsort(np.array(self.artwork_ids, dtype=str), kind="stable")
+            rank = np.empty(len(order), dtype=np.int64)
+            rank[order] = np.arange(len(order))
+            self._id_rank = rank
+        return self._id_rank
+
+    def rated_rows(self, ratings: Iterable[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        評価のうちカタログにある作品の (行番号, 重み w = (score - 50) / 50)
+        Ratings（配列表現）なら dict を経由せずに配列のまま変換する
+        """
+        get = self.index.get
+        if isinstance(ratings, Ratings):
+            rows = np.fromiter(
+                (get(aid, -1) for aid in ratings.artwork_ids.tolist()), dtype=np.intp, count=len(ratings)
+            )
+            found = rows >= 0
+            w = (ratings.scores[found].astype(np.float64) - 50) / 50.0
+            return rows[found], w
+
+        rows_list: List[int] = []
+        weights: List[float] = []
+        for r in ratings:
+            i = get(str(r["artwork_id"]))
+            if i is None:
+                continue
+            rows_list.append(i)
+            weights.append((int(r["score"]) - 50) / 50.0)
+        return np.asarray(rows_list, dtype=np.intp), np.asarray(weights, dtype=np.float64)
+
+    def user_profile(self, ratings: Iterable[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        SQL の user_profile と同じ:
+          SUM(w * emb[i]) / NULLIF(SUM(ABS(w)), 0),  w = (score - 50) / 50
+        評価済み作品がカタログに無い / SUM(ABS(w)) = 0 の場合は None
+        """
+        idx, w = self.rated_rows(ratings)
+        if idx.size == 0:
+            return None
+
+        denom = float(np.abs(w).sum())
+        if denom == 0:
+            return None
+
+        # 正規化前のベクトル = emb * norms を float64 で累積する（ProfileStore.rebuild と同じ値）
+        # float32 の行列積だと FMA の丸めで、打ち消し合う評価が 0 にならずに残る
+        raw = self.emb[idx].astype(np.float64) * self.norms[idx, None]
+        return ((w @ raw) / denom).astype(np.float32)
+
+    def unit_profile(self, profile: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        """プロファイルを float64 の単位ベクトルにする（ゼロベクトルなら None）"""
+        if profile is None:
+            return None
+        u = np.asarray(profile, dtype=np.float64)
+        pnorm = float(np.linalg.norm(u))
+        return None if pnorm == 0 else u / pnorm
+
+    def exact_similarities(self, rows: np.ndarray, unit: np.ndarray) -> np.ndarray:
+        """
+        指定行の最終的な類似度（float64、ゼロベクトル行は NaN）
+        BLAS の行列積は並びや件数で丸めが変わるため、行単位の総和で計算して
+        単体 / バッチのどちらから呼んでも同じ値になるようにする
+        """
+        sims = (self.emb[rows].astype(np.float64) * unit).sum(axis=1)
+        sims[self.zero_norm[rows]] = np.nan
+        return sims
+
+    def exclusion_mask(self, rated_ids: Iterable[str]) -> np.ndarray:
+        """recommend2 の除外対象（評価済み作品 + 除外美術館）"""
+        mask = self.excluded_museum.copy()
+        for aid in set(rated_ids):
+            i = self.index.get(aid)
+            if i is not None:
+                mask[i] = True
+        return mask
+
+    def recommend(
+        self,
+        ratings: Iterable[Dict[str, Any]],
+        rated_ids: Iterable[str],
+        k: int = 1,
+        per_museum_cap: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        SQL_RECOMMEND_2 と同じ条件で類似上位 k 件を返す
+        （評価済み作品・除外美術館を除き、similarity DESC / NULL は最後 / 同点は artwork_id 順）
+        per_museum_cap を指定すると同じ美術館からは上位 per_museum_cap 件までにする
+        ANN インデックスがあれば近似探索、無ければ全件探索
+        """
+        return self.recommend_profile(self.user_profile(ratings), rated_ids, k, per_museum_cap)
+
+    def recommend_profile(
+        self,
+        profile: Optional[np.ndarray],
+        rated_ids: Iterable[str],
+        k: int = 1,
+        per_museum_cap: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """作成済みのユーザープロファイルから上位 k 件を返す（recommend の後半）"""
+        if profile is None or len(self) == 0 or k <= 0:
+            return []
+
+        mask = self.exclusion_mask(rated_ids)
+        unit = self.unit_profile(profile)
+        if unit is None:
+            # user_emb がゼロベクトル → 類似度は全て NULL（artwork_id 順）
+            rows = np.flatnonzero(~mask)
+            return self._rank(rows, np.full(rows.size, np.nan), k, per_museum_cap)
+
+        if self.ann is not None:
+            # 上限で k 件に届かなければ、探索する候補数を増やしてやり直す
+            m = k
+            while True:
+                rows, coarse = self.ann.search(
+                    unit.astype(np.float32), m, nprobe=self.ann_nprobe, exclude=mask | self.zero_norm
+                )
+                recs = self._select(rows, coarse, unit, k, cap=per_museum_cap)
+                if len(recs) >= k or rows.size < m or m >= len(self):
+                    return recs
+                m *= 4
+
+        coarse, bound = self._coarse(unit.astype(np.float32))
+        coarse[self.zero_norm] = -np.inf
+        rows = np.flatnonzero(~mask)
+        return self._select(rows, coarse[rows], unit, k, None if bound is None else bound[rows], per_museum_cap)
+
+    def recommend_profiles(
+        self,
+        profiles: Sequence[Optional[np.ndarray]],
+        rated_ids_list: Sequence[Iterable[str]],
+        k: int = 1,
+        chunk: int = 64,
+        per_museum_cap: Optional[int] = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        複数ユーザー分の recommend_profile をまとめて計算する
+        （users × artworks の行列積で粗いスコアを一括計算し、最終値は単体と同じ方法で再計算）
+        ANN 使用時は単体と結果を揃えるため 1 ユーザーずつ計算する
+        """
+        results: List[List[Dict[str, Any]]] = [[] for _ in profiles]
+        units = [self.unit_profile(p) for p in profiles]
+        batched = [j for j, u in enumerate(units) if u is not None] if self.ann is None else []
+        for j in set(range(len(profiles))) - set(batched):
+            results[j] = self.recommend_profile(profiles[j], rated_ids_list[j], k, per_museum_cap)
+        if len(self) == 0 or k <= 0:
+            return results
+
+        for s in range(0, len(batched), chunk):
+            block = batched[s:s + chunk]
+            U = np.stack([units[j] for j in block]).astype(np.float32)
+            coarse, bound = self._coarse(U.T)  # (n, users)
+            coarse[self.zero_norm] = -np.inf
+            for c, j in enumerate(block):
+                rows = np.flatnonzero(~self.exclusion_mask(rated_ids_list[j]))
+                b = None if bound is None else bound[rows, c]
+                results[j] = self._select(rows, coarse[rows, c], units[j], k, b, per_museum_cap)
+        return results
+
+    def rank_candidates(
+        self, profile: Optional[np.ndarray], candidate_ids: Sequence[str]
+    ) -> List[Dict[str, Any]]:
+        """
+        SQL_RECOMMEND_1 の ranked と同じ: 候補作品だけをコサイン類似度で順位付けする
+        （プロファイル無し / カタログに無い作品は similarity = None、NULL は最後、同点は artwork_id 順）
+        """
+        unit = self.unit_profile(profile)
+        scored: List[Dict[str, Any]] = []
+        for aid in candidate_ids:
+            i = self.index.get(aid)
+            sim: Optional[float] = None
+            if i is not None and unit is not None:
+                v = self.exact_similarities(np.array([i]), unit)[0]
+                sim = None if np.isnan(v) else float(v)
+            scored.append({"artwork_id": aid, "similarity": sim})
+
+        scored.sort(key=lambda r: (r["similarity"] is None, -(r["similarity"] or 0.0), r["artwork_id"]))
+        for rank, r in enumerate(scored, start=1):
+            r["rank"] = rank
+        return scored
+
+    def build_ann(self, nlist: Optional[int] = None, nprobe: int = 8, **kwargs: Any) -> None:
+        """IVF インデックスを作成し、以降の recommend を近似探索に切り替える"""
+        self.ann = IVFIndex.build(self.emb, nlist=nlist, **kwargs)
+        self.ann_nprobe = nprobe
+
+    def quantize(self, kind: str, spill_path: Optional[str] = None) -> None:
+        """
+        1 次パスを量子化した埋め込み（int8 / float16）に切り替える。最終的な類似度は従来どおり emb から計算する
+        spill_path を指定すると emb を .npy に書き出して読み取り専用の mmap に置き換え、
+        常駐するのは量子化した配列と再計算で触れた行だけになる（Cloud Run のようにファイルシステムが
+        メモリ上にある環境では効果がないので、ディスク / ボリューム上のパスを指定すること）
+        spill_path が無いと float32 の emb も常駐したままになり、メモリは量子化した配列の分だけ増える
+        """
+        self.quant = QuantizedEmbeddings.from_float(self.emb, kind)
+        if spill_path:
+            # 別名で書いてから置き換える（同じパスを mmap 中の古いカタログは元のファイルを読み続ける）
+            tmp = f"{spill_path}.tmp-{os.getpid()}"
+            with open(tmp, "wb") as f:
+                np.save(f, self.emb)
+            os.replace(tmp, spill_path)
+            self.emb = np.load(spill_path, mmap_mode="r")
+
+    def _coarse(self, query: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """全件の粗いスコアと、真の内積との差の上限（量子化していなければ None）"""
+        if self.quant is None:
+            return self.emb @ query, None
+        return self.quant.scores(query), self.quant.error_bound(query)
+
+    def _select(
+        self,
+        rows: np.ndarray,
+        coarse: np.ndarray,
+        unit: np.ndarray,
+        k: int,
+        bound: Optional[np.ndarray] = None,
+        cap: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        粗いスコア上位（+ 丸め誤差の余裕幅）だけを exact_similarities で再計算して順位付けする
+        bound（量子化誤差の上限）があれば、上限値が k 番目の下限値に届く行を全て残す
+
+        cap（美術館ごとの上限）があるときは上位 m 件（最初は 4k）に絞って選び、
+        k 件に届かない / 最後の 1 件が m 番目の下限値を下回る（絞り込みの外に上位がありうる）ときは
+        m を 4 倍にしてやり直す。全件のソートはしない
+        """
+        if rows.size == 0:
+            return []
+        lower = coarse if bound is None else coarse - bound
+        upper = coarse if bound is None else coarse + bound
+        m = k if cap is None else 4 * k
+        while True:
+            if m >= rows.size:
+                return self._rank(rows, self.exact_similarities(rows, unit), k, cap)
+            mth = np.partition(lower, rows.size - m)[rows.size - m]
+            pool = rows[upper >= mth - RESCORE_MARGIN]
+            sims = self.exact_similarities(pool, unit)
+            recs = self._rank(pool, sims, k, cap)
+            if cap is None:
+                return recs
+            # 絞り込みの外の行は類似度 < mth なので、最後の 1 件が mth 以上なら結果は確定
+            if len(recs) == k and recs[-1]["similarity"] is not None and recs[-1]["similarity"] >= mth:
+                return recs
+            m *= 4
+
+    def _rank(self, rows: np.ndarray, sims: np.ndarray, k: int, cap: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        候補行 rows（類似度 sims, NaN 可）を順位付けして上位 k 件を返す
+        cap を指定すると、順位順に見て同じ美術館の作品は cap 件までにする
+        """
+        if rows.size == 0 or k <= 0:
+            return []
+
+        keys = np.where(np.isnan(sims), -np.inf, sims)
+        if cap is not None:
+            # similarity DESC → artwork_id で並べ、各美術館の cap 件目までを残す
+            order = np.lexsort((self.id_rank[rows], -keys))
+            occurrence = _occurrence(self.museum_codes[rows[order]])
+            return self._records(rows, sims, order[occurrence < cap][:k].tolist())
+
+        k = min(k, rows.size)
+        if k < rows.size:
+            # k 番目の値以上を全て候補に残し、同点の並びを artwork_id で確定させる
+            kth = np.partition(keys, rows.size - k)[rows.size - k]
+            sel = np.flatnonzero(keys >= kth)
+        else:
+            sel = np.arange(rows.size)
+
+        order = sorted(sel.tolist(), key=lambda j: (-keys[j], self.artwork_ids[rows[j]]))[:k]
+        return self._records(rows, sims, order)
+
+    def _records(self, rows: np.ndarray, sims: np.ndarray, order: List[int]) -> List[Dict[str, Any]]:
+        """rows[order] の順にレスポンスの dict を作る"""
+        recs: List[Dict[str, Any]] = []
+        for rank, j in enumerate(order, start=1):
+            i = int(rows[j])
+            sim = sims[j]
+            recs.append(
+                {
+                    "rank": rank,
+                    "artwork_id": self.artwork_ids[i],
+                    "artwork_name": self.artwork_names[i],
+                    "museum_name": self.museum_names[i],
+                    "similarity": None if np.isnan(sim) else float(sim),
+                }
+            )
+        return recs
+
+
+def _occurrence(codes: np.ndarray) -> np.ndarray:
+    """各要素が、先頭からみて同じ値の何回目（0 始まり）の出現か"""
+    idx = np.argsort(codes, kind="stable")
+    sorted_codes = codes[idx]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    group_start = np.repeat(starts, np.diff(np.r_[starts, codes.size]))
+    occurrence = np.empty(codes.size, dtype=np.int64)
+    occurrence[idx] = np.arange(codes.size) - group_start
+    return occurrence
+
+
+SQL_LOAD_CATALOG = """
+SELECT
+  artwork_id,
+  artwork_name,
+  org_museum_name,
+  org_museum_id,
+  caption_embedding.result AS emb
+FROM `{table}`
+WHERE caption_embedding.result IS NOT NULL
+ORDER BY artwork_id
+"""
+
+
+def load_catalog_from_bigquery(bq: Any, table: str) -> Catalog:
+    """artwork_master から埋め込みを一括取得して Catalog を作る（起動時に1回）"""
+    rows = bq.query(SQL_LOAD_CATALOG.format(table=table)).result()
+
+    ids: List[str] = []
+    names: List[Optional[str]] = []
+    museum_names: List[Optional[str]] = []
+    museum_ids: List[Optional[str]] = []
+    vectors: List[List[float]] = []
+    for r in rows:
+        ids.append(str(r["artwork_id"]))
+        names.append(r["artwork_name"])
+        museum_names.append(r["org_museum_name"])
+        museum_ids.append(r["org_museum_id"])
+        vectors.append(list(r["emb"]))
+
+    dim = len(vectors[0]) if vectors else 0
+    emb = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), dim)
+    return Catalog(ids, names, museum_names, museum_ids, emb)
@@ -0,0 +1,89 @@
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import google.auth
+import requests
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import bigquery, firestore
+
+logger = logging.getLogger(__name__)
+
+_SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+
+
+class Clients:
+    """
+    アプリケーション全体で共有する Firestore / BigQuery クライアント
+
+    - FastAPI の lifespan で 1 回だけ作成し、スレッドプールの全ワーカーで共有する
+      （どちらのクライアントもスレッドセーフ）
+    - Firestore は gRPC チャネルを firestore_channels 本用意してラウンドロビンで使う
+      （1 チャネルあたりの同時ストリーム上限で詰まらないように）
+    - BigQuery は HTTP コネクションプールを bq_pool_size 本まで保持する
+    """
+
+    def __init__(self, project: str, firestore_channels: int = 1, bq_pool_size: int = 10):
+        self.project = project
+        self.firestore_channels = max(1, firestore_channels)
+        self.bq_pool_size = max(1, bq_pool_size)
+
+        credentials, _ = google.auth.default(scopes=_SCOPES)
+
+        self._firestore: List[firestore.Client] = [
+            firestore.Client(project=project, credentials=credentials)
+            for _ in range(self.firestore_channels)
+        ]
+        self._rr = itertools.cycle(range(self.firestore_channels))
+        self._rr_lock = threading.Lock()
+
+        session = AuthorizedSession(credentials)
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=self.bq_pool_size, pool_maxsize=self.bq_pool_size
+        )
+        session.mount("https://", adapter)
+        self.bigquery = bigquery.Client(project=project, credentials=credentials, _http=session)
+
+        self.created_at = time.time()
+        self.warmed_up = False
+        self.last_error: Optional[str] = None
+
+    def firestore(self) -> firestore.Client:
+        with self._rr_lock:
+            i = next(self._rr)
+        return self._firestore[i]
+
+    def warm_up(self, bigquery: bool = True) -> None:
+        """
+        起動直後に各チャネル / コネクションを張っておく（認証トークン取得 + TLS ハンドシェイク）
+        ブロッキングなので lifespan ではなく起動後にスレッドで呼ぶ
+        bigquery=False なら BigQuery のクエリジョブは投げない（リクエストで BigQuery を使わない構成用）
+        失敗しても起動は止めず、health で確認できるようにする
+        """
+        try:
+            for db in self._firestore:
+                list(db.collection("users").limit(1).stream())
+            if bigquery:
+                self.bigquery.query("SELECT 1").result()
+            self.warmed_up = True
+            self.last_error = None
+        except Exception as e:
+            logger.exception("client warm-up failed")
+            self.last_error = repr(e)
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "project": self.project,
+            "firestore_channels": self.firestore_channels,
+            "bq_pool_size": self.bq_pool_size,
+            "warmed_up": self.warmed_up,
+            "uptime_sec": round(time.time() - self.created_at, 1),
+            "last_error": self.last_error,
+        }
+
+    def close(self) -> None:
+        for db in self._firestore:
+            db.close()
+        self.bigquery.close()
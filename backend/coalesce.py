@@ -0,0 +1,48 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from fastapi import HTTPException
+
+import metrics
+
+T = TypeVar("T")
+
+
+class Coalescer:
+    """
+    同じキーのリクエストが処理中なら、その結果を待つだけにする（single-flight）
+
+    ツアー客が一斉にアプリを開いたとき、同じ user_id に対する Firestore 読み込み /
+    BigQuery ジョブを 1 回にまとめる。結果の dict は全ての待ち手で共有されるので変更しないこと。
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t, k=key: self._inflight.pop(k, None))
+        else:
+            self.coalesced += 1
+        # 待ち手がキャンセルされても、他の待ち手のために上流の処理は続ける
+        return await asyncio.shield(task)
+
+
+async def run_stage(name: str, fn: Callable[..., T], *args: Any, timeout: Optional[float] = None) -> T:
+    """
+    ブロッキング処理をスレッドで実行し、ステージごとのタイムアウトを適用する
+    タイムアウト時は 504 を返す（スレッド側の処理は最後まで走る）
+    所要時間（スレッドプールの待ちを含む）は name をステージ名として metrics に記録する
+    """
+    with metrics.stage(name):
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(fn, *args), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail=f"{name} timed out after {timeout}s")
@@ -0,0 +1,53 @@
+import hashlib
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+SQL_LOAD_EXPLANATIONS = """
+SELECT
+  artwork_id,
+  level,
+  language,
+  explanation_id
+FROM `{table}`
+ORDER BY artwork_id, level, language, explanation_id
+"""
+
+
+class ExplanationIndex:
+    """
+    explanation_master の (artwork_id, level, language) -> explanation_id 対応表
+
+    batch/make_explanation のジョブで行が増えたときだけ変わるので、起動時に読み込み
+    定期 / 手動で丸ごと作り直して差し替える（読み取り側はロック不要）
+    """
+
+    def __init__(self, rows: List[Tuple[str, str, Optional[str], str]]):
+        self._by_level: Dict[Tuple[str, str], List[Tuple[Optional[str], str]]] = {}
+        h = hashlib.blake2b(digest_size=8)
+        for artwork_id, level, language, explanation_id in rows:
+            self._by_level.setdefault((str(artwork_id), str(level)), []).append(
+                (language, str(explanation_id))
+            )
+            h.update(f"{artwork_id}\0{level}\0{language}\0{explanation_id}\n".encode())
+        self.size = len(rows)
+        self.loaded_at = time.time()
+        # 行の内容から作るバージョン（同じ内容を読み直しても変わらない。ETag 用）
+        self.version = h.hexdigest()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def lookup(self, artwork_id: str, level: str, language: Optional[str] = None) -> List[str]:
+        """
+        該当する explanation_id の一覧（無ければ空）
+        language 未指定なら全言語分（SQL_RECOMMEND_1 の LEFT JOIN と同じく言語で絞らない）
+        """
+        entries = self._by_level.get((artwork_id, level), [])
+        return [eid for lang, eid in entries if language is None or lang == language]
+
+
+def load_explanation_index(bq: Any, table: str) -> ExplanationIndex:
+    rows = bq.query(SQL_LOAD_EXPLANATIONS.format(table=table)).result()
+    return ExplanationIndex(
+        [(r["artwork_id"], r["level"], r["language"], r["explanation_id"]) for r in rows]
+    )
@@ -0,0 +1,197 @@
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 秒単位のバケット（Firestore 数 ms 〜 BigQuery 数十秒までを想定）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _num(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram:
+    """Prometheus のヒストグラム（累積バケット + _sum + _count）"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...], buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # labels -> [バケットごとの件数..., sum, count]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+            for i, le in enumerate(self.buckets):
+                if value <= le:
+                    s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((k, list(v)) for k, v in self._series.items())
+        for labels, s in series:
+            for le, n in zip(self.buckets, s):
+                bucket = _labels(self.labelnames, labels, 'le="%s"' % _num(le))
+                lines.append(f"{self.name}_bucket{bucket} {_num(n)}")
+            bucket = _labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket} {_num(s[-1])}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_num(s[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {_num(s[-1])}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...]):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, labels: Tuple[str, ...], value: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, v in values:
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_num(v)}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "recommend_request_seconds", "Request latency by endpoint.", ("endpoint",)
+)
+STAGE_SECONDS = Histogram(
+    "recommend_stage_seconds", "Latency of each stage of the request path.", ("endpoint", "stage")
+)
+BQ_BYTES_PROCESSED = Counter(
+    "recommend_bigquery_bytes_processed_total", "BigQuery totalBytesProcessed.", ("endpoint",)
+)
+BQ_BYTES_BILLED = Counter(
+    "recommend_bigquery_bytes_billed_total", "BigQuery totalBytesBilled.", ("endpoint",)
+)
+BQ_SLOT_MS = Counter("recommend_bigquery_slot_ms_total", "BigQuery totalSlotMs.", ("endpoint",))
+BQ_JOBS = Counter("recommend_bigquery_jobs_total", "BigQuery query jobs.", ("endpoint",))
+
+_METRICS = (REQUEST_SECONDS, STAGE_SECONDS, BQ_BYTES_PROCESSED, BQ_BYTES_BILLED, BQ_SLOT_MS, BQ_JOBS)
+
+
+def render() -> str:
+    """/metrics の本文（Prometheus text format 0.0.4）"""
+    lines: List[str] = []
+    for m in _METRICS:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+class RequestTimer:
+    """1 リクエスト分のステージ所要時間（スローリクエストログ用）"""
+
+    def __init__(self, endpoint: str, user_id: Optional[str]):
+        self.endpoint = endpoint
+        self.user_id = user_id
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = defaultdict(float)
+        self.bigquery: Dict[str, int] = defaultdict(int)
+        self.fields: Dict[str, Any] = {}
+
+
+# asyncio.to_thread / create_task はコンテキストをコピーするので、スレッド内のステージもここに記録される
+_CURRENT: ContextVar[Optional[RequestTimer]] = ContextVar("request_timer", default=None)
+
+
+def _endpoint() -> str:
+    req = _CURRENT.get()
+    return req.endpoint if req is not None else "-"
+
+
+@contextmanager
+def request(endpoint: str, user_id: Optional[str] = None, slow_ms: float = 0.0) -> Iterator[RequestTimer]:
+    """
+    リクエスト全体を計測する。slow_ms を超えたらステージ内訳を JSON 1 行でログに出す（0 で無効）
+    """
+    req = RequestTimer(endpoint, user_id)
+    token = _CURRENT.set(req)
+    try:
+        yield req
+    finally:
+        _CURRENT.reset(token)
+        elapsed = time.perf_counter() - req.started
+        REQUEST_SECONDS.observe((endpoint,), elapsed)
+        if slow_ms > 0 and elapsed * 1000 >= slow_ms:
+            logger.warning(json.dumps({
+                "event": "slow_request",
+                "endpoint": endpoint,
+                "user_id": user_id,
+                "total_ms": round(elapsed * 1000, 3),
+                "stages_ms": {k: round(v * 1000, 3) for k, v in sorted(req.stages.items())},
+                "bigquery": dict(req.bigquery),
+                **req.fields,
+            }, ensure_ascii=False))
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """処理中リクエストのエンドポイントをラベルにしてステージの所要時間を記録する"""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        STAGE_SECONDS.observe((_endpoint(), name), dt)
+        req = _CURRENT.get()
+        if req is not None:
+            req.stages[name] += dt
+
+
+def record_bigquery_job(job: Any) -> None:
+    """QueryJob の統計（処理 / 課金バイト数, slot-ms）をカウンタに加える（キャッシュヒット等で None なら 0）"""
+    labels = (_endpoint(),)
+    processed = getattr(job, "total_bytes_processed", None) or 0
+    billed = getattr(job, "total_bytes_billed", None) or 0
+    slot_ms = getattr(job, "slot_millis", None) or 0
+    BQ_JOBS.inc(labels)
+    BQ_BYTES_PROCESSED.inc(labels, processed)
+    BQ_BYTES_BILLED.inc(labels, billed)
+    BQ_SLOT_MS.inc(labels, slot_ms)
+    req = _CURRENT.get()
+    if req is not None:
+        req.bigquery["bytes_processed"] += int(processed)
+        req.bigquery["bytes_billed"] += int(billed)
+        req.bigquery["slot_ms"] += int(slot_ms)
+
+
+def annotate(**fields: Any) -> None:
+    """処理中リクエストのスローリクエストログに項目を追加する（キャッシュ状態など）"""
+    req = _CURRENT.get()
+    if req is not None:
+        req.fields.update(fields)
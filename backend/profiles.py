@@ -0,0 +1,226 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from catalog import Catalog
+from ratings import Ratings
+
+
+class UserProfile:
+    """
+    ユーザープロファイルの増分表現
+
+    - weighted_sum : SUM(w * emb)（正規化前の埋め込み、float64 で累積）
+    - abs_weight   : SUM(ABS(w))
+    - scores       : artwork_id -> score（カタログ外の作品も除外判定用に保持）
+    - updated_at   : 反映済みの users/{id}.preferencesUpdatedAt（UNIX 秒）
+    profile = weighted_sum / abs_weight（SQL の user_profile と同じ）
+    """
+
+    __slots__ = ("weighted_sum", "abs_weight", "scores", "loaded_at", "updated_at")
+
+    def __init__(self, dim: int, updated_at: float = 0.0):
+        self.weighted_sum = np.zeros(dim, dtype=np.float64)
+        self.abs_weight = 0.0
+        self.scores: Dict[str, int] = {}
+        self.loaded_at = time.time()
+        self.updated_at = updated_at
+
+    def vector(self) -> Optional[np.ndarray]:
+        # 差分更新の丸め誤差で 0 付近に残った値も NULLIF(…, 0) 相当として扱う
+        if self.abs_weight <= 1e-9:
+            return None
+        return (self.weighted_sum / self.abs_weight).astype(np.float32)
+
+    @property
+    def rated_ids(self) -> List[str]:
+        return list(self.scores)
+
+
+def _weight(score: int) -> float:
+    return (score - 50) / 50.0
+
+
+class ProfileStore:
+    """
+    ユーザーごとのプロファイルを保持し、嗜好 1 件の追加・変更を O(d) で反映する
+
+    - 未ロード（cold）のユーザーだけ load_user_ratings から全件再構築する
+    - Firestore の preferencesUpdatedAt が反映済みの値より新しければ cold 扱い
+      （フロントが Firestore に直接書いた分を拾うため）
+    - max_age 秒を過ぎたプロファイルも cold 扱い（preferencesUpdatedAt を更新しない書き込みへの保険）
+    - max_users を超えたら LRU で追い出す
+    """
+
+    def __init__(self, catalog: Catalog, max_users: int = 10_000, max_age: float = 300.0):
+        self.catalog = catalog
+        self.max_users = max_users
+        self.max_age = max_age
+        self._profiles: "OrderedDict[str, UserProfile]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+    def get(self, user_id: str, updated_at: float = 0.0) -> Optional[UserProfile]:
+        """
+        ウォームなプロファイルを返す（無い / 古い場合は None）
+        updated_at: いま Firestore にある preferencesUpdatedAt（これより前の状態なら古いとみなす）
+        """
+        with self._lock:
+            p = self._profiles.get(user_id)
+            if p is None:
+                return None
+            if updated_at > p.updated_at or (self.max_age > 0 and time.time() - p.loaded_at > self.max_age):
+                del self._profiles[user_id]
+                return None
+            self._profiles.move_to_end(user_id)
+            return p
+
+    def rebuild(self, user_id: str, ratings: Iterable[Dict[str, Any]], updated_at: float = 0.0) -> UserProfile:
+        """
+        全件から作り直す（cold 時のみ, O(n·d)）
+        updated_at には ratings を読む前に読んだ preferencesUpdatedAt を渡す
+        """
+        p = UserProfile(self.catalog.dim, updated_at)
+        if isinstance(ratings, Ratings):
+            p.scores = dict(ratings.items())
+        else:
+            p.scores = {str(r["artwork_id"]): int(r["score"]) for r in ratings}
+
+        idx, w = self.catalog.rated_rows(ratings)
+        if idx.size:
+            raw = self.catalog.emb[idx].astype(np.float64) * self.catalog.norms[idx, None]
+            p.weighted_sum = w @ raw
+            p.abs_weight = float(np.abs(w).sum())
+
+        self._put(user_id, p)
+        return p
+
+    def set_score(
+        self,
+        user_id: str,
+        artwork_id: str,
+        score: int,
+        updated_at: Optional[float] = None,
+        previous: float = 0.0,
+    ) -> Optional[UserProfile]:
+        """
+        嗜好 1 件の追加・変更を差分で反映する（O(d)）
+        プロファイルが未ロードなら何もしない（次回アクセス時に全件ロードされる）
+        updated_at : この書き込みで付いた preferencesUpdatedAt（反映済みの値として記録する）
+        previous   : 書き込み直前の preferencesUpdatedAt。プロファイルがそれより古ければ
+                     他の書き込みを取りこぼしているので、差分反映せずに破棄する
+        """
+        with self._lock:
+            p = self._profiles.get(user_id)
+            if p is None:
+                return None
+            if previous > p.updated_at:
+                del self._profiles[user_id]
+                return None
+            if updated_at is not None:
+                p.updated_at = max(p.updated_at, updated_at)
+
+            aid = str(artwork_id)
+            old = p.scores.get(aid)
+            p.scores[aid] = int(score)
+
+            i = self.catalog.index.get(aid)
+            if i is not None:
+                w_new = _weight(int(score))
+                w_old = _weight(old) if old is not None else 0.0
+                raw = self.catalog.emb[i].astype(np.float64) * float(self.catalog.norms[i])
+                p.weighted_sum += (w_new - w_old) * raw
+                p.abs_weight += abs(w_new) - abs(w_old)
+            return p
+
+    def remove_score(self, user_id: str, artwork_id: str) -> Optional[UserProfile]:
+        """嗜好 1 件の削除を差分で反映する"""
+        with self._lock:
+            p = self._profiles.get(user_id)
+            if p is None:
+                return None
+
+            aid = str(artwork_id)
+            old = p.scores.pop(aid, None)
+            i = self.catalog.index.get(aid)
+            if old is not None and i is not None:
+                w_old = _weight(old)
+                raw = self.catalog.emb[i].astype(np.float64) * float(self.catalog.norms[i])
+                p.weighted_sum -= w_old * raw
+                p.abs_weight -= abs(w_old)
+            return p
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._profiles.pop(user_id, None)
+
+    def check(self, user_id: str, rtol: float = 1e-4, atol: float = 1e-6) -> bool:
+        """保持している差分更新済みプロファイルと、全件再計算の結果が一致するか"""
+        p = self.get(user_id)
+        if p is None:
+            return True
+        ratings = [{"artwork_id": a, "score": s} for a, s in p.scores.items()]
+        expected = self.catalog.user_profile(ratings)
+        got = p.vector()
+        if expected is None or got is None:
+            return expected is None and got is None
+        return bool(np.allclose(got, expected, rtol=rtol, atol=atol))
+
+    def save(self, path: str) -> None:
+        """
+        npz 形式で保存する
+        ベクトルは (users, d) float32、評価は CSR 風に id 配列 + int16 スコア配列
+        """
+        with self._lock:
+            items = list(self._profiles.items())
+
+        user_ids = np.array([u for u, _ in items], dtype=object)
+        sums = np.zeros((len(items), self.catalog.dim), dtype=np.float32)
+        for n, (_, p) in enumerate(items):
+            sums[n] = p.weighted_sum
+        abs_w = np.array([p.abs_weight for _, p in items], dtype=np.float64)
+        updated_at = np.array([p.updated_at for _, p in items], dtype=np.float64)
+        offsets = np.zeros(len(items) + 1, dtype=np.int64)
+        np.cumsum([len(p.scores) for _, p in items], out=offsets[1:])
+        rated = np.array([a for _, p in items for a in p.scores], dtype=object)
+        scores = np.array([s for _, p in items for s in p.scores.values()], dtype=np.int16)
+
+        np.savez(
+            path,
+            user_ids=user_ids.astype(str),
+            sums=sums,
+            abs_w=abs_w,
+            updated_at=updated_at,
+            offsets=offsets,
+            rated=rated.astype(str),
+            scores=scores,
+        )
+
+    def load(self, path: str) -> int:
+        """save したファイルを読み込み、読み込んだユーザー数を返す"""
+        data = np.load(path, allow_pickle=False)
+        user_ids, sums, abs_w = data["user_ids"], data["sums"], data["abs_w"]
+        offsets, rated, scores = data["offsets"], data["rated"], data["scores"]
+        # updated_at の無い古いファイルは 0（次のアクセスで preferencesUpdatedAt があれば作り直す）
+        updated_at = data["updated_at"] if "updated_at" in data.files else np.zeros(len(user_ids))
+
+        for n, user_id in enumerate(user_ids.tolist()):
+            p = UserProfile(self.catalog.dim, float(updated_at[n]))
+            p.weighted_sum = sums[n].astype(np.float64)
+            p.abs_weight = float(abs_w[n])
+            lo, hi = offsets[n], offsets[n + 1]
+            p.scores = dict(zip(rated[lo:hi].tolist(), scores[lo:hi].astype(int).tolist()))
+            self._put(user_id, p)
+        return len(user_ids)
+
+    def _put(self, user_id: str, p: UserProfile) -> None:
+        with self._lock:
+            self._profiles[user_id] = p
+            self._profiles.move_to_end(user_id)
+            while len(self._profiles) > self.max_users:
+                self._profiles.popitem(last=False)
@@ -0,0 +1,80 @@
+import numpy as np
+
+KINDS = ("float16", "int8")
+
+# float16 の丸め誤差（相対値, 2^-11）
+_FLOAT16_EPS = float(np.finfo(np.float16).eps) / 2
+
+
+class QuantizedEmbeddings:
+    """
+    1 次パス（粗いスコアリング）用に量子化した埋め込み
+
+    - int8    : 行ごとのスケール s = max|x| / 127 で x ≈ s * code（1 byte/次元）
+    - float16 : そのまま半精度（2 byte/次元, スケールは 1）。NumPy の半精度→単精度変換が遅いので
+                1 次パスの latency は float32 より悪化する（メモリ優先のとき用）
+    scores は真の内積との差の上限（error_bound）と合わせて使う:
+    上限内に収まる候補だけを元の精度で再計算すれば、順位は量子化前と一致する。
+    """
+
+    def __init__(self, kind: str, codes: np.ndarray, scales: np.ndarray, block_rows: int = 256):
+        if kind not in KINDS:
+            raise ValueError(f"unknown embedding store: {kind}")
+        self.kind = kind
+        self.codes = codes  # (n, d) int8 / float16
+        self.scales = scales  # (n,) float32
+        self.block_rows = block_rows
+
+    @classmethod
+    def from_float(cls, emb: np.ndarray, kind: str = "int8", block_rows: int = 256) -> "QuantizedEmbeddings":
+        n, d = emb.shape
+        if kind == "float16":
+            codes = np.empty((n, d), dtype=np.float16)
+            for s in range(0, n, block_rows):
+                codes[s:s + block_rows] = emb[s:s + block_rows]
+            return cls(kind, codes, np.ones(n, dtype=np.float32), block_rows)
+        if kind != "int8":
+            raise ValueError(f"unknown embedding store: {kind}")
+
+        codes = np.empty((n, d), dtype=np.int8)
+        scales = np.zeros(n, dtype=np.float32)
+        for s in range(0, n, block_rows):
+            block = np.asarray(emb[s:s + block_rows], dtype=np.float32)
+            scale = np.abs(block).max(axis=1) / 127.0 if d else np.zeros(block.shape[0], dtype=np.float32)
+            safe = np.where(scale > 0, scale, 1.0)
+            codes[s:s + block_rows] = np.clip(np.rint(block / safe[:, None]), -127, 127)
+            scales[s:s + block_rows] = scale
+        return cls(kind, codes, scales, block_rows)
+
+    def __len__(self) -> int:
+        return int(self.codes.shape[0])
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + self.scales.nbytes)
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """
+        量子化したまま内積を計算する（query: (d,) または (d, m), 戻り値 float32）
+        float32 への展開はキャッシュに収まる行数のブロック単位で行い、全件分の一時配列は作らない
+        """
+        q = np.asarray(query, dtype=np.float32)
+        out = np.empty((len(self),) + q.shape[1:], dtype=np.float32)
+        for s in range(0, len(self), self.block_rows):
+            block = self.codes[s:s + self.block_rows].astype(np.float32)
+            out[s:s + self.block_rows] = block @ q
+        if self.kind == "int8":
+            out *= self.scales.reshape((-1,) + (1,) * (q.ndim - 1))
+        return out
+
+    def error_bound(self, query: np.ndarray) -> np.ndarray:
+        """
+        |scores - 真の内積| の上限（行ごと, query の列ごと）
+          int8    : 要素ごとの誤差 <= s/2 より  s/2 * ||q||_1
+          float16 : 相対誤差 <= 2^-11 より    2^-11 * ||x||_2 * ||q||_2（行は正規化済み）
+        """
+        q = np.asarray(query, dtype=np.float32)
+        if self.kind == "int8":
+            return 0.5 * self.scales.reshape((-1,) + (1,) * (q.ndim - 1)) * np.abs(q).sum(axis=0)
+        bound = np.float32(_FLOAT16_EPS) * np.linalg.norm(q, axis=0)
+        return np.broadcast_to(bound, (len(self),) + q.shape[1:]).astype(np.float32)
@@ -0,0 +1,61 @@
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Tuple
+
+import numpy as np
+
+
+def parse_score(score_raw: Any) -> int:
+    """Firestore の score を int にする（変換できなければ 0）"""
+    try:
+        return int(score_raw)
+    except (ValueError, TypeError):
+        return 0
+
+
+class Ratings:
+    """
+    ユーザー 1 人分の嗜好を配列で持つ（artwork_id の配列 + int16 の score 配列）
+
+    dict のリスト → JSON → BigQuery で再パース、という往復をせず、そのままスコアリングに渡す
+    """
+
+    __slots__ = ("artwork_ids", "scores")
+
+    def __init__(self, artwork_ids: np.ndarray, scores: np.ndarray):
+        self.artwork_ids = artwork_ids
+        self.scores = scores
+
+    @classmethod
+    def from_pairs(cls, pairs: Iterable[Tuple[str, int]]) -> "Ratings":
+        ids: List[str] = []
+        scores: List[int] = []
+        for aid, score in pairs:
+            ids.append(str(aid))
+            scores.append(score)
+        return cls(
+            np.array(ids, dtype=str),
+            np.clip(np.array(scores, dtype=np.int64), -32768, 32767).astype(np.int16),
+        )
+
+    @classmethod
+    def from_map(cls, scores: Mapping[str, Any]) -> "Ratings":
+        """非正規化ドキュメントの {artwork_id: score} から作る"""
+        return cls.from_pairs((aid, parse_score(s)) for aid, s in scores.items())
+
+    def __len__(self) -> int:
+        return int(self.artwork_ids.shape[0])
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        # 既存の dict 形式（{"artwork_id", "score"}）としても扱えるようにする
+        for aid, score in self.items():
+            yield {"artwork_id": aid, "score": score}
+
+    def items(self) -> Iterator[Tuple[str, int]]:
+        return zip(self.artwork_ids.tolist(), self.scores.tolist())
+
+    @property
+    def rated_ids(self) -> List[str]:
+        return self.artwork_ids.tolist()
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """BigQuery フォールバック用（ratings_json の元）"""
+        return list(self)
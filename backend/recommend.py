@@ -0,0 +1,187 @@
+import math
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from catalog import Catalog
+from explanations import ExplanationIndex
+
+# 対象10作品
+CANDIDATE_IDS: List[str] = [
+    "435621",
+    "435807",
+    "435844",
+    "436596",
+    "436947",
+    "437881",
+    "437903",
+]
+
+# museum_id を指定しない recommend1 の候補セット（CANDIDATE_IDS）
+DEFAULT_SET_ID = "default"
+
+# level の割合（上位 30%: "3" / 下位 30%: "1" / 残り: "2"）。10 件なら 3 / 4 / 3 件
+LEVEL_TOP_FRACTION = 0.3
+LEVEL_BOTTOM_FRACTION = 0.3
+
+
+def level_counts(n: int) -> Tuple[int, int]:
+    """候補 n 件のうち level "3" / "1" にする件数（四捨五入, 合計は n 以下）"""
+    n_top = min(n, int(math.floor(n * LEVEL_TOP_FRACTION + 0.5)))
+    n_bottom = min(n - n_top, int(math.floor(n * LEVEL_BOTTOM_FRACTION + 0.5)))
+    return n_top, n_bottom
+
+
+def level_for_rank(rank: int, n: int) -> str:
+    """上位: "3" / 下位: "1" / それ以外: "2"（SQL_RECOMMEND_1 の with_level と同じ）"""
+    n_top, n_bottom = level_counts(n)
+    if rank <= n_top:
+        return "3"
+    if rank > n - n_bottom:
+        return "1"
+    return "2"
+
+
+class CandidateSet:
+    """
+    recommend1 の候補作品（美術館のフロア / 展覧会）と、その埋め込みの部分行列
+
+    - artwork_ids : 候補の並び（レスポンスの順序）。カタログに無い ID も残す（similarity = None）
+    - emb         : (m, d) float32 の部分行列（Catalog.emb から切り出して連続領域に保持）
+    - null        : 類似度が NULL になる候補（カタログに無い / ゼロベクトル）
+    - id_rank     : artwork_id の昇順での順位（同点の並びを SQL と揃える）
+    """
+
+    __slots__ = ("set_id", "artwork_ids", "artwork_names", "emb", "null", "id_rank")
+
+    def __init__(self, catalog: Catalog, set_id: str, artwork_ids: Sequence[str]):
+        ids = [str(a) for a in artwork_ids]
+        rows = np.array([catalog.index.get(a, -1) for a in ids], dtype=np.intp)
+        found = rows >= 0
+
+        self.set_id = set_id
+        self.artwork_ids: List[str] = ids
+        self.artwork_names: List[Optional[str]] = [
+            catalog.artwork_names[i] if i >= 0 else None for i in rows.tolist()
+        ]
+        emb = np.zeros((len(ids), catalog.dim), dtype=np.float32)
+        emb[found] = catalog.emb[rows[found]]
+        self.emb: np.ndarray = emb
+        self.null: np.ndarray = ~found
+        self.null[found] |= catalog.zero_norm[rows[found]]
+        self.id_rank: np.ndarray = np.argsort(np.argsort(np.array(ids, dtype=str), kind="stable"), kind="stable")
+
+    def __len__(self) -> int:
+        return len(self.artwork_ids)
+
+    def rank(self, unit: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        候補ごとの (順位 1..m, 類似度 float64・NULL は NaN)
+        類似度は Catalog.exact_similarities と同じ計算（行単位の float64 総和）なので値も一致する
+        """
+        m = len(self)
+        if unit is None:
+            sims = np.full(m, np.nan)
+        else:
+            # float32 * float64 は要素ごとに float64 へ拡張される（astype してから掛けるのと同じ値）
+            sims = (self.emb * unit).sum(axis=1)
+            sims[self.null] = np.nan
+
+        # similarity DESC（NULL は最後）→ artwork_id
+        keys = np.where(np.isnan(sims), -np.inf, sims)
+        order = np.lexsort((self.id_rank, -keys))
+        ranks = np.empty(m, dtype=np.intp)
+        ranks[order] = np.arange(1, m + 1)
+        return ranks, sims
+
+
+class CandidateRegistry:
+    """
+    候補セット ID（museum_id / 展覧会 ID）-> CandidateSet
+
+    カタログの org_museum_id ごとのセットに、設定ファイルの展覧会セットと
+    DEFAULT_SET_ID（CANDIDATE_IDS）を加えて起動時に作る。カタログを差し替えるときは作り直す
+    美術館ごとのセットは行番号だけ持っておき、部分行列は初回の get で作る（起動時間を件数に依存させない）
+    """
+
+    def __init__(
+        self,
+        catalog: Catalog,
+        sets: Mapping[str, CandidateSet],
+        museum_rows: Optional[Mapping[str, np.ndarray]] = None,
+    ):
+        self._catalog = catalog
+        self._sets: Dict[str, CandidateSet] = dict(sets)
+        self._museum_rows: Dict[str, np.ndarray] = dict(museum_rows or {})
+
+    def __len__(self) -> int:
+        return len(self._sets.keys() | self._museum_rows.keys())
+
+    def get(self, set_id: str) -> Optional[CandidateSet]:
+        candidates = self._sets.get(set_id)
+        if candidates is None and set_id in self._museum_rows:
+            rows = self._museum_rows[set_id]
+            ids = sorted(self._catalog.artwork_ids[i] for i in rows.tolist())
+            # 同時に作られても同じ内容なので、後勝ちで構わない
+            candidates = self._sets.setdefault(set_id, CandidateSet(self._catalog, set_id, ids))
+        return candidates
+
+    @classmethod
+    def build(
+        cls,
+        catalog: Catalog,
+        extra: Optional[Mapping[str, Sequence[str]]] = None,
+        max_size: int = 2000,
+    ) -> "CandidateRegistry":
+        """
+        美術館ごとのセットは作品数 max_size 以下のものだけ作る（部分行列の合計はカタログ以下）
+        extra は {set_id: [artwork_id, ...]}（同じ ID の美術館セットより優先）
+        """
+        codes = np.asarray(catalog.museum_codes)
+        order = np.argsort(codes, kind="stable")
+        starts = np.flatnonzero(np.r_[True, codes[order][1:] != codes[order][:-1]]) if codes.size else []
+        museum_rows: Dict[str, np.ndarray] = {}
+        for start, end in zip(starts, list(starts[1:]) + [codes.size]):
+            rows = order[start:end]
+            mid = catalog.museum_ids[int(rows[0])]
+            if mid is not None and rows.size <= max_size:
+                museum_rows[mid] = rows
+
+        sets: Dict[str, CandidateSet] = {}
+        for set_id, ids in (extra or {}).items():
+            sets[str(set_id)] = CandidateSet(catalog, str(set_id), ids)
+        sets[DEFAULT_SET_ID] = CandidateSet(catalog, DEFAULT_SET_ID, CANDIDATE_IDS)
+        return cls(catalog, sets, museum_rows)
+
+
+def build_recommend1(
+    catalog: Catalog,
+    explanations: ExplanationIndex,
+    profile: Optional[np.ndarray],
+    candidates: Union[CandidateSet, Sequence[str]],
+) -> List[Dict[str, Any]]:
+    """
+    SQL_RECOMMEND_1 と同じ結果をメモリ上で作る
+    候補をランキング → level 付け → explanation_id 対応表を引く（候補の並び順で返す）
+    """
+    if not isinstance(candidates, CandidateSet):
+        candidates = CandidateSet(catalog, "", candidates)
+    ranks, sims = candidates.rank(catalog.unit_profile(profile))
+    n = len(candidates)
+    n_top, n_bottom = level_counts(n)
+
+    recs: List[Dict[str, Any]] = []
+    for aid, name, rank, sim in zip(candidates.artwork_ids, candidates.artwork_names, ranks.tolist(), sims.tolist()):
+        level = "3" if rank <= n_top else "1" if rank > n - n_bottom else "2"
+        sim = None if sim != sim else sim  # NaN -> None
+        for explanation_id in explanations.lookup(aid, level) or [None]:
+            recs.append(
+                {
+                    "artwork_id": aid,
+                    "artwork_name": name,
+                    "similarity": sim,
+                    "level": level,  # "1" / "2" / "3"
+                    "explanation_id": explanation_id,  # 見つからない場合は None
+                }
+            )
+    return recs
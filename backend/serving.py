@@ -0,0 +1,94 @@
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recommendations (
+  user_id     TEXT NOT NULL,
+  endpoint    TEXT NOT NULL,
+  computed_at REAL NOT NULL,  -- 嗜好を読み込んだ時刻（UNIX 秒）
+  version     TEXT NOT NULL,  -- preferences_version
+  payload     TEXT NOT NULL,  -- レスポンス JSON
+  data_version TEXT,          -- 計算に使ったカタログ / 解説の対応表のバージョン（data_version_of）
+  PRIMARY KEY (user_id, endpoint)
+) WITHOUT ROWID;
+"""
+
+
+def data_version_of(catalog_version: str, explanations_version: Optional[str] = None) -> str:
+    """
+    結果が依存するデータのバージョン（recommend1 はカタログ + 解説の対応表, recommend2 はカタログのみ）
+    backend の ETag と事前計算の照合の両方で同じ形式を使う
+    """
+    if explanations_version is None:
+        return catalog_version
+    return f"{catalog_version}:{explanations_version}"
+
+
+class PrecomputedEntry:
+    __slots__ = ("payload", "version", "computed_at", "data_version")
+
+    def __init__(self, payload: Dict[str, Any], version: str, computed_at: float, data_version: Optional[str] = None):
+        self.payload = payload
+        self.version = version
+        self.computed_at = computed_at
+        self.data_version = data_version
+
+
+class ServingStore:
+    """
+    batch/precompute_recommendations が書き出す事前計算済みレコメンド（SQLite）
+
+    エンドポイントはまずここを引き、ユーザーの最終嗜好更新（preferencesUpdatedAt）より
+    computed_at が新しく、data_version が読み込み中のカタログ / 解説と一致すればそのまま返す。
+    どちらかが合わなければライブ計算にフォールバックする。
+    data_version 列の無い古いファイルは、書き込み時に列を足す（読み取り専用で開いた場合は全行 None）
+    """
+
+    def __init__(self, path: str, readonly: bool = True):
+        self.path = path
+        uri = f"file:{path}?mode=ro" if readonly else f"file:{path}"
+        self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        if not readonly:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(recommendations)")}
+        if "data_version" not in columns and not readonly:
+            with self._conn:
+                self._conn.execute("ALTER TABLE recommendations ADD COLUMN data_version TEXT")
+            columns.add("data_version")
+        self._data_version_column = "data_version" if "data_version" in columns else "NULL"
+
+    def get(self, endpoint: str, user_id: str) -> Optional[PrecomputedEntry]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT payload, version, computed_at, {self._data_version_column} FROM recommendations "
+                "WHERE user_id = ? AND endpoint = ?",
+                (user_id, endpoint),
+            ).fetchone()
+        if row is None:
+            return None
+        return PrecomputedEntry(json.loads(row[0]), row[1], row[2], row[3])
+
+    def put_many(self, rows: Iterable[Tuple[str, str, float, str, str, Dict[str, Any]]]) -> int:
+        """(user_id, endpoint, computed_at, version, data_version, payload) をまとめて書き込む"""
+        data = [
+            (user_id, endpoint, computed_at, version, json.dumps(payload, ensure_ascii=False), data_version)
+            for user_id, endpoint, computed_at, version, data_version, payload in rows
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO recommendations "
+                "(user_id, endpoint, computed_at, version, payload, data_version) VALUES (?, ?, ?, ?, ?, ?)",
+                data,
+            )
+        return len(data)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM recommendations").fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,315 @@
+"""
+作品カタログのスナップショット（ディレクトリ 1 つ, 各配列は .npy で mmap 読み込み）
+
+  {path}                  {path}.versions/<name> へのシンボリックリンク（書き出しごとに付け替える）
+  {path}.versions/<name>  書き出したバージョンごとのディレクトリ（中身は以下）
+
+  manifest.json           形式 / 件数 / 次元 / バージョン / 作成元
+  emb.npy                 (n, d) float32 正規化済み埋め込み
+  norms.npy               (n,) float32 正規化前のノルム
+  artwork_ids.npy         (n,) S 固定長 UTF-8（artwork_id 昇順に並んだ ID の検索用）
+  id_order.npy            (n,) int64 artwork_ids.npy の各要素の行番号
+  id_rank.npy             (n,) int64 各行の artwork_id 昇順での順位
+  museum_codes.npy        (n,) int32 museum_id を整数化したもの
+  excluded_museum.npy     (n,) bool
+  {column}.blob.npy       文字列列（UTF-8 を連結）: artwork_id / artwork_name / museum_name / museum_id
+  {column}.offsets.npy    (n + 1,) int64 各行の blob 内の範囲
+  {column}.null.npy       (n,) bool NULL の行
+
+  quant-{kind}.codes.npy  量子化した 1 次パス用の埋め込み（load_quantized が初回に作成）
+  quant-{kind}.scales.npy
+
+読み込みは np.load(mmap_mode="r") だけで、行ごとの Python 処理をしない（起動時間は件数にほぼ依存しない）。
+batch/export_catalog_snapshot が artwork_master から作成する。
+
+mmap は読み取り専用の共有マッピングなので、同じスナップショットを開いた複数のワーカープロセスは
+ページキャッシュ上の 1 つのコピーを共有する（ワーカー数を増やしても埋め込みの分のメモリは増えない）。
+open_shared / load_quantized は書き出しを {path}.lock の排他ロックで 1 プロセスに限定する。
+
+公開は新しいバージョンのディレクトリを書き終えてからリンクを rename(2) で置き換える 1 回の操作なので、
+読み手は常に古い / 新しいどちらかの完全なスナップショットを見る（manifest.json が無い瞬間がない）。
+読み手はリンクを 1 回だけ解決し、以降の読み込みは同じバージョンのディレクトリから行う。
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from catalog import Catalog
+from quantize import QuantizedEmbeddings
+
+SNAPSHOT_FORMAT = 1
+MANIFEST = "manifest.json"
+# 公開中の 1 つ前のバージョンまで残す（リンクを解決した直後の読み手がまだ開いている可能性があるため）
+KEEP_VERSIONS = 2
+STRING_COLUMNS = ("artwork_ids", "artwork_names", "museum_names", "museum_ids")
+
+
+class StringColumn:
+    """mmap した UTF-8 の連結 + オフセットを list[Optional[str]] のように読む"""
+
+    __slots__ = ("blob", "offsets", "nulls")
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray, nulls: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+        self.nulls = nulls
+
+    def __len__(self) -> int:
+        return int(self.offsets.shape[0]) - 1
+
+    def __getitem__(self, i: int) -> Optional[str]:
+        if self.nulls[i]:
+            return None
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def __iter__(self) -> Iterator[Optional[str]]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+class SortedIdIndex:
+    """artwork_id -> 行番号（dict.get と同じ使い方。昇順の ID 配列を二分探索する）"""
+
+    __slots__ = ("ids", "rows")
+
+    def __init__(self, ids: np.ndarray, rows: np.ndarray):
+        self.ids = ids
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return int(self.ids.shape[0])
+
+    def __contains__(self, artwork_id: str) -> bool:
+        return self.get(artwork_id) is not None
+
+    def get(self, artwork_id: str, default: Any = None) -> Any:
+        key = str(artwork_id).encode("utf-8")
+        pos = int(np.searchsorted(self.ids, key))
+        if pos < self.ids.shape[0] and self.ids[pos] == key:
+            return int(self.rows[pos])
+        return default
+
+
+def _string_arrays(values: Sequence[Optional[str]]) -> Dict[str, np.ndarray]:
+    encoded = [b"" if v is None else str(v).encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return {
+        "blob": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        "offsets": offsets,
+        "null": np.array([v is None for v in values], dtype=bool),
+    }
+
+
+def _string_parts(values: Sequence[Optional[str]]) -> Dict[str, np.ndarray]:
+    """文字列列の blob / offsets / null（スナップショットから読んだ列は mmap した配列をそのまま使う）"""
+    if isinstance(values, StringColumn):
+        return {"blob": values.blob, "offsets": values.offsets, "null": values.nulls}
+    return _string_arrays(list(values))
+
+
+def snapshot_version(catalog: Catalog) -> str:
+    """
+    レスポンスが依存する全ての列の内容から作るバージョン（同じ内容なら同じ値）
+    ID / 作品名 / 美術館名 / museum_id（NULL かどうかも含む）/ 埋め込み / ノルムを
+    この順に、長さを前置して連結する（スナップショットから読んでもメモリ上で作っても同じ値）
+    カタログの差し替え判定・ETag・事前計算の照合がこの値を使う
+    """
+    h = hashlib.blake2b(digest_size=8)
+    arrays: List[np.ndarray] = []
+    for column in STRING_COLUMNS:
+        parts = _string_parts(getattr(catalog, column))
+        arrays += [
+            np.asarray(parts["blob"], dtype=np.uint8),
+            np.asarray(parts["offsets"], dtype=np.int64),
+            np.asarray(parts["null"], dtype=bool),
+        ]
+    arrays += [np.asarray(catalog.emb, dtype=np.float32), np.asarray(catalog.norms, dtype=np.float32)]
+    for arr in arrays:
+        arr = np.ascontiguousarray(arr)
+        h.update(arr.nbytes.to_bytes(8, "little"))
+        h.update(arr)
+    return h.hexdigest()
+
+
+def _versions_dir(path: str) -> str:
+    return f"{os.path.normpath(path)}.versions"
+
+
+def write_snapshot(catalog: Catalog, path: str, source: Optional[str] = None) -> Dict[str, Any]:
+    """
+    path にスナップショットを書き出す
+    {path}.versions/ の下に新しいディレクトリを書き終えてから、path のシンボリックリンクを
+    1 回の rename で付け替える（公開はアトミック）。古いバージョンは KEEP_VERSIONS 件を残して消す
+    読み込み中のプロセスは古いファイルの mmap をそのまま使い続けられる
+    """
+    versions = _versions_dir(path)
+    os.makedirs(versions, exist_ok=True)
+    tmp = os.path.join(versions, f".tmp-{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    def save(name: str, arr: np.ndarray) -> None:
+        np.save(os.path.join(tmp, name + ".npy"), arr)
+
+    ids = [str(a) for a in catalog.artwork_ids]
+    encoded_ids = np.array([a.encode("utf-8") for a in ids], dtype=bytes)
+    id_order = np.argsort(encoded_ids, kind="stable").astype(np.int64)
+
+    save("emb", np.ascontiguousarray(catalog.emb, dtype=np.float32))
+    save("norms", np.asarray(catalog.norms, dtype=np.float32))
+    save("artwork_ids", encoded_ids[id_order])
+    save("id_order", id_order)
+    save("id_rank", np.asarray(catalog.id_rank, dtype=np.int64))
+    save("museum_codes", np.asarray(catalog.museum_codes, dtype=np.int32))
+    save("excluded_museum", np.asarray(catalog.excluded_museum, dtype=bool))
+    for column in STRING_COLUMNS:
+        for part, arr in _string_arrays(list(getattr(catalog, column))).items():
+            save(f"{column}.{part}", arr)
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "size": len(catalog),
+        "dim": catalog.dim,
+        "version": snapshot_version(catalog),
+        "source": source,
+        "created_at": time.time(),
+    }
+    with open(os.path.join(tmp, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    # 名前は書き出した順に並ぶようにする（同じ内容を書き直しても別のディレクトリになる）
+    name = f"{time.time_ns():020d}-{manifest['version']}"
+    os.rename(tmp, os.path.join(versions, name))
+    _publish(path, os.path.join(os.path.basename(versions), name))
+    _prune(versions, name)
+    return manifest
+
+
+def _publish(path: str, target: str) -> None:
+    """path を target へのシンボリックリンクにする（一時リンクを作って rename で置き換える）"""
+    link = f"{os.path.normpath(path)}.link-{os.getpid()}"
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(target, link)
+    if os.path.isdir(path) and not os.path.islink(path):
+        # 旧形式（実ディレクトリ）からの移行時だけは退避 → 置き換えの 2 段階になる
+        old = f"{os.path.normpath(path)}.old-{os.getpid()}"
+        os.rename(path, old)
+        os.replace(link, path)
+        shutil.rmtree(old, ignore_errors=True)
+        return
+    os.replace(link, path)
+
+
+def _prune(versions: str, published: str) -> None:
+    """published より古いバージョンを、直前の KEEP_VERSIONS - 1 件を残して消す（書き出し中の .tmp- は触らない）"""
+    older = sorted(n for n in os.listdir(versions) if not n.startswith(".") and n < published)
+    for name in older[:max(0, len(older) - (KEEP_VERSIONS - 1))]:
+        shutil.rmtree(os.path.join(versions, name), ignore_errors=True)
+
+
+def read_manifest(path: str) -> Dict[str, Any]:
+    with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"unsupported snapshot format: {manifest.get('format')}")
+    return manifest
+
+
+def load_snapshot(path: str) -> Catalog:
+    """
+    スナップショットを mmap で開いて Catalog を作る（行ごとの処理なし）
+    リンクは最初に 1 回だけ解決する（途中で付け替えられても、全ての配列を同じバージョンから読む）
+    読み込み中にそのバージョンが古いものとして消された場合は、リンクを解決し直して読み直す
+    """
+    resolved = os.path.realpath(path)
+    for _ in range(KEEP_VERSIONS):
+        try:
+            return _load_dir(resolved)
+        except FileNotFoundError:
+            latest = os.path.realpath(path)
+            if latest == resolved:
+                raise
+            resolved = latest
+    return _load_dir(resolved)
+
+
+def _load_dir(path: str) -> Catalog:
+    manifest = read_manifest(path)
+
+    def load(name: str) -> np.ndarray:
+        return np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+
+    columns: List[StringColumn] = [
+        StringColumn(load(f"{c}.blob"), load(f"{c}.offsets"), load(f"{c}.null")) for c in STRING_COLUMNS
+    ]
+    catalog = Catalog.from_arrays(
+        artwork_ids=columns[0],
+        artwork_names=columns[1],
+        museum_names=columns[2],
+        museum_ids=columns[3],
+        emb=load("emb"),
+        norms=load("norms"),
+        index=SortedIdIndex(load("artwork_ids"), load("id_order")),
+        excluded_museum=load("excluded_museum"),
+        museum_codes=load("museum_codes"),
+        id_rank=load("id_rank"),
+    )
+    catalog.version = manifest["version"]
+    catalog.created_at = manifest.get("created_at")
+    catalog.snapshot_dir = path
+    return catalog
+
+
+@contextmanager
+def _locked(path: str) -> Iterator[None]:
+    """スナップショットの作成・追記をプロセス間で排他する（{path}.lock の flock）"""
+    with open(f"{path}.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def open_shared(path: str, build: Callable[[], Catalog], source: Optional[str] = None) -> Catalog:
+    """
+    複数ワーカーで 1 つのスナップショットを共有して開く
+    path が無ければロックを取ったプロセスが build() で作って書き出し、他のワーカーはその完了を待って mmap する
+    """
+    if not os.path.isdir(path):
+        with _locked(path):
+            if not os.path.isdir(path):
+                write_snapshot(build(), path, source=source)
+    return load_snapshot(path)
+
+
+def load_quantized(path: str, catalog: Catalog, kind: str) -> None:
+    """
+    catalog（path から読み込んだもの）の 1 次パスを量子化した埋め込みに切り替える
+    量子化した配列はスナップショット内に保存して mmap するので、ワーカー間で共有される
+    保存先は catalog を読み込んだバージョンのディレクトリ（その後リンクが付け替えられていても同じ）
+    """
+    directory = catalog.snapshot_dir or os.path.realpath(path)
+    codes_path = os.path.join(directory, f"quant-{kind}.codes.npy")
+    scales_path = os.path.join(directory, f"quant-{kind}.scales.npy")
+    if not os.path.exists(codes_path):
+        with _locked(path):
+            if not os.path.exists(codes_path):
+                quant = QuantizedEmbeddings.from_float(catalog.emb, kind)
+                # 書きかけのファイルを他のワーカーが読まないよう、scales → codes の順に置き換える
+                for final, arr in ((scales_path, quant.scales), (codes_path, quant.codes)):
+                    tmp = f"{final}.tmp-{os.getpid()}.npy"
+                    np.save(tmp, arr)
+                    os.replace(tmp, final)
+    catalog.quant = QuantizedEmbeddings(
+        kind, np.load(codes_path, mmap_mode="r"), np.load(scales_path, mmap_mode="r")
+    )
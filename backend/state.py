@@ -0,0 +1,53 @@
+import itertools
+import logging
+import time
+import weakref
+from typing import Any, Optional
+
+from catalog import Catalog
+from profiles import ProfileStore
+from recommend import CandidateRegistry
+
+logger = logging.getLogger(__name__)
+
+_GENERATIONS = itertools.count(1)
+
+
+class CatalogState:
+    """
+    カタログと、それに依存するデータ（ユーザープロファイル / 候補セット）の 1 世代分
+
+    新しいカタログはリクエスト処理の外で丸ごと作り、app.STATE の参照 1 つを差し替えて公開する（RCU）。
+    リクエストは開始時に STATE を 1 回だけ読み、最後までその世代を使う（途中で差し替わっても混ざらない）。
+    古い世代は最後の参照が消えた時点で解放される（mmap したスナップショットもここで unmap される）。
+
+    - generation : プロセス内で単調増加する世代番号（計算中の結果を世代ごとにまとめるキー）
+    - loaded_at  : この世代を作った時刻（UNIX 秒）
+    データの内容・作成時刻は catalog.version / catalog.created_at を見る
+    """
+
+    __slots__ = ("catalog", "profiles", "candidates", "generation", "loaded_at", "__weakref__")
+
+    def __init__(self, catalog: Catalog, profiles: ProfileStore, candidates: CandidateRegistry):
+        self.catalog = catalog
+        self.profiles = profiles
+        self.candidates = candidates
+        self.generation = next(_GENERATIONS)
+        self.loaded_at = time.time()
+
+    def retire(self) -> None:
+        """差し替えで外した世代が実際に解放されたらログに出す（処理中のリクエストが終わった時点）"""
+        weakref.finalize(
+            self.catalog, logger.info, "previous catalog released: generation=%d version=%s",
+            self.generation, self.catalog.version,
+        )
+
+
+def table_modified_at(bq: Any, table: str) -> Optional[float]:
+    """BigQuery テーブルの最終更新時刻（UNIX 秒, 取得できなければ None）"""
+    try:
+        modified = bq.get_table(table).modified
+    except Exception:
+        logger.warning("failed to get table metadata: %s", table, exc_info=True)
+        return None
+    return modified.timestamp() if modified is not None else None
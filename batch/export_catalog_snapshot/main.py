@@ -0,0 +1,48 @@
+"""
+artwork_master からカタログのスナップショット（backend/snapshot.py の形式）を書き出す
+
+backend は起動時にこのディレクトリを mmap で開くので、BigQuery からの全件読み込みと
+正規化・ID 対応表の作成を起動ごとに行わなくて済む。埋め込みを更新したら再実行する。
+
+  python main.py --output ../../backend/catalog_snapshot
+"""
+import argparse
+import os
+import sys
+import time
+
+from google.cloud import bigquery
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+sys.path.insert(0, BACKEND_DIR)
+
+from catalog import load_catalog_from_bigquery  # noqa: E402
+from snapshot import load_snapshot, write_snapshot  # noqa: E402
+
+PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT", "avid-invention-470411-u6")
+BQ_ARTWORK_TABLE = "avid-invention-470411-u6.fukuoka.artwork_master"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", default=os.path.join(BACKEND_DIR, "catalog_snapshot"))
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    bq = bigquery.Client(project=PROJECT_ID)
+    catalog = load_catalog_from_bigquery(bq, BQ_ARTWORK_TABLE)
+    loaded = time.perf_counter()
+    print(f"catalog: {len(catalog)} artworks, dim={catalog.dim} ({loaded - start:.1f}s)")
+
+    manifest = write_snapshot(catalog, args.output, source=BQ_ARTWORK_TABLE)
+    written = time.perf_counter()
+    print(f"snapshot: {args.output} version={manifest['version']} ({written - loaded:.1f}s)")
+
+    # 書き出した内容を読み戻して確認
+    check = load_snapshot(args.output)
+    assert len(check) == len(catalog) and check.version == manifest["version"]
+    print(f"verified: load {(time.perf_counter() - written) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
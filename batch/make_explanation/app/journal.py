@@ -0,0 +1,170 @@
+import csv
+import os
+import sqlite3
+from typing import Callable, Optional, Set, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+  artwork_id     INTEGER NOT NULL,
+  level          INTEGER NOT NULL,  -- 解説の level（作品単位の CSV は 0）
+  explanation_id INTEGER,           -- 振った explanation_id（振らない CSV は NULL）
+  PRIMARY KEY (artwork_id, level)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+  key   TEXT PRIMARY KEY,  -- csv_size / next_explanation_id / last_artwork_id
+  value INTEGER
+) WITHOUT ROWID;
+"""
+
+# CSV の 1 行 -> (artwork_id, level, explanation_id)。ヘッダーなど対象外の行は None
+RowParser = Callable[[list], Optional[Tuple[int, int, Optional[int]]]]
+
+
+class CsvJournal:
+    """
+    追記していく出力 CSV と対になる SQLite のジャーナル（<csv>.journal）
+
+    1 行書くごとに「CSV に追記 → flush + fsync → ジャーナルに (artwork_id, level, explanation_id) と
+    CSV のサイズを 1 トランザクションで記録」する。ジャーナルに記録された CSV のサイズまでが確定分で、
+    開いたときにそれより後ろ（記録前に kill された行・書きかけの行）は切り捨てる。
+    切り捨てた行の explanation_id は next_explanation_id が進んでいないので同じ番号で書き直され、
+    ID の重複・欠番は起きない。
+
+    再開位置は CSV を読まずに units / meta から引く。
+    ジャーナルが無い既存の CSV は、最初に開いたときに 1 回だけ読んでジャーナルを作る。
+
+    切り捨て（_recover）とジャーナルの作成は書き込み側（readonly=False）で開いたときだけ行う。
+    readonly=True は確定分を読むだけで、CSV もジャーナルも変更しない（書き込み中の別プロセスがあっても安全）。
+    """
+
+    def __init__(
+        self,
+        csv_path: str,
+        parse_row: RowParser,
+        start_id: int = 300000,
+        path: Optional[str] = None,
+        readonly: bool = False,
+    ):
+        self.csv_path = csv_path
+        self.path = path or f"{csv_path}.journal"
+        if readonly:
+            self._open_readonly(parse_row, start_id)
+            return
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(SCHEMA)
+
+        meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+        if "csv_size" not in meta:
+            self._bootstrap(parse_row, start_id)
+        self._recover(start_id)
+
+    def _open_readonly(self, parse_row: RowParser, start_id: int) -> None:
+        """
+        確定分を読み取り専用で開く
+        ジャーナルが無い / CSV が消されている場合は、書き込み側が開いたときと同じ状態をメモリ上に作る
+        """
+        if os.path.exists(self.path) and os.path.exists(self.csv_path):
+            self._conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            if self._meta("csv_size") is not None:
+                return
+            self._conn.close()
+        self._conn = sqlite3.connect(":memory:")
+        self._conn.executescript(SCHEMA)
+        self._bootstrap(parse_row, start_id)
+
+    def _meta(self, key: str) -> Optional[int]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, **values: Optional[int]) -> None:
+        self._conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", values.items())
+
+    def _bootstrap(self, parse_row: RowParser, start_id: int) -> None:
+        """既存の CSV から作る（ジャーナル導入前の出力を引き継ぐ, 1 回だけ）"""
+        next_id, last_artwork_id, units = start_id, None, []
+        size = 0
+        if os.path.exists(self.csv_path):
+            size = os.path.getsize(self.csv_path)
+            with open(self.csv_path, newline="", encoding="utf-8-sig") as f:
+                for row in csv.reader(f):
+                    try:
+                        unit = parse_row(row)
+                    except (ValueError, IndexError):
+                        unit = None
+                    if unit is None:
+                        continue
+                    units.append(unit)
+                    last_artwork_id = unit[0]
+                    if unit[2] is not None:
+                        next_id = max(next_id, unit[2] + 1)
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO units VALUES (?, ?, ?)", units)
+            self._set_meta(csv_size=size, next_explanation_id=next_id, last_artwork_id=last_artwork_id)
+
+    def _recover(self, start_id: int) -> None:
+        """CSV をジャーナルに記録済みのサイズに揃える"""
+        recorded = self._meta("csv_size") or 0
+        if not os.path.exists(self.csv_path):
+            if recorded:
+                # CSV を消して最初からやり直す場合
+                print(f"[JOURNAL] {self.csv_path} が無いためジャーナルをリセット")
+                with self._conn:
+                    self._conn.execute("DELETE FROM units")
+                    self._set_meta(csv_size=0, next_explanation_id=start_id, last_artwork_id=None)
+            return
+        size = os.path.getsize(self.csv_path)
+        if size < recorded:
+            raise RuntimeError(
+                f"{self.csv_path} ({size} bytes) がジャーナルの記録 ({recorded} bytes) より短い"
+                f"（CSV を編集した場合は {self.path} を削除して作り直す）"
+            )
+        if size > recorded:
+            print(f"[JOURNAL] 未確定の末尾 {size - recorded} bytes を切り捨て: {self.csv_path}")
+            with open(self.csv_path, "r+b") as f:
+                f.truncate(recorded)
+                f.flush()
+                os.fsync(f.fileno())
+
+    @property
+    def csv_size(self) -> int:
+        return self._meta("csv_size") or 0
+
+    @property
+    def next_explanation_id(self) -> int:
+        return self._meta("next_explanation_id")
+
+    @property
+    def last_artwork_id(self) -> Optional[int]:
+        return self._meta("last_artwork_id")
+
+    def done_levels(self, artwork_id: int) -> Set[int]:
+        """書き込み済みの level（主キーの範囲検索なので CSV の大きさに依存しない）"""
+        return {row[0] for row in self._conn.execute("SELECT level FROM units WHERE artwork_id = ?", (artwork_id,))}
+
+    def commit_size(self, f) -> None:
+        """ヘッダーなど、行の記録を伴わない追記を確定する（f は追記中の CSV）"""
+        size = _sync(f)
+        with self._conn:
+            self._set_meta(csv_size=size)
+
+    def record(self, f, artwork_id: int, level: int = 0, explanation_id: Optional[int] = None) -> None:
+        """f（追記中の CSV）に書いた 1 行を確定する"""
+        size = _sync(f)
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO units VALUES (?, ?, ?)", (artwork_id, level, explanation_id))
+            values = {"csv_size": size, "last_artwork_id": artwork_id}
+            if explanation_id is not None:
+                values["next_explanation_id"] = explanation_id + 1
+            self._set_meta(**values)
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def _sync(f) -> int:
+    """CSV をディスクまで書き出し、そのサイズ（bytes）を返す"""
+    f.flush()
+    os.fsync(f.fileno())
+    return os.fstat(f.fileno()).st_size
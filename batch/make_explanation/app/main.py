@@ -1,11 +1,11 @@
 from google.cloud import secretmanager
-from google import genai
 from google.genai import types
 import base64
 from prompts import level_3
 from prompts import level_2
 from prompts import level_1
 from prompts import metadata_text_prompt
+from prompts import all_levels
 import csv
 import os
 from datetime import datetime
@@ -15,6 +15,11 @@ from google.genai.errors import ServerError
 import json
 import re
 import random
+from concurrent.futures import ThreadPoolExecutor
+from ratelimit import AdaptiveConcurrency, TokenBucket
+from journal import CsvJournal
+from response_cache import ResponseCache
+from session import GeminiSession
 # akakura用
 # PROJECT_ID = "408203742614"
 # SECRET_ID = "GOOGLE_API_KEY"
@@ -30,6 +35,27 @@ LEVEL_PROMPTS = [
     (2, level_2),
     (3, level_3),
 ]
+# level 1〜3 を 1 回のリクエスト（JSON 出力）でまとめて作るか
+# JSON が壊れていた / 欠けていた level だけ LEVEL_PROMPTS で個別に作り直す
+COMBINED_LEVELS = True
+# まとめて作るときの出力スキーマ（キーは "level_<level>"）
+ALL_LEVELS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {f"level_{level}": {"type": "STRING"} for level, _ in LEVEL_PROMPTS},
+    "required": [f"level_{level}" for level, _ in LEVEL_PROMPTS],
+}
+# 解説生成の同時実行数の上限（実際の同時数は ServerError に応じて 1〜この値で自動調整）
+EXPLANATION_WORKERS = 8
+# Gemini 呼び出しのレート上限（全ワーカー合計, 回/分）
+GEMINI_REQUESTS_PER_MINUTE = 60
+# ServerError 時に全ワーカーを止める秒数（連続するたびに倍, GEMINI_MAX_COOLDOWN_SEC まで）
+GEMINI_COOLDOWN_SEC = 5.0
+GEMINI_MAX_COOLDOWN_SEC = 120.0
+# API キーを Secret Manager から取り直す間隔（秒）
+API_KEY_TTL_SEC = 3600.0
+# Gemini の応答キャッシュ（同じ model / プロンプト / 画像のリクエストは再実行時も API に送らない）
+RESPONSE_CACHE_PATH = os.path.join(OUTPUT_DIR, "gemini_cache.sqlite3")
+RESPONSE_CACHE_MAX_MB = 512
 
 
 def get_api_key() -> str:
@@ -38,6 +64,14 @@ def get_api_key() -> str:
     response = client.access_secret_version(name=name)
     return response.payload.data.decode("UTF-8")
 
+
+# API キー / genai.Client / 画像 / 応答キャッシュを全呼び出しで共有する
+SESSION = GeminiSession(
+    lambda: get_api_key(),
+    key_ttl=API_KEY_TTL_SEC,
+    cache=ResponseCache(RESPONSE_CACHE_PATH, max_bytes=RESPONSE_CACHE_MAX_MB * 1024 * 1024),
+)
+
 def save_to_csv(level: str, explanation_content: str, output_file_name: str):
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     file_path = os.path.join(OUTPUT_DIR, output_file_name)
@@ -90,36 +124,13 @@ def get_artwork_explanation(
     （画像説明文生成用）
     """
 
-    api_key = get_api_key()
-
-    client = genai.Client(
-        http_options={'api_version': 'v1alpha'},
-        api_key=api_key
-    )
-
-    with open(imgage_path, "rb") as f:
-        image_bytes = f.read()
+    image_bytes = SESSION.image_bytes(imgage_path)
 
     for attempt in range(max_retry):
         try:
-            response = client.models.generate_content(
-                model="gemini-3-flash-preview",
-                contents=[
-                    types.Content(
-                        parts=[
-                            types.Part(text=prompt),
-                            types.Part(
-                                inline_data=types.Blob(
-                                    mime_type="image/jpeg",
-                                    data=image_bytes,
-                                )
-                            )
-                        ]
-                    )
-                ]
+            result = clean_response_text(
+                SESSION.generate("gemini-3-flash-preview", prompt, image_bytes, api_version="v1alpha")
             )
-
-            result = clean_response_text(response.text)
             print(result)
             return result
 
@@ -162,6 +173,143 @@ def get_artwork_explanation(
     print("❌ get_artwork_explanation: 最大リトライ回数に達しました")
     return ""
 
+
+def generate_explanation_once(prompt: str, image_bytes: bytes, config=None) -> str:
+    """
+    画像 + プロンプトで Gemini を 1 回だけ呼ぶ（リトライなし, 例外はそのまま投げる）
+    """
+    return clean_response_text(
+        SESSION.generate("gemini-3-flash-preview", prompt, image_bytes, api_version="v1alpha", config=config)
+    )
+
+
+def call_gemini_limited(
+    call,
+    bucket: TokenBucket,
+    controller: AdaptiveConcurrency,
+    name: str,
+    max_retry: int = 10,
+    base_wait: float = 5.0,
+    max_wait: float = 60.0,
+):
+    """
+    call()（Gemini を 1 回呼ぶ関数）をリトライ付きで実行する（ワーカースレッドから呼ぶ）
+    - 呼び出し前に controller（同時実行数）と bucket（レート）の枠を取る
+    - ServerError は全体の過負荷とみなし、controller で全ワーカーをまとめて待たせる
+    - それ以外のエラーはこの呼び出しだけ指数バックオフ + ジッタで待つ
+    最大リトライ回数に達したら None を返す
+    """
+    for attempt in range(max_retry):
+        overloaded = False
+        error = None
+        controller.acquire()
+        try:
+            bucket.acquire()
+            result = call()
+        except ServerError:
+            overloaded = True
+        except Exception as e:
+            # ネットワーク系 / 想定外（一時的な可能性あり）
+            error = e
+        finally:
+            controller.release()
+
+        if overloaded:
+            cooldown = controller.on_overload()
+            print(
+                f"[Gemini ServerError] retry {attempt + 1}/{max_retry} "
+                f"→ 全体で {cooldown:.2f}s 待機, 同時実行数 {controller.limit}"
+            )
+            continue
+        if error is not None:
+            wait = min(base_wait * (2 ** attempt), max_wait)
+            sleep_time = wait + random.uniform(0, wait * 0.3)
+            print(
+                f"[Error] {error} | retry {attempt + 1}/{max_retry} "
+                f"→ {sleep_time:.2f}s 待機"
+            )
+            time.sleep(sleep_time)
+            continue
+
+        controller.on_success()
+        return result
+
+    print(f"❌ {name}: 最大リトライ回数に達しました")
+    return None
+
+
+def get_artwork_explanation_limited(
+    prompt: str,
+    imgage_path: str,
+    bucket: TokenBucket,
+    controller: AdaptiveConcurrency,
+) -> str:
+    """get_artwork_explanation の並行実行版"""
+    image_bytes = SESSION.image_bytes(imgage_path)
+    result = call_gemini_limited(
+        lambda: generate_explanation_once(prompt, image_bytes),
+        bucket,
+        controller,
+        "get_artwork_explanation_limited",
+    )
+    return result or ""
+
+
+def parse_all_levels(text: str) -> dict[int, str]:
+    """
+    all_levels の応答（JSON）を {level: 解説} にする
+    JSON として読めない / 文字列でない / 空の level は含めない
+    """
+    data = extract_json_object(text)
+    if data is None:
+        return {}
+
+    explanations = {}
+    for level, _ in LEVEL_PROMPTS:
+        value = data.get(f"level_{level}")
+        if isinstance(value, str) and value.strip():
+            explanations[level] = clean_response_text(value.strip())
+    return explanations
+
+
+def get_artwork_explanations_all_levels_limited(
+    imgage_path: str,
+    bucket: TokenBucket,
+    controller: AdaptiveConcurrency,
+    done: set[int] = frozenset(),
+) -> dict[int, str]:
+    """
+    画像を 1 回送って level 1〜3 を JSON でまとめて作る
+    パースできなかった level だけ、従来のプロンプト（LEVEL_PROMPTS）で個別に作り直す
+    作れなかった level は "" になる
+    done（書き込み済みの level）がある作品は、残りの level だけを個別に作る（まとめて作り直さない）
+    """
+    missing = [(level, prompt) for level, prompt in LEVEL_PROMPTS if level not in done]
+    if len(missing) < len(LEVEL_PROMPTS):
+        return {
+            level: get_artwork_explanation_limited(prompt, imgage_path, bucket, controller)
+            for level, prompt in missing
+        }
+
+    image_bytes = SESSION.image_bytes(imgage_path)
+    config = types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=ALL_LEVELS_SCHEMA,
+    )
+    text = call_gemini_limited(
+        lambda: generate_explanation_once(all_levels, image_bytes, config),
+        bucket,
+        controller,
+        "get_artwork_explanations_all_levels_limited",
+    )
+    explanations = parse_all_levels(text)
+
+    for level, prompt in LEVEL_PROMPTS:
+        if level not in explanations:
+            print(f"[FALLBACK] {imgage_path} level={level} を個別に生成")
+            explanations[level] = get_artwork_explanation_limited(prompt, imgage_path, bucket, controller)
+    return explanations
+
 def get_artwork_metadata_text(
     prompt: str,
     imgage_path: str,
@@ -173,36 +321,13 @@ def get_artwork_metadata_text(
     Gemini API 呼び出しを指数バックオフ + ジッタ付きでリトライする
     """
 
-    api_key = get_api_key()
-
-    client = genai.Client(
-        http_options={'api_version': 'v1alpha'},
-        api_key=api_key
-    )
-
-    with open(imgage_path, "rb") as f:
-        image_bytes = f.read()
+    image_bytes = SESSION.image_bytes(imgage_path)
 
     for attempt in range(max_retry):
         try:
-            response = client.models.generate_content(
-                model="gemini-3-flash-preview",
-                contents=[
-                    types.Content(
-                        parts=[
-                            types.Part(text=prompt),
-                            types.Part(
-                                inline_data=types.Blob(
-                                    mime_type="image/jpeg",
-                                    data=image_bytes,
-                                )
-                            )
-                        ]
-                    )
-                ]
+            result = clean_response_text(
+                SESSION.generate("gemini-3-flash-preview", prompt, image_bytes, api_version="v1alpha")
             )
-
-            result = clean_response_text(response.text)
             print(result)
             return result
 
@@ -250,9 +375,6 @@ def translate_to_ja(text: str) -> str:
     if not text:
         return ""
 
-    api_key = get_api_key()
-    client = genai.Client(api_key=api_key)
-
     prompt = f"""
         以下のテキストを自然な日本語に翻訳してください。
         固有名詞、特に絵画名は一般的に用いられている日本語表記を使ってください。
@@ -261,12 +383,7 @@ def translate_to_ja(text: str) -> str:
         {text}
         """
 
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt
-    )
-
-    return clean_response_text(response.text)
+    return clean_response_text(SESSION.generate("gemini-2.5-flash", prompt))
 
 def select_image_url(obj: dict) -> str | None:
     """
@@ -316,15 +433,14 @@ def fetch_and_save_met_paintings_to_csv(
     os.makedirs(os.path.dirname(csv_path), exist_ok=True)
     os.makedirs(image_dir, exist_ok=True)
 
-    is_new = not os.path.exists(csv_path)
-
-    # 🔁 CSVから最後の objectID を取得
-    last_object_id = get_last_object_id_from_csv(csv_path)
+    # 🔁 ジャーナルから最後の objectID を取得（未確定の末尾行はここで切り捨てられる）
+    journal = met_paintings_journal(csv_path)
+    last_object_id = journal.last_artwork_id
 
     with open(csv_path, "a", newline="", encoding="utf-8-sig") as csv_file:
         writer = csv.writer(csv_file)
 
-        if is_new:
+        if journal.csv_size == 0:
             writer.writerow([
                 "artwork_id",
                 "title_ja",
@@ -334,6 +450,7 @@ def fetch_and_save_met_paintings_to_csv(
                 "col6",
                 "museum"
             ])
+            journal.commit_size(csv_file)
 
         # 🔍 検索条件
         search_params = {
@@ -443,6 +560,7 @@ def fetch_and_save_met_paintings_to_csv(
                 "555555",
                 "メトロポリタン美術館"
             ])
+            journal.record(csv_file, int(artwork_id))
 
             print(f"保存完了: objectID={artwork_id}")
 
@@ -456,9 +574,6 @@ def translate_title_and_artist(
     max_retry: int = 10
 ) -> tuple[str, str]:
 
-    api_key = get_api_key()
-    client = genai.Client(api_key=api_key)
-
     prompt = f"""
         以下を日本語に翻訳し、JSON形式のみで返してください。
         余計な文章は一切出力しないでください。
@@ -471,20 +586,18 @@ def translate_title_and_artist(
 
     for i in range(max_retry):
         try:
-            response = client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt
-            )
-
-            text = clean_response_text(response.text)
+            # パースできない応答はキャッシュしない（リトライで同じ応答を読み直さない）
+            text = clean_response_text(SESSION.generate(
+                "gemini-2.5-flash",
+                prompt,
+                accept=lambda t: extract_json_object(clean_response_text(t)) is not None,
+            ))
 
             # 🔑 JSON 部分だけ抜き出す
-            match = re.search(r'\{.*\}', text, re.DOTALL)
-            if not match:
+            data = extract_json_object(text)
+            if data is None:
                 raise ValueError("JSON not found")
 
-            data = json.loads(match.group())
-
             return (
                 data.get("title_ja", ""),
                 data.get("artist_ja", "")
@@ -501,58 +614,81 @@ def translate_title_and_artist(
 
     return "", ""
 
-def get_last_object_id_from_csv(csv_path: str) -> int | None:
-    """
-    CSVの最後の行から artwork_id を取得
-    なければ None を返す
-    """
-    if not os.path.exists(csv_path):
+def extract_json_object(text: str) -> dict | None:
+    """応答の中の JSON オブジェクト部分を読む（見つからない / 壊れていれば None）"""
+    match = re.search(r'\{.*\}', text or "", re.DOTALL)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group())
+    except json.JSONDecodeError:
         return None
+    return data if isinstance(data, dict) else None
 
-    with open(csv_path, newline="", encoding="utf-8-sig") as f:
-        rows = list(csv.reader(f))
 
-    if len(rows) <= 1:
-        return None
+def _parse_met_paintings_row(row: list):
+    # artwork_id, title_ja, ...（ヘッダーは int にできないので対象外）
+    return int(row[0]), 0, None
 
-    last_row = rows[-1]
-    try:
-        return int(last_row[0])  # artwork_id
-    except Exception:
-        return None
 
-def get_next_explanation_id(csv_path: str, start_id: int = 300000) -> int:
-    if not os.path.exists(csv_path):
-        return start_id
+def _parse_explanation_row(row: list):
+    # explanation_id, artwork_id, artwork_name, artist_name, explanation_level, ...
+    return int(row[1]), int(row[4]), int(row[0])
+
+
+def met_paintings_journal(csv_path: str, readonly: bool = False) -> CsvJournal:
+    """met_paintings.csv のジャーナル（作品 1 件 = 1 行, level は 0）"""
+    return CsvJournal(csv_path, _parse_met_paintings_row, readonly=readonly)
 
-    with open(csv_path, newline="", encoding="utf-8-sig") as f:
-        rows = list(csv.reader(f))
 
-    if len(rows) <= 1:
-        return start_id
+def explanations_journal(csv_path: str, start_id: int = 300000, readonly: bool = False) -> CsvJournal:
+    """explanations.csv のジャーナル（(artwork_id, level) ごとの explanation_id）"""
+    return CsvJournal(csv_path, _parse_explanation_row, start_id=start_id, readonly=readonly)
 
-    last_row = rows[-1]
+
+def get_last_object_id_from_csv(csv_path: str) -> int | None:
+    """
+    CSVの最後の行の artwork_id を取得（ジャーナルの確定分から引く。CSV / ジャーナルは変更しない）
+    なければ None を返す
+    """
+    journal = met_paintings_journal(csv_path, readonly=True)
+    try:
+        return journal.last_artwork_id
+    finally:
+        journal.close()
+
+def get_next_explanation_id(csv_path: str, start_id: int = 300000) -> int:
+    """次に振る explanation_id（ジャーナルの確定分から引く。CSV / ジャーナルは変更しない）"""
+    journal = explanations_journal(csv_path, start_id, readonly=True)
     try:
-        return int(last_row[0]) + 1
-    except Exception:
-        return start_id
+        return journal.next_explanation_id
+    finally:
+        journal.close()
 
 def run_explanations_for_image_id_range_multi_level(
     image_dir: str,
     start_image_id: int,
     end_image_id: int,
     output_csv: str,
+    workers: int = EXPLANATION_WORKERS,
+    requests_per_minute: float = GEMINI_REQUESTS_PER_MINUTE,
+    combined: bool = COMBINED_LEVELS,
 ):
+    """
+    作品ごと（combined）/ (artwork_id, level) ごとの生成を最大 workers 並行で行う
+    完了順・モードに関わらず、CSV には artwork_id 順 → level 順で書き、explanation_id もその順に振る
+    書き込み済みの (artwork_id, level) はジャーナルで判定して飛ばす（途中で止まっても続きから再開）
+    """
     os.makedirs(os.path.dirname(output_csv), exist_ok=True)
 
-    is_new = not os.path.exists(output_csv)
-    next_explanation_id = get_next_explanation_id(output_csv)
+    journal = explanations_journal(output_csv)
+    next_explanation_id = journal.next_explanation_id
 
     with open(output_csv, "a", newline="", encoding="utf-8-sig") as f:
         writer = csv.writer(f)
 
         # ヘッダー
-        if is_new:
+        if journal.csv_size == 0:
             writer.writerow([
                 "explanation_id",
                 "artwork_id",
@@ -562,8 +698,10 @@ def run_explanations_for_image_id_range_multi_level(
                 "language",
                 "explanation_content",
             ])
+            journal.commit_size(f)
 
         # image 配下の jpg を列挙
+        artworks = []
         for filename in sorted(os.listdir(image_dir)):
             if not filename.lower().endswith(".jpg"):
                 continue
@@ -578,39 +716,78 @@ def run_explanations_for_image_id_range_multi_level(
             if not (start_image_id <= artwork_id_int <= end_image_id):
                 continue
 
-            image_path = os.path.join(image_dir, filename)
-
-            print(f"\n=== Processing artwork_id={artwork_id} ===")
+            # 全 level 書き込み済みの作品は飛ばす
+            done = journal.done_levels(artwork_id_int)
+            if len(done) == len(LEVEL_PROMPTS):
+                continue
 
+            image_path = os.path.join(image_dir, filename)
+            artworks.append((artwork_id_int, image_path, done))
+
+        bucket = TokenBucket(requests_per_minute, burst=workers)
+        controller = AdaptiveConcurrency(
+            initial=min(4, workers),
+            max_limit=workers,
+            base_cooldown=GEMINI_COOLDOWN_SEC,
+            max_cooldown=GEMINI_MAX_COOLDOWN_SEC,
+        )
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
             # 🔁 level1 / level2 / level3 をまとめて処理
-            for level, prompt in LEVEL_PROMPTS:
-                print(f"[LEVEL {level}] generating...")
-
-                explanation = get_artwork_explanation(
-                    prompt=prompt,
-                    imgage_path=image_path,
-                )
-
-                if not explanation:
-                    print(f"[SKIP] level={level} explanation empty")
-                    continue
-
-                writer.writerow([
-                    f"{next_explanation_id:06d}",  # explanation_id
-                    f"{artwork_id_int:06d}",       # artwork_id
-                    "",                            # artwork_name
-                    "",                            # artist_name
-                    level,                         # explanation_level
-                    "jp",                          # language
-                    explanation,                  # explanation_content
-                ])
-
-                print(
-                    f"[SAVED] artwork_id={artwork_id} "
-                    f"level={level} explanation_id={next_explanation_id}"
-                )
+            futures = []
+            for _, image_path, done in artworks:
+                if combined:
+                    futures.append(
+                        pool.submit(get_artwork_explanations_all_levels_limited, image_path, bucket, controller, done)
+                    )
+                else:
+                    futures.append({
+                        level: pool.submit(get_artwork_explanation_limited, prompt, image_path, bucket, controller)
+                        for level, prompt in LEVEL_PROMPTS
+                        if level not in done
+                    })
+
+            # 投入順に結果を待つ（先に終わった分はここまで保持される）
+            for (artwork_id_int, image_path, done), future in zip(artworks, futures):
+                print(f"\n=== Processing artwork_id={artwork_id_int} ===")
+
+                if combined:
+                    explanations = future.result()
+                else:
+                    explanations = {level: f.result() for level, f in future.items()}
+                SESSION.forget_image(image_path)
+
+                for level, _ in LEVEL_PROMPTS:
+                    if level in done:
+                        continue
+                    explanation = explanations.get(level, "")
+
+                    if not explanation:
+                        print(f"[SKIP] level={level} explanation empty")
+                        continue
+
+                    writer.writerow([
+                        f"{next_explanation_id:06d}",  # explanation_id
+                        f"{artwork_id_int:06d}",       # artwork_id
+                        "",                            # artwork_name
+                        "",                            # artist_name
+                        level,                         # explanation_level
+                        "jp",                          # language
+                        explanation,                  # explanation_content
+                    ])
+                    # CSV を fsync してからジャーナルに記録（記録前に止まった行は次回切り捨てて書き直す）
+                    journal.record(f, artwork_id_int, level, next_explanation_id)
+
+                    print(
+                        f"[SAVED] artwork_id={artwork_id_int} "
+                        f"level={level} explanation_id={next_explanation_id}"
+                    )
 
-                next_explanation_id += 1
+                    next_explanation_id += 1
+        finally:
+            # 中断時は未着手の分を捨てる（書き込み済みの行は CSV に残る）
+            pool.shutdown(wait=True, cancel_futures=True)
+            journal.close()
 
 
 
@@ -648,6 +825,7 @@ def main():
     
 
     end = time.perf_counter() #計測終了
+    print(f"Gemini: {SESSION.stats()}, cache: {SESSION.cache.stats()}")
     
     # (秒→分に直し、小数点以下の桁数を指定して出力)
     print('{:.2f}'.format((end-start)/60))
@@ -70,11 +70,13 @@ for i in range(1, 101):
 
     batch = db.batch()
     batch_count = 0
+    scores = {}
 
     for artwork_id in artwork_ids:
         doc_ref = pref_ref.document(artwork_id)
+        scores[artwork_id] = random.randint(1, 100)
         batch.set(doc_ref, {
-            "score": random.randint(1, 100)
+            "score": scores[artwork_id]
         })
 
         batch_count += 1
@@ -89,6 +91,12 @@ for i in range(1, 101):
     if batch_count > 0:
         batch.commit()
 
+    # 非正規化した嗜好マップ（バックエンドの 1 ドキュメント読み込み用）
+    user_ref.collection("denormalized").document("preferences").set({
+        "scores": scores,
+        "updatedAt": firestore.SERVER_TIMESTAMP,
+    })
+
     print(f"{user_id} uploaded")
 
 print("All users uploaded successfully 🎉")
@@ -91,3 +91,27 @@ metadata_text_prompt = """
 """
 
 
+
+# level 1〜3 を 1 回のリクエストでまとめて作る（画像のアップロードを 1 回にする）
+# 各 level の指示は上の level_1 / level_2 / level_3 をそのまま使う
+all_levels = f"""
+    ### 役割
+    あなたはプロの学芸員です。添付の絵画 1 枚について、想定ユーザーの異なる 3 種類の解説を作ります。
+
+    ### やりたいこと
+    - 以下の level_1 / level_2 / level_3 の指示にそれぞれ従って、3 つの解説を作る。
+    - 3 つの解説は互いに独立した文章にする（他の level を参照しない）。
+
+    ### 出力形式
+    - {{"level_1": "...", "level_2": "...", "level_3": "..."}} の JSON のみを出力する。
+    - 値は解説の本文のみ（見出しや level の名前は含めない）。
+
+    ## level_1
+    {level_1}
+
+    ## level_2
+    {level_2}
+
+    ## level_3
+    {level_3}
+"""
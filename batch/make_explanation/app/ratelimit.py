@@ -0,0 +1,101 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    全ワーカーで共有するトークンバケット（requests_per_minute を超えて Gemini を呼ばない）
+    burst 回分までは連続で呼べる
+    """
+
+    def __init__(self, requests_per_minute: float, burst: int = 1):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(max(1, burst))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """トークンが取れるまで待つ"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveConcurrency:
+    """
+    同時に Gemini を呼ぶ数の上限を、成功 / ServerError に応じて調整する（AIMD）
+
+    - 成功が limit 回続くごとに上限を +1（max_limit まで）
+    - ServerError（過負荷・レート制限）で上限を半分にし、全ワーカーを cooldown 秒止める
+      続けて ServerError になるたびに cooldown は倍（max_cooldown まで）、成功で元に戻す
+    1 つの呼び出しが失敗しても、その呼び出しだけが長く眠るのではなく全体で一度だけ待つ
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 16,
+        base_cooldown: float = 5.0,
+        max_cooldown: float = 120.0,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.limit = max(min_limit, min(initial, max_limit))
+
+        self._in_flight = 0
+        self._successes = 0
+        self._overloads = 0  # 連続した ServerError の回数
+        self._resume_at = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        """cooldown 中なら明けるまで、上限に達していれば空くまで待つ"""
+        with self._cond:
+            while True:
+                wait = self._resume_at - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                if self._in_flight < self.limit:
+                    self._in_flight += 1
+                    return
+                self._cond.wait()
+
+    def release(self) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self) -> None:
+        with self._cond:
+            self._overloads = 0
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.max_limit:
+                self.limit += 1
+                self._successes = 0
+                self._cond.notify_all()
+
+    def on_overload(self) -> float:
+        """上限を下げて全体の cooldown を設定し、待つ秒数を返す"""
+        with self._cond:
+            now = time.monotonic()
+            if now < self._resume_at:
+                # 同じ過負荷を複数ワーカーが同時に受けた場合は 1 回分として数える
+                return self._resume_at - now
+            self.limit = max(self.min_limit, self.limit // 2)
+            self._successes = 0
+            cooldown = min(self.base_cooldown * (2 ** self._overloads), self.max_cooldown)
+            self._overloads += 1
+            self._resume_at = now + cooldown
+            return cooldown
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+  key       TEXT PRIMARY KEY,  -- response_key（model / プロンプト / 画像 / 設定のハッシュ）
+  model     TEXT NOT NULL,
+  text      TEXT NOT NULL,     -- response.text
+  size      INTEGER NOT NULL,  -- text の UTF-8 バイト数（容量の上限判定用）
+  stored_at REAL NOT NULL,
+  used_at   REAL NOT NULL      -- 最後に使った時刻（追い出しは古い順）
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at);
+"""
+
+
+def response_key(model: str, prompt: str, image: Optional[bytes] = None, config: Any = None) -> str:
+    """
+    Gemini への同じリクエストなら同じになるキー
+    （model / プロンプト / 画像のバイト列 / 出力形式などの設定。長さを前置して区切りの曖昧さを無くす）
+    """
+    h = hashlib.blake2b(digest_size=20)
+    for part in (
+        model.encode(),
+        prompt.encode(),
+        image or b"",
+        json.dumps(_config_dict(config), sort_keys=True, ensure_ascii=False, default=str).encode(),
+    ):
+        h.update(len(part).to_bytes(8, "little"))
+        h.update(part)
+    return h.hexdigest()
+
+
+def _config_dict(config: Any) -> Any:
+    if config is None or isinstance(config, dict):
+        return config
+    if hasattr(config, "model_dump"):
+        return config.model_dump(exclude_none=True, mode="json")
+    return {k: v for k, v in vars(config).items() if v is not None}
+
+
+class ResponseCache:
+    """
+    Gemini の応答を SQLite に保存する（キー: response_key）
+
+    途中で止まった / 範囲を変えて再実行したときに、同じリクエストを API に送り直さない。
+    保存量が max_bytes を超えたら、最後に使った時刻が古いものから消す。
+    ファイルは最初に使うときに作る（import しただけでは作らない）
+    """
+
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._total = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT text FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            with conn:
+                conn.execute("UPDATE responses SET used_at = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, model: str, text: str) -> None:
+        size = len(text.encode())
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                old = conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model, text, size, now, now),
+                )
+                self._total += size - (old[0] if old else 0)
+                self.stores += 1
+                if self._total > self.max_bytes:
+                    self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """上限の 9 割まで、使った時刻が古い順に消す（1 件ごとに消すと put のたびに走るため）"""
+        target = self.max_bytes * 0.9
+        rows = conn.execute("SELECT key, size FROM responses ORDER BY used_at").fetchall()
+        drop = []
+        for key, size in rows:
+            if self._total <= target:
+                break
+            drop.append((key,))
+            self._total -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", drop)
+        self.evictions += len(drop)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return {
+                "entries": entries,
+                "bytes": self._total,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from google import genai
+from google.genai import types
+
+from response_cache import ResponseCache, response_key
+
+
+class GeminiSession:
+    """
+    バッチ全体で共有する Gemini 呼び出しの準備物
+
+    - API キー     : Secret Manager から 1 回だけ取得し、key_ttl 秒ごとに取り直す
+    - genai.Client : api_version ごとに 1 つ作って使い回す（内部の HTTP コネクションも再利用される）
+                     キーが変わったときだけ作り直す
+    - 画像         : パスごとに 1 回だけ読み、max_images 件まで保持する
+                     （同じ作品の level 1〜3 / メタデータ生成で読み直さない）
+    - 応答         : cache があれば generate の結果を保存し、同じリクエストは API に送らない
+    複数スレッドから同時に呼んでよい
+    """
+
+    def __init__(
+        self,
+        get_secret: Callable[[], str],
+        key_ttl: float = 3600.0,
+        max_images: int = 64,
+        client_factory: Optional[Callable[..., Any]] = None,
+        cache: Optional[ResponseCache] = None,
+    ):
+        self._get_secret = get_secret
+        self.key_ttl = key_ttl
+        self.max_images = max_images
+        self._client_factory = client_factory or genai.Client
+        self.cache = cache
+
+        self._api_key: Optional[str] = None
+        self._key_expires = 0.0
+        self._clients: Dict[Optional[str], Any] = {}
+        self._images: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._image_lock = threading.Lock()
+
+        self.secret_fetches = 0
+        self.clients_created = 0
+        self.image_reads = 0
+        self.image_hits = 0
+        self.api_calls = 0
+
+    def api_key(self) -> str:
+        with self._lock:
+            return self._api_key_locked()
+
+    def _api_key_locked(self) -> str:
+        now = time.monotonic()
+        if self._api_key is None or now >= self._key_expires:
+            key = self._get_secret()
+            self.secret_fetches += 1
+            if key != self._api_key:
+                # キーが変わったら古いキーで作ったクライアントは使わない
+                self._clients.clear()
+            self._api_key = key
+            self._key_expires = now + self.key_ttl
+        return self._api_key
+
+    def client(self, api_version: Optional[str] = None) -> Any:
+        """api_version（例: "v1alpha"）ごとの genai.Client"""
+        with self._lock:
+            api_key = self._api_key_locked()
+            client = self._clients.get(api_version)
+            if client is None:
+                kwargs: Dict[str, Any] = {"api_key": api_key}
+                if api_version is not None:
+                    kwargs["http_options"] = {"api_version": api_version}
+                client = self._client_factory(**kwargs)
+                self._clients[api_version] = client
+                self.clients_created += 1
+            return client
+
+    def generate(
+        self,
+        model: str,
+        prompt: str,
+        image_bytes: Optional[bytes] = None,
+        api_version: Optional[str] = None,
+        config: Any = None,
+        accept: Optional[Callable[[str], bool]] = None,
+    ) -> str:
+        """
+        プロンプト（+ JPEG 画像）で generate_content を呼び、response.text を返す（例外はそのまま投げる）
+        キャッシュにあれば API は呼ばない。空の応答 / accept が False の応答は保存しない
+        """
+        key = None
+        if self.cache is not None:
+            key = response_key(model, prompt, image_bytes, config)
+            text = self.cache.get(key)
+            if text is not None:
+                return text
+
+        if image_bytes is None:
+            contents: Any = prompt
+        else:
+            contents = [
+                types.Content(
+                    parts=[
+                        types.Part(text=prompt),
+                        types.Part(inline_data=types.Blob(mime_type="image/jpeg", data=image_bytes)),
+                    ]
+                )
+            ]
+        response = self.client(api_version).models.generate_content(model=model, contents=contents, config=config)
+        with self._lock:
+            self.api_calls += 1
+        text = response.text or ""
+
+        if key is not None and text and (accept is None or accept(text)):
+            self.cache.put(key, model, text)
+        return text
+
+    def image_bytes(self, path: str) -> bytes:
+        with self._image_lock:
+            data = self._images.get(path)
+            if data is not None:
+                self._images.move_to_end(path)
+                self.image_hits += 1
+                return data
+        with open(path, "rb") as f:
+            data = f.read()
+        with self._image_lock:
+            self.image_reads += 1
+            self._images[path] = data
+            self._images.move_to_end(path)
+            while len(self._images) > self.max_images:
+                self._images.popitem(last=False)
+        return data
+
+    def forget_image(self, path: str) -> None:
+        """作品の処理が終わったら呼ぶ（呼ばなくても max_images 件を超えた古いものから捨てる）"""
+        with self._image_lock:
+            self._images.pop(path, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "secret_fetches": self.secret_fetches,
+            "clients_created": self.clients_created,
+            "image_reads": self.image_reads,
+            "image_hits": self.image_hits,
+            "api_calls": self.api_calls,
+        }
@@ -0,0 +1,70 @@
+"""
+Gemini の応答キャッシュ（response_cache.ResponseCache）のベンチマーク
+
+FakeGemini に対して同じ範囲を 2 回処理する（2 回目は新しいプロセスと同じく、キャッシュのファイルだけ引き継ぐ）。
+  - 1 回目: 全リクエストが API に行き、応答がキャッシュに入る
+  - 2 回目: API 呼び出し 0 回で、1 回目と同じ explanations.csv になる
+最後に容量の上限を 1 回目の保存量の半分にして同じ範囲を処理し、追い出しで保存量が上限以下に収まることを確認する。
+
+  python bench/bench_cache.py --artworks 40 --latency-ms 1000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from bench_concurrency import make_images, run  # noqa: E402
+from fake_gemini import FakeGemini  # noqa: E402
+from response_cache import ResponseCache  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--artworks", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=1000.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.1)
+    parser.add_argument("--rpm", type=float, default=6000.0)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_cache_")
+    image_dir = os.path.join(tmpdir, "image")
+    cache_path = os.path.join(tmpdir, "gemini_cache.sqlite3")
+    try:
+        make_images(image_dir, args.artworks)
+        print(f"artworks={args.artworks} workers={args.workers} latency={args.latency_ms:.0f}ms")
+        print(f"{'run':<8}{'sec':>8}{'api calls':>11}{'hits':>7}{'misses':>8}{'entries':>9}{'KB':>8}{'evicted':>9}")
+
+        def one(name: str, max_bytes: int):
+            fake = FakeGemini(
+                latency_ms=args.latency_ms, jitter_ms=args.latency_ms * 0.5, malformed_rate=args.malformed_rate
+            )
+            cache = ResponseCache(cache_path, max_bytes=max_bytes)
+            r = run(image_dir, args.workers, fake, args.rpm, combined=True, cache=cache)
+            st = cache.stats()
+            cache.close()
+            print(
+                f"{name:<8}{r.elapsed:>8.2f}{r.calls:>11}{st['hits']:>7}{st['misses']:>8}"
+                f"{st['entries']:>9}{st['bytes'] / 1024:>8.1f}{st['evictions']:>9}"
+            )
+            return r, st
+
+        first, cold = one("cold", 512 * 2**20)
+        second, _ = one("rerun", 512 * 2**20)
+        assert second.calls == 0, "再実行で API が呼ばれた"
+        assert second.content == first.content, "再実行の explanations.csv が 1 回目と異なる"
+
+        os.remove(cache_path)
+        small = cold["bytes"] // 2
+        _, st = one("bounded", small)
+        assert st["evictions"] > 0 and st["bytes"] <= small
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+level 1〜3 をまとめて 1 リクエストで作るモード（COMBINED_LEVELS）のベンチマーク
+
+FakeGemini に対して、level ごとに 3 リクエスト（combined=False）と
+画像 1 回 + JSON 出力（combined=True）で同じ範囲を処理し、リクエスト数・アップロード量・artworks/分 を表示する。
+JSON を壊す / level を欠かす応答を --malformed-rate の割合で混ぜ、欠けた level だけ個別に作り直されること、
+両モードで explanations.csv の行（explanation_id / artwork_id / level など本文以外の列）が一致することを確認する。
+
+  python bench/bench_combined.py --artworks 40 --workers 8 --malformed-rate 0.1
+"""
+import argparse
+import csv
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from bench_concurrency import app_main, make_images, run  # noqa: E402
+from fake_gemini import FakeGemini  # noqa: E402
+
+
+def rows(content: bytes):
+    return list(csv.reader(io.StringIO(content.decode("utf-8-sig"))))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--artworks", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=1000.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.1)
+    parser.add_argument("--rpm", type=float, default=6000.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    image_dir = tempfile.mkdtemp(prefix="bench_combined_img_")
+    try:
+        make_images(image_dir, args.artworks)
+        print(
+            f"artworks={args.artworks} workers={args.workers} latency={args.latency_ms:.0f}ms "
+            f"malformed_rate={args.malformed_rate}"
+        )
+        print(f"{'mode':<10}{'sec':>7}{'artworks/min':>14}{'requests':>10}{'uploaded MB':>13}{'malformed':>11}")
+        results = {}
+        for name, combined in (("per_level", False), ("combined", True)):
+            fake = FakeGemini(
+                latency_ms=args.latency_ms,
+                jitter_ms=args.latency_ms * 0.5,
+                malformed_rate=args.malformed_rate if combined else 0.0,
+                seed=args.seed,
+            )
+            r = run(image_dir, args.workers, fake, args.rpm, combined=combined)
+            results[name] = r
+            print(
+                f"{name:<10}{r.elapsed:>7.1f}{args.artworks / r.elapsed * 60:>14.1f}{r.calls:>10}"
+                f"{r.uploaded_bytes / 2**20:>13.1f}{r.malformed:>11}"
+            )
+
+        per_level, combined = results["per_level"], results["combined"]
+        print(
+            f"requests x{per_level.calls / combined.calls:.2f} fewer, "
+            f"uploaded bytes x{per_level.uploaded_bytes / combined.uploaded_bytes:.2f} fewer"
+        )
+        # 欠けた level の個別生成 = 全リクエスト - JSON 出力のリクエスト
+        assert combined.calls - combined.structured_calls >= combined.malformed
+        levels = len(app_main.LEVEL_PROMPTS)
+        a, b = rows(per_level.content), rows(combined.content)
+        assert len(a) == len(b) == 1 + args.artworks * levels
+        assert [r[:6] for r in a] == [r[:6] for r in b], "行のレイアウト / explanation_id の並びが異なる"
+        assert all(r[6] for r in b[1:]), "本文が空の行がある"
+    finally:
+        shutil.rmtree(image_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
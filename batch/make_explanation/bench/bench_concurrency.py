@@ -0,0 +1,119 @@
+"""
+run_explanations_for_image_id_range_multi_level の並行実行のベンチマーク
+
+FakeGemini（遅延・ServerError を注入）に対して、workers=1（従来どおり 1 件ずつ）と
+workers=N（トークンバケット + 同時実行数の自動調整）で同じ範囲を level ごとのリクエストで処理し、
+artworks/分 と呼び出し数・ServerError 数を表示する。
+両者の explanations.csv が完全に一致すること（書き込み順・explanation_id が完了順に依存しない）も確認する。
+ServerError 時の全体待機（GEMINI_COOLDOWN_SEC）は遅延に合わせて縮めて実行する。
+
+  python bench/bench_concurrency.py --artworks 40 --workers 1 8 16 --latency-ms 1000 --error-rate 0.05 --capacity 12
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "app"))
+sys.path.insert(0, HERE)
+
+import main as app_main  # noqa: E402
+from fake_gemini import FakeGemini  # noqa: E402
+from session import GeminiSession  # noqa: E402
+
+
+def make_images(image_dir: str, n: int, start_id: int = 400000) -> None:
+    os.makedirs(image_dir, exist_ok=True)
+    for i in range(n):
+        with open(os.path.join(image_dir, f"{start_id + i}.jpg"), "wb") as f:
+            f.write(os.urandom(64 * 1024))
+
+
+def run(
+    image_dir: str,
+    workers: int,
+    fake: FakeGemini,
+    rpm: float,
+    combined: bool = False,
+    cache=None,
+    output_csv: str = None,
+) -> SimpleNamespace:
+    """
+    fake を Gemini として image_dir の全作品を処理し、所要時間・出力 CSV・fake の統計を返す
+    output_csv を省略すると一時ディレクトリに書いて消す
+    """
+    app_main.SESSION = GeminiSession(fake.get_api_key, client_factory=fake.client, cache=cache)
+    app_main.GEMINI_COOLDOWN_SEC = fake.latency
+    app_main.GEMINI_MAX_COOLDOWN_SEC = fake.latency * 8
+
+    out_dir = None
+    if output_csv is None:
+        out_dir = tempfile.mkdtemp(prefix="bench_concurrency_out_")
+        output_csv = os.path.join(out_dir, "explanations.csv")
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        app_main.run_explanations_for_image_id_range_multi_level(
+            image_dir=image_dir,
+            start_image_id=0,
+            end_image_id=10**9,
+            output_csv=output_csv,
+            workers=workers,
+            requests_per_minute=rpm,
+            combined=combined,
+        )
+    elapsed = time.perf_counter() - t0
+    with open(output_csv, "rb") as f:
+        content = f.read()
+    if out_dir is not None:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    return SimpleNamespace(elapsed=elapsed, content=content, **fake.stats())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--artworks", type=int, default=40)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8, 16])
+    parser.add_argument("--latency-ms", type=float, default=1000.0)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--capacity", type=int, default=12, help="同時実行数がこれを超えると ServerError")
+    parser.add_argument("--rpm", type=float, default=600.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    image_dir = tempfile.mkdtemp(prefix="bench_concurrency_img_")
+    try:
+        make_images(image_dir, args.artworks)
+        print(
+            f"artworks={args.artworks} levels={len(app_main.LEVEL_PROMPTS)} latency={args.latency_ms:.0f}ms "
+            f"error_rate={args.error_rate} capacity={args.capacity} rpm={args.rpm:.0f}"
+        )
+        print(f"{'workers':>8}{'sec':>9}{'artworks/min':>14}{'calls':>7}{'503':>6}{'max in flight':>15}")
+        baseline = None
+        for workers in args.workers:
+            fake = FakeGemini(
+                latency_ms=args.latency_ms,
+                jitter_ms=args.latency_ms * 0.5,
+                error_rate=args.error_rate,
+                capacity=args.capacity,
+                seed=args.seed,
+            )
+            r = run(image_dir, workers, fake, args.rpm)
+            print(
+                f"{workers:>8}{r.elapsed:>9.1f}{args.artworks / r.elapsed * 60:>14.1f}"
+                f"{r.calls:>7}{r.server_errors:>6}{r.max_in_flight:>15}"
+            )
+            if baseline is None:
+                baseline = r.content
+            assert r.content == baseline, f"workers={workers}: explanations.csv が workers={args.workers[0]} と異なる"
+    finally:
+        shutil.rmtree(image_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
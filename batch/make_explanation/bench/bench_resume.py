@@ -0,0 +1,235 @@
+"""
+explanations.csv のジャーナル（journal.CsvJournal）による再開のベンチマークと kill -9 の検証
+
+1. 再開位置の取得時間: 行数を変えた CSV で、従来の get_next_explanation_id（list(csv.reader(f)) で全行を読む）と
+   ジャーナルを開いて next_explanation_id を引く時間を比べる
+2. kill -9: FakeGemini で run_explanations_for_image_id_range_multi_level を子プロセスで動かし、
+   ランダムなタイミングで SIGKILL → 再開 を繰り返す（途中で CSV の末尾に書きかけの行も足す）。
+   最後まで終わった CSV が、1 度も止めずに作ったものとバイト単位で一致すること
+   （explanation_id の重複・欠番、(artwork_id, level) の重複・欠落が無いこと）を確認する
+3. combined（level 1〜3 をまとめて作るモード）の再開: 全 level 書き込み済みの作品は Gemini に送らず、
+   一部だけ書き込み済みの作品は残りの level だけを作ること、再開後の CSV が止めずに作ったものと
+   本文以外の列で一致することを確認する
+4. 読み取り専用: get_next_explanation_id / get_last_object_id_from_csv が、書きかけの行が残った CSV と
+   そのジャーナル（無い場合も）を変更せずに確定分の値を返すこと
+
+  python bench/bench_resume.py --rows 1000 10000 100000 --artworks 100 --kills 15
+"""
+import argparse
+import csv
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from bench_concurrency import app_main, make_images, run  # noqa: E402
+from fake_gemini import FakeGemini  # noqa: E402
+
+LATENCY_MS = 20.0
+
+
+def legacy_next_explanation_id(csv_path: str, start_id: int = 300000) -> int:
+    """ジャーナル導入前の get_next_explanation_id"""
+    with open(csv_path, newline="", encoding="utf-8-sig") as f:
+        rows = list(csv.reader(f))
+    if len(rows) <= 1:
+        return start_id
+    return int(rows[-1][0]) + 1
+
+
+def bench_lookup(tmpdir: str, n_rows: int) -> None:
+    csv_path = os.path.join(tmpdir, f"explanations_{n_rows}.csv")
+    with open(csv_path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(["explanation_id", "artwork_id", "artwork_name", "artist_name",
+                         "explanation_level", "language", "explanation_content"])
+        for i in range(n_rows):
+            writer.writerow([f"{300000 + i:06d}", f"{400000 + i // 3:06d}", "", "", i % 3 + 1, "jp",
+                             "解説本文の例。\n改行も含む。" * 20])
+
+    t0 = time.perf_counter()
+    expected = legacy_next_explanation_id(csv_path)
+    legacy_ms = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    app_main.explanations_journal(csv_path).close()  # 初回: CSV を 1 回読んでジャーナルを作る
+    bootstrap_ms = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    journal = app_main.explanations_journal(csv_path)
+    next_id = journal.next_explanation_id
+    journal.close()
+    journal_ms = (time.perf_counter() - t0) * 1000
+
+    assert next_id == expected, (next_id, expected)
+    size_mb = os.path.getsize(csv_path) / 2**20
+    print(f"{n_rows:>9}{size_mb:>9.1f}{legacy_ms:>12.1f}{bootstrap_ms:>14.1f}{journal_ms:>12.2f}")
+
+
+def check_combined_resume(tmpdir: str, artworks: int = 6) -> None:
+    image_dir = os.path.join(tmpdir, "combined_image")
+    make_images(image_dir, artworks, start_id=500000)
+    reference = os.path.join(tmpdir, "combined_reference.csv")
+    run(image_dir, 4, FakeGemini(latency_ms=1.0, jitter_ms=0.0), 60000.0, combined=True, output_csv=reference)
+    with open(reference, newline="", encoding="utf-8-sig") as f:
+        expected = list(csv.reader(f))
+
+    # 前回: 先頭の作品の全 level と、次の作品の level 1 まで書いて止まった（ジャーナルは CSV から作る）
+    levels = len(app_main.LEVEL_PROMPTS)
+    output = os.path.join(tmpdir, "combined_resumed.csv")
+    with open(output, "w", newline="", encoding="utf-8-sig") as f:
+        csv.writer(f).writerows(expected[:1 + levels + 1])
+
+    fake = FakeGemini(latency_ms=1.0, jitter_ms=0.0)
+    stats = run(image_dir, 4, fake, 60000.0, combined=True, output_csv=output)
+    with open(output, newline="", encoding="utf-8-sig") as f:
+        actual = list(csv.reader(f))
+
+    remaining = artworks - 2
+    # まとめて作るのは未着手の作品だけ、途中の作品は残り (levels - 1) 件を個別に
+    assert stats.structured_calls == remaining, (stats.calls, stats.structured_calls)
+    assert stats.calls == remaining + levels - 1, (stats.calls, stats.structured_calls)
+    strip = lambda table: [row[:6] for row in table]  # noqa: E731
+    assert strip(actual) == strip(expected), "再開後の CSV の行が止めずに作ったものと一致しない"
+    assert actual[:1 + levels + 1] == expected[:1 + levels + 1], "書き込み済みの行が変わった"
+    print(
+        f"combined resume: {stats.calls} requests ({stats.structured_calls} combined) for "
+        f"{remaining} new + 1 partial artworks, rows identical to uninterrupted run"
+    )
+
+
+def snapshot_files(*paths: str) -> dict:
+    """パスごとの内容（無ければ None）"""
+    out = {}
+    for path in paths:
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                out[path] = f.read()
+        else:
+            out[path] = None
+    return out
+
+
+def check_readonly(tmpdir: str) -> None:
+    csv_path = os.path.join(tmpdir, "readonly.csv")
+    journal = app_main.explanations_journal(csv_path)
+    with open(csv_path, "a", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(["explanation_id", "artwork_id", "artwork_name", "artist_name",
+                         "explanation_level", "language", "explanation_content"])
+        journal.commit_size(f)
+        for i in range(6):
+            writer.writerow([f"{300000 + i:06d}", f"{400000 + i // 3:06d}", "", "", i % 3 + 1, "jp", "本文"])
+            journal.record(f, 400000 + i // 3, i % 3 + 1, 300000 + i)
+    journal.close()
+    # 書き込み側が記録する前の行（書き込み中 / kill 直後）
+    with open(csv_path, "ab") as f:
+        f.write('300006,400002,,,1,jp,"書きかけ'.encode())
+
+    # -wal / -shm は SQLite が読み取り専用の接続でも作るので比べない（確定分は .journal 本体にある）
+    files = (csv_path, f"{csv_path}.journal")
+    before = snapshot_files(*files)
+    assert app_main.get_next_explanation_id(csv_path) == 300006
+    assert app_main.get_last_object_id_from_csv(csv_path) == 400001
+    assert snapshot_files(*files) == before, "読み取りで CSV / ジャーナルが変わった"
+
+    # ジャーナルの無い既存の CSV（導入前の出力）も、ジャーナルを作らずに読む
+    legacy = os.path.join(tmpdir, "legacy.csv")
+    shutil.copyfile(csv_path, legacy)
+    with open(legacy, "rb+") as f:
+        f.truncate(len(before[csv_path]) - len('300006,400002,,,1,jp,"書きかけ'.encode()))
+    assert app_main.get_next_explanation_id(legacy) == 300006
+    assert not os.path.exists(f"{legacy}.journal"), "読み取りでジャーナルが作られた"
+    print("readonly: getters return committed values without touching the CSV or the journal")
+
+
+def child(image_dir: str, output_csv: str) -> None:
+    fake = FakeGemini(latency_ms=LATENCY_MS, jitter_ms=LATENCY_MS / 2)
+    run(image_dir, 4, fake, 60000.0, combined=False, output_csv=output_csv)
+
+
+def check_kill(tmpdir: str, artworks: int, kills: int, seed: int) -> None:
+    image_dir = os.path.join(tmpdir, "image")
+    make_images(image_dir, artworks)
+    script = os.path.abspath(__file__)
+
+    def timed_child(images: str, output_csv: str) -> float:
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, script, "--child", images, output_csv], stdout=subprocess.DEVNULL, check=True)
+        return time.perf_counter() - t0
+
+    # 起動だけの時間（作品 0 件）と、止めずに最後まで動かした時間（= 比較用の CSV）
+    empty_dir = os.path.join(tmpdir, "empty")
+    os.makedirs(empty_dir)
+    startup_sec = timed_child(empty_dir, os.path.join(tmpdir, "empty.csv"))
+    reference = os.path.join(tmpdir, "reference.csv")
+    work_sec = timed_child(image_dir, reference) - startup_sec
+
+    output = os.path.join(tmpdir, "killed.csv")
+    rng = random.Random(seed)
+    cmd = [sys.executable, script, "--child", image_dir, output]
+    killed = torn = 0
+    while True:
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+        try:
+            proc.wait(timeout=startup_sec + rng.uniform(0, work_sec / 5) if killed < kills else None)
+        except subprocess.TimeoutExpired:
+            os.kill(proc.pid, signal.SIGKILL)
+            proc.wait()
+            killed += 1
+            if rng.random() < 0.3 and os.path.exists(output):
+                # ジャーナルに記録される前の書きかけの行を模擬
+                with open(output, "ab") as f:
+                    f.write('399999,400000,,,1,jp,"書きかけ'.encode())
+                torn += 1
+            continue
+        assert proc.returncode == 0, proc.returncode
+        break
+
+    with open(reference, "rb") as f:
+        expected = f.read()
+    with open(output, "rb") as f:
+        actual = f.read()
+    with open(output, newline="", encoding="utf-8-sig") as f:
+        rows = list(csv.reader(f))[1:]
+    ids = [int(r[0]) for r in rows]
+    units = [(r[1], r[4]) for r in rows]
+    assert ids == list(range(300000, 300000 + len(rows))), "explanation_id に重複 / 欠番がある"
+    assert len(set(units)) == len(units) == artworks * len(app_main.LEVEL_PROMPTS), "(artwork_id, level) の重複 / 欠落"
+    assert actual == expected, "止めずに作った CSV と一致しない"
+    print(f"kill -9 x{killed} (torn rows x{torn}): {len(rows)} rows, ids contiguous, identical to uninterrupted run")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3])
+        return
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--artworks", type=int, default=100)
+    parser.add_argument("--kills", type=int, default=15)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_resume_")
+    try:
+        print(f"{'rows':>9}{'MB':>9}{'legacy ms':>12}{'bootstrap ms':>14}{'journal ms':>12}")
+        for n_rows in args.rows:
+            bench_lookup(tmpdir, n_rows)
+        check_kill(tmpdir, args.artworks, args.kills, args.seed)
+        check_combined_resume(tmpdir)
+        check_readonly(tmpdir)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
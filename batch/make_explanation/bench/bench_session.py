@@ -0,0 +1,147 @@
+"""
+GeminiSession（API キー / genai.Client / 画像の使い回し）で減る 1 呼び出しあたりのオーバーヘッド
+
+ローカルの HTTP サーバーを generateContent のエンドポイントとして立て、本物の genai.Client で
+  - before  : 呼び出しごとに get_api_key + genai.Client 作成 + 画像読み込み（従来の main.py）
+  - session : GeminiSession から取得（キー・クライアント・画像は初回のみ）
+を 1 作品 = 3 level + メタデータ 1 回の順で繰り返し、呼び出し全体と準備部分の時間を比べる。
+Secret Manager の往復は --secret-ms で模擬する（実測値に合わせて指定）。
+サーバーは平文 HTTP なので、本番の TLS ハンドシェイク分の差はここには含まれない（削減量の下限）。
+
+  python bench/bench_session.py --artworks 30 --secret-ms 80
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from google import genai
+from google.genai import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "app"))
+
+from session import GeminiSession  # noqa: E402
+
+MODEL = "gemini-3-flash-preview"
+CALLS_PER_ARTWORK = 4  # level 1〜3 + メタデータ
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    connections = set()
+
+    def do_POST(self):
+        self.connections.add(self.client_address)
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps(
+            {"candidates": [{"content": {"role": "model", "parts": [{"text": "ok"}]}, "finishReason": "STOP"}]}
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def generate(client, prompt: str, image_bytes: bytes) -> str:
+    response = client.models.generate_content(
+        model=MODEL,
+        contents=[
+            types.Content(
+                parts=[
+                    types.Part(text=prompt),
+                    types.Part(inline_data=types.Blob(mime_type="image/jpeg", data=image_bytes)),
+                ]
+            )
+        ],
+    )
+    return response.text
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--artworks", type=int, default=30)
+    parser.add_argument("--secret-ms", type=float, default=80.0)
+    parser.add_argument("--image-kb", type=int, default=800)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def get_api_key() -> str:
+        time.sleep(args.secret_ms / 1000)
+        return "bench-key"
+
+    def make_client(api_key: str, http_options=None):
+        options = dict(http_options or {}, base_url=base_url)
+        return genai.Client(api_key=api_key, http_options=options)
+
+    image_dir = tempfile.mkdtemp(prefix="bench_session_")
+    paths = []
+    for i in range(args.artworks):
+        path = os.path.join(image_dir, f"{400000 + i}.jpg")
+        with open(path, "wb") as f:
+            f.write(os.urandom(args.image_kb * 1024))
+        paths.append(path)
+
+    def before(path: str):
+        t0 = time.perf_counter()
+        client = make_client(get_api_key(), {"api_version": "v1alpha"})
+        with open(path, "rb") as f:
+            image_bytes = f.read()
+        t1 = time.perf_counter()
+        generate(client, "prompt", image_bytes)
+        return t1 - t0, time.perf_counter() - t0
+
+    session = GeminiSession(get_api_key, client_factory=make_client)
+
+    def with_session(path: str):
+        t0 = time.perf_counter()
+        client = session.client("v1alpha")
+        image_bytes = session.image_bytes(path)
+        t1 = time.perf_counter()
+        generate(client, "prompt", image_bytes)
+        return t1 - t0, time.perf_counter() - t0
+
+    try:
+        print(
+            f"artworks={args.artworks} calls/artwork={CALLS_PER_ARTWORK} "
+            f"secret={args.secret_ms:.0f}ms image={args.image_kb}KB"
+        )
+        print(f"{'mode':<9}{'setup ms/call':>15}{'total ms/call':>15}{'connections':>13}")
+        results = {}
+        for name, call in (("before", before), ("session", with_session)):
+            _Handler.connections = set()
+            setup, total = [], []
+            for path in paths:
+                for _ in range(CALLS_PER_ARTWORK):
+                    s, t = call(path)
+                    setup.append(s * 1000)
+                    total.append(t * 1000)
+                if name == "session":
+                    session.forget_image(path)
+            results[name] = statistics.mean(total)
+            print(
+                f"{name:<9}{statistics.mean(setup):>15.2f}{statistics.mean(total):>15.2f}"
+                f"{len(_Handler.connections):>13}"
+            )
+        print(f"saved: {results['before'] - results['session']:.2f} ms/call  session={session.stats()}")
+    finally:
+        server.shutdown()
+        shutil.rmtree(image_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
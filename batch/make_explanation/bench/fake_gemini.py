@@ -0,0 +1,141 @@
+"""
+Gemini / Secret Manager を使わずに app/main.py を動かすためのインメモリのスタンドイン
+
+- FakeGemini.client(...) が genai.Client の代わり（client.models.generate_content のみ）
+- 応答は (model, プロンプト, 画像) のハッシュから決まる文字列（同じ入力なら常に同じ）
+  JSON 出力（response_schema）指定時はスキーマの各キーに同じ方法で作った文字列を入れる
+  （malformed_rate の割合で JSON を壊す / キーを 1 つ欠かす）
+- 呼び出しごとに遅延を入れ、一定の割合で / 同時実行数が capacity を超えたら ServerError を投げる
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+from google.genai.errors import ServerError
+
+
+class FakeGemini:
+    def __init__(
+        self,
+        latency_ms: float = 1000.0,
+        jitter_ms: float = 200.0,
+        error_rate: float = 0.0,
+        malformed_rate: float = 0.0,
+        capacity: Optional[int] = None,
+        secret_ms: float = 0.0,
+        seed: int = 0,
+    ):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.capacity = capacity
+        self.secret_latency = secret_ms / 1000
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+        self.calls = 0
+        self.server_errors = 0
+        self.structured_calls = 0
+        self.malformed = 0
+        self.uploaded_bytes = 0
+        self.max_in_flight = 0
+        self.secret_calls = 0
+        self.clients = 0
+
+    def get_api_key(self) -> str:
+        """main.get_api_key の代わり（Secret Manager の往復を secret_ms で模擬）"""
+        with self._lock:
+            self.secret_calls += 1
+        time.sleep(self.secret_latency)
+        return "fake-api-key"
+
+    def client(self, **kwargs: Any) -> SimpleNamespace:
+        """genai.Client の代わり"""
+        with self._lock:
+            self.clients += 1
+        return SimpleNamespace(models=SimpleNamespace(generate_content=self.generate_content))
+
+    def generate_content(self, model: str, contents: Any, config: Any = None) -> SimpleNamespace:
+        prompt, image = _split_contents(contents)
+        with self._lock:
+            self.calls += 1
+            self.uploaded_bytes += len(image)
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+            overloaded = self.capacity is not None and self._in_flight > self.capacity
+            failed = overloaded or self._rng.random() < self.error_rate
+            malformed = self._rng.random() < self.malformed_rate
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+        try:
+            time.sleep(delay if not failed else delay / 10)
+            if failed:
+                with self._lock:
+                    self.server_errors += 1
+                raise ServerError(503, {"error": {"code": 503, "message": "overloaded", "status": "UNAVAILABLE"}})
+            keys = _schema_keys(config)
+            if keys is None:
+                return SimpleNamespace(text=self.answer(model, prompt, image))
+            with self._lock:
+                self.structured_calls += 1
+            data = {key: self.answer(model, f"{prompt}\n{key}", image) for key in keys}
+            if malformed:
+                with self._lock:
+                    self.malformed += 1
+                    broken = self._rng.random() < 0.5
+                    dropped = self._rng.choice(keys)
+                if broken:
+                    return SimpleNamespace(text=json.dumps(data)[:-10])
+                del data[dropped]
+            return SimpleNamespace(text=json.dumps(data, ensure_ascii=False))
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    @staticmethod
+    def answer(model: str, prompt: str, image: bytes) -> str:
+        h = hashlib.blake2b(digest_size=8)
+        for part in (model.encode(), prompt.encode(), image):
+            h.update(part)
+        return f"fake:{h.hexdigest()}"
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "calls": self.calls,
+            "server_errors": self.server_errors,
+            "structured_calls": self.structured_calls,
+            "malformed": self.malformed,
+            "uploaded_bytes": self.uploaded_bytes,
+            "max_in_flight": self.max_in_flight,
+            "secret_calls": self.secret_calls,
+            "clients": self.clients,
+        }
+
+
+def _split_contents(contents: Any):
+    """contents（文字列 / types.Content のリスト）からプロンプトと画像を取り出す"""
+    if isinstance(contents, str):
+        return contents, b""
+    texts, image = [], b""
+    for content in contents:
+        for part in getattr(content, "parts", None) or [content]:
+            if getattr(part, "text", None):
+                texts.append(part.text)
+            blob = getattr(part, "inline_data", None)
+            if blob is not None:
+                image += blob.data
+    return "\n".join(texts), image
+
+
+def _schema_keys(config: Any):
+    """JSON 出力が指定されていればスキーマのキー一覧（指定が無ければ None）"""
+    if config is None or getattr(config, "response_mime_type", None) != "application/json":
+        return None
+    schema = getattr(config, "response_schema", None)
+    properties = schema.get("properties") if isinstance(schema, dict) else getattr(schema, "properties", None)
+    return sorted(properties or {})
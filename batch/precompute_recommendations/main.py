@@ -0,0 +1,113 @@
+"""
+全ユーザーの recommend1 / recommend2 を一括で事前計算し、SQLite のサービングストアに書き出す
+
+- 嗜好は collection_group("preferences") の 1 クエリで全ユーザー分を読む
+- カタログ / explanation_id 対応表は backend と同じモジュールで読み込む
+- recommend2 は users × artworks の行列積でまとめて計算（backend の /recommend2 と同じ結果）
+- 各ユーザーの computed_at は嗜好の読み込み開始時刻
+  （backend はこれより後に preferencesUpdatedAt が更新されたユーザーだけライブ計算する）
+- 各行に計算に使ったカタログ / 解説の対応表のバージョン（data_version）を書く
+  （backend は読み込み中のものと一致しない行を使わない）
+
+  python main.py --output ../../backend/serving.db
+"""
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from google.cloud import bigquery, firestore
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+sys.path.insert(0, BACKEND_DIR)
+
+from cache import preferences_version  # noqa: E402
+from catalog import load_catalog_from_bigquery  # noqa: E402
+from explanations import load_explanation_index  # noqa: E402
+from recommend import CANDIDATE_IDS, DEFAULT_SET_ID, CandidateSet, build_recommend1  # noqa: E402
+from serving import ServingStore, data_version_of  # noqa: E402
+from snapshot import snapshot_version  # noqa: E402
+
+PROJECT_ID = os.getenv("GOOGLE_CLOUD_PROJECT", "avid-invention-470411-u6")
+BQ_ARTWORK_TABLE = "avid-invention-470411-u6.fukuoka.artwork_master"
+BQ_EXPLANATION_TABLE = "avid-invention-470411-u6.murakami_work.explanation_master"
+
+
+def load_all_ratings(db: firestore.Client) -> Dict[str, List[Dict]]:
+    """users/{user_id}/preferences/{artwork_id} を全ユーザー分まとめて読む"""
+    ratings: Dict[str, List[Dict]] = defaultdict(list)
+    for snap in db.collection_group("preferences").select(["score"]).stream():
+        user_ref = snap.reference.parent.parent
+        if user_ref is None or user_ref.parent.id != "users":
+            continue
+
+        score_raw = (snap.to_dict() or {}).get("score", 0)
+        try:
+            score = int(score_raw)
+        except (ValueError, TypeError):
+            score = 0
+        ratings[user_ref.id].append({"artwork_id": str(snap.id), "score": score})
+    return ratings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", default=os.path.join(BACKEND_DIR, "serving.db"))
+    parser.add_argument("--chunk", type=int, default=256)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+
+    bq = bigquery.Client(project=PROJECT_ID)
+    db = firestore.Client(project=PROJECT_ID)
+
+    catalog = load_catalog_from_bigquery(bq, BQ_ARTWORK_TABLE)
+    # backend がスナップショット / BigQuery のどちらから読み込んでも同じ値になる（内容のハッシュ）
+    catalog.version = snapshot_version(catalog)
+    explanations = load_explanation_index(bq, BQ_EXPLANATION_TABLE)
+    recommend1_data = data_version_of(catalog.version, explanations.version)
+    recommend2_data = data_version_of(catalog.version)
+    candidates = CandidateSet(catalog, DEFAULT_SET_ID, CANDIDATE_IDS)
+    print(
+        f"catalog: {len(catalog)} artworks / explanations: {len(explanations)} rows "
+        f"(data_version: {recommend1_data})"
+    )
+
+    computed_at = time.time()
+    all_ratings = load_all_ratings(db)
+    user_ids = sorted(all_ratings)
+    loaded = time.perf_counter()
+    print(f"preferences: {len(user_ids)} users ({loaded - start:.1f}s)")
+
+    store = ServingStore(args.output, readonly=False)
+    written = 0
+    for s in range(0, len(user_ids), args.chunk):
+        chunk = user_ids[s:s + args.chunk]
+        profiles = [catalog.user_profile(all_ratings[u]) for u in chunk]
+        rated = [[r["artwork_id"] for r in all_ratings[u]] for u in chunk]
+        recs2 = catalog.recommend_profiles(profiles, rated)
+
+        rows = []
+        for user_id, profile, r2 in zip(chunk, profiles, recs2):
+            version = preferences_version((r["artwork_id"], r["score"]) for r in all_ratings[user_id])
+            r1 = build_recommend1(catalog, explanations, profile, candidates)
+            payload1 = {"user_id": user_id, "recommendations": r1}
+            payload2 = {"user_id": user_id, "recommendations": r2}
+            rows.append((user_id, "recommend1", computed_at, version, recommend1_data, payload1))
+            rows.append((user_id, "recommend2", computed_at, version, recommend2_data, payload2))
+        written += store.put_many(rows)
+
+    store.close()
+    end = time.perf_counter()
+    scoring = end - loaded
+    print(f"written: {written} rows -> {args.output}")
+    print(
+        f"users/sec (scoring): {len(user_ids) / scoring if scoring > 0 else 0:.1f} / "
+        f"total wall time: {end - start:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
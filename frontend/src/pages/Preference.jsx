@@ -94,6 +94,17 @@ export default function Preference() {
           updatedAt: serverTimestamp(),
         });
       });
+
+      // バックエンドが1回の読み込みで済むよう、同じ内容を1ドキュメントのマップにも保存
+      const preferenceMapDocRef = doc(db, "users", user.uid, "denormalized", "preferences");
+      batch.set(
+        preferenceMapDocRef,
+        {
+          scores: preferences,
+          updatedAt: serverTimestamp(),
+        },
+        { merge: true }
+      );
       
       await batch.commit();
 